@@ -0,0 +1,209 @@
+#!python3
+
+# *********************************************************
+# Script to convert every Run<N>/scope-<M>.bin file of the
+# data box in parallel. Replaces the sequential loops of
+# struct.sh. A manifest of converted sources is kept in the
+# output directory so unchanged inputs are skipped when the
+# script is run again.
+# *********************************************************
+
+# =========================================================
+# Import Modules
+# =========================================================
+import sys
+import os
+import re
+import json
+import time
+import shutil
+import filecmp
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from src.data.convert import convert, scope_name, missing_outputs
+
+# ---------------------------------------------------------
+# Variables.
+# ---------------------------------------------------------
+REPO_PATH         = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_PATH = "/home/hargy/Science/DataBox/Muons_Gesher_Data"
+DEFAULT_LCD_PATH  = os.path.join(REPO_PATH, "lcd")
+MANIFEST_NAME     = "convert_manifest.json"
+HASH_CHUNK        = 1 << 20
+
+# Scope files converted per run, as struct.sh did: both scopes of Run0-16,
+# only scope-1 of Run17-30. Every scope file of other runs is converted.
+RUN_SCOPES = {**{run: 2 for run in range(0, 17)},
+              **{run: 1 for run in range(17, 31)}}
+
+
+# =========================================================
+# Function to hash a source file in fixed size chunks.
+# =========================================================
+def file_hash(path):
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+# =========================================================
+# Functions to read and write the conversion manifest.
+# =========================================================
+def load_manifest(lcd_path):
+    path = os.path.join(lcd_path, MANIFEST_NAME)
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            return json.load(f)
+    return {}
+
+
+def save_manifest(lcd_path, manifest):
+    path = os.path.join(lcd_path, MANIFEST_NAME)
+    tmp  = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+# =========================================================
+# Function to list the (run, source, output dir) jobs. Only
+# scope-1 to scope-<N> of a run are converted, N taken from
+# `scopes` when given, else from RUN_SCOPES.
+# =========================================================
+def find_sources(data_path, lcd_path, runs=None, scopes=None):
+    jobs      = []
+    data_path = os.path.abspath(data_path)
+    for run_dir in sorted(os.listdir(data_path)):
+        match = re.fullmatch(r"Run(\d+)", run_dir)
+        if match is None or (runs is not None and int(match[1]) not in runs):
+            continue
+        src_dir   = os.path.join(data_path, run_dir)
+        out_dir   = os.path.join(lcd_path, run_dir)
+        run_scope = scopes if scopes is not None else RUN_SCOPES.get(int(match[1]))
+        for file in sorted(os.listdir(src_dir)):
+            scope = re.fullmatch(r"scope-(\d+)\.bin", file)
+            if scope is not None and (run_scope is None or int(scope[1]) <= run_scope):
+                jobs.append((run_dir, os.path.join(src_dir, file), out_dir))
+    return jobs
+
+
+# =========================================================
+# Function to decide whether a source needs converting.
+# Size and mtime are checked first; the hash is only
+# computed when they differ from the manifest entry. The
+# files of the previous conversion must still all be in
+# the output directory.
+# =========================================================
+def is_unchanged(entry, bin_path, out_dir, out_format):
+    if entry is None or entry.get("format") != out_format:
+        return False
+    stat = os.stat(bin_path)
+    if entry["size"] != stat.st_size:
+        return False
+    if len(missing_outputs(out_dir, scope_name(bin_path), out_format)) > 0:
+        return False
+    if entry["mtime"] == stat.st_mtime:
+        return True
+    if entry["sha1"] == file_hash(bin_path):
+        entry["mtime"] = stat.st_mtime
+        return True
+    return False
+
+
+# =========================================================
+# Function run by the pool workers: converts one file
+# in-process, without starting a new interpreter per file.
+# =========================================================
+def convert_file(bin_path, out_dir, out_format):
+    t0      = time.perf_counter()
+    summary = convert(bin_path, out_dir, format=out_format)
+    seconds = time.perf_counter() - t0
+
+    stat  = os.stat(bin_path)
+    entry = {"size"     : stat.st_size,
+             "mtime"    : stat.st_mtime,
+             "sha1"     : file_hash(bin_path),
+             "format"   : out_format,
+             "segments" : summary["segments"]}
+    return entry, seconds
+
+
+# =========================================================
+# Function to copy meta.json once per run, when changed.
+# =========================================================
+def copy_meta(data_path, lcd_path, run_dir):
+    src = os.path.join(data_path, run_dir, "meta.json")
+    dst = os.path.join(lcd_path, run_dir, "meta.json")
+    if os.path.exists(src) and not (os.path.exists(dst) and filecmp.cmp(src, dst, shallow=False)):
+        shutil.copy(src, dst)
+
+
+# =========================================================
+# Main Program
+# =========================================================
+def main(argv):
+    parser = argparse.ArgumentParser(description="Convert all run scope files in parallel.")
+    parser.add_argument("data_path", nargs="?", default=DEFAULT_DATA_PATH)
+    parser.add_argument("lcd_path", nargs="?", default=DEFAULT_LCD_PATH)
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count())
+    parser.add_argument("-f", "--format", default="csv", choices=("csv", "npy", "both"))
+    parser.add_argument("-r", "--runs", type=int, nargs="*", default=None)
+    parser.add_argument("-s", "--scopes", type=int, default=None,
+                        help="convert scope-1 to scope-N of every run, instead of the scopes of RUN_SCOPES")
+    parser.add_argument("--force", action="store_true", help="ignore the manifest and convert everything")
+    args = parser.parse_args(argv)
+
+    manifest = {} if args.force else load_manifest(args.lcd_path)
+    jobs     = find_sources(args.data_path, args.lcd_path, args.runs, args.scopes)
+
+    for run_dir in sorted(set(job[0] for job in jobs)):
+        os.makedirs(os.path.join(args.lcd_path, run_dir), exist_ok=True)
+        copy_meta(args.data_path, args.lcd_path, run_dir)
+
+    pending = [job for job in jobs if not is_unchanged(manifest.get(job[1]), job[1], job[2], args.format)]
+    print(f"{len(jobs)} scope files found, {len(jobs) - len(pending)} unchanged, {len(pending)} to convert "
+          f"with {args.workers} workers.")
+
+    results = []
+    t0      = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(convert_file, bin_path, out_dir, args.format): bin_path
+                   for _, bin_path, out_dir in pending}
+        for future in as_completed(futures):
+            bin_path = futures[future]
+            try:
+                entry, seconds = future.result()
+            except Exception as e:
+                print(f"Failed to convert {bin_path}: {e}")
+                continue
+            # Record progress as soon as a file is done so an interrupted
+            # batch resumes where it stopped
+            manifest[bin_path] = entry
+            save_manifest(args.lcd_path, manifest)
+            results.append((bin_path, entry, seconds))
+            print(f"Converted {bin_path}")
+
+    save_manifest(args.lcd_path, manifest)
+    wall = time.perf_counter() - t0
+
+    # ---------------------------------------------------------
+    # Throughput report.
+    # ---------------------------------------------------------
+    if results:
+        print()
+        print(f"{'file':<60s} {'MB':>8s} {'s':>8s} {'MB/s':>8s} {'seg/s':>8s}")
+        for bin_path, entry, seconds in sorted(results):
+            mb = entry["size"] / 1e6
+            print(f"{bin_path[-60:]:<60s} {mb:8.1f} {seconds:8.2f} {mb/seconds:8.2f} {entry['segments']/seconds:8.1f}")
+        total_mb = sum(entry["size"] for _, entry, _ in results) / 1e6
+        total_s  = sum(seconds for _, _, seconds in results)
+        print(f"{'total (summed over workers)':<60s} {total_mb:8.1f} {total_s:8.2f} {total_mb/total_s:8.2f}")
+        print(f"{'total (wall clock)':<60s} {total_mb:8.1f} {wall:8.2f} {total_mb/wall:8.2f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
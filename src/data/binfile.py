@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+import os
+from functools import lru_cache
+import numpy as np
+
+
+""" ============= """
+""" CONFIGURATION """
+""" ============= """
+
+# InfiniiVision binary layout, see bintocsv.py for the field by field reader
+FILE_HEADER_DTYPE = np.dtype([("cookie",           "S2"),
+                              ("file_version",     "S2"),
+                              ("file_size",        "<i4"),
+                              ("waveforms",        "<i4")])
+
+WAVEFORM_HEADER_DTYPE = np.dtype([("header_size",      "<i4"),
+                                  ("waveform_type",    "<i4"),
+                                  ("buffers",          "<i4"),
+                                  ("points",           "<i4"),
+                                  ("count",            "<i4"),
+                                  ("x_display_range",  "<f4"),
+                                  ("x_display_origin", "<f8"),
+                                  ("x_increment",      "<f8"),
+                                  ("x_origin",         "<f8"),
+                                  ("x_units",          "<i4"),
+                                  ("y_units",          "<i4"),
+                                  ("date",             "S16"),
+                                  ("time",             "S16"),
+                                  ("frame",            "S24"),
+                                  ("label",            "S16"),
+                                  ("time_tag",         "<f8"),
+                                  ("segment",          "<u4")])
+
+DATA_HEADER_DTYPE = np.dtype([("header_size",     "<i4"),
+                              ("buffer_type",     "<i2"),
+                              ("bytes_per_point", "<i2"),
+                              ("buffer_size",     "<i4")])
+
+# One record per (waveform, buffer) found in the file
+BUFFER_DTYPE = np.dtype([("segment",         "<u4"),
+                         ("label",           "S24"),
+                         ("buffer_type",     "<i2"),
+                         ("bytes_per_point", "<i2"),
+                         ("offset",          "<i8"),
+                         ("buffer_size",     "<i4"),
+                         ("time_tag",        "<f8"),
+                         ("x_origin",        "<f8"),
+                         ("x_increment",     "<f8")])
+
+# Label suffixes bintocsv.py gives to peak detect buffers
+BUFFER_LABEL_SUFFIX = {2: "_PkMax", 3: "_PkMin"}
+
+# numpy dtype of each buffer type
+BUFFER_TYPE_DTYPE = {1: "<f4", 2: "<f4", 3: "<f4", 4: "<f4", 5: "<f4", 6: "u1"}
+
+""" ============ """
+
+
+def scan(bin_path):
+    """
+    Reads the file header and every waveform and data header of an
+    InfiniiVision binary file, skipping over the sample buffers.
+
+    Args:
+        bin_path (str) : path to scope-N.bin
+
+    Returns:
+        records (ndarray) : BUFFER_DTYPE array with the byte offset of each buffer
+    """
+    records = []
+    with open(bin_path, "rb") as f:
+        file_header = np.frombuffer(f.read(FILE_HEADER_DTYPE.itemsize), dtype=FILE_HEADER_DTYPE)[0]
+
+        for _ in range(file_header["waveforms"]):
+            start  = f.tell()
+            header = np.frombuffer(f.read(WAVEFORM_HEADER_DTYPE.itemsize), dtype=WAVEFORM_HEADER_DTYPE)[0]
+            f.seek(start + header["header_size"])
+
+            label = header["label"].rstrip(b"\0")
+            for _ in range(header["buffers"]):
+                start       = f.tell()
+                data_header = np.frombuffer(f.read(DATA_HEADER_DTYPE.itemsize), dtype=DATA_HEADER_DTYPE)[0]
+                offset      = start + data_header["header_size"]
+                buffer_type = int(data_header["buffer_type"])
+                suffix      = BUFFER_LABEL_SUFFIX.get(buffer_type, "").encode("utf-8")
+
+                records.append((header["segment"], label + suffix, buffer_type,
+                                data_header["bytes_per_point"], offset, data_header["buffer_size"],
+                                header["time_tag"], header["x_origin"], header["x_increment"]))
+
+                f.seek(offset + data_header["buffer_size"])
+
+    return np.array(records, dtype=BUFFER_DTYPE)
+
+
+class BinFile:
+    """
+    Zero-copy access to the sample buffers of a raw scope binary file. The
+    headers are scanned once, after which every (segment, channel) buffer is
+    a view into a single read-only memory map of the file, so no conversion
+    step is needed and the OS page cache does the buffering.
+    """
+    def __init__(self, bin_path):
+        self.bin_path = bin_path
+        self.dirpath  = os.path.dirname(bin_path)
+        self.records  = scan(bin_path)
+        self.memmap   = np.memmap(bin_path, dtype=np.uint8, mode="r")
+        self.rows     = {(rec["label"].decode("utf-8"), int(rec["segment"])): row
+                         for row, rec in enumerate(self.records)}
+
+
+    def get_buffer(self, channel, segment):
+        """
+        Args:
+            channel (str) : channel label (e.g. '1', or '1_PkMax')
+            segment (int) : segment index as recorded by the scope
+
+        Returns:
+            buffer (np.memmap) : read-only view of the samples in the file
+        """
+        rec    = self.records[self.rows[(channel, segment)]]
+        offset = int(rec["offset"])
+        buffer = self.memmap[offset:offset + int(rec["buffer_size"])]
+        return buffer.view(BUFFER_TYPE_DTYPE[int(rec["buffer_type"])])
+
+
+    def get_samples(self, channel, segment):
+        """
+        Returns:
+            y, x_origin, x_increment (np.memmap, float, float) : voltages in Volts and the
+                                                                 time base in seconds
+        """
+        rec = self.records[self.rows[(channel, segment)]]
+        y   = self.get_buffer(channel, segment)
+        return y, float(rec["x_origin"]), float(rec["x_increment"])
+
+
+    def get_waveform(self, channel, segment):
+        """
+        Returns:
+            x, y (ndarray, np.memmap) : time axis in seconds and voltages in Volts
+        """
+        y, x_origin, x_increment = self.get_samples(channel, segment)
+        x = x_origin + np.arange(len(y)) * x_increment
+        return x, y
+
+
+    def get_timestamps(self, channel="1"):
+        """
+        Returns:
+            timestamps (ndarray) : time tag of segment k at position k-1
+        """
+        records = self.records[self.records["label"] == channel.encode("utf-8")]
+        order   = np.argsort(records["segment"], kind="stable")
+        return records["time_tag"][order]
+
+
+@lru_cache(maxsize=64)
+def open_binfile(dirpath, scope):
+    """
+    Returns a shared BinFile for dirpath/<scope>.bin, or None if it does not exist.
+    """
+    bin_path = os.path.join(dirpath, f"{scope}.bin")
+    if os.path.exists(bin_path):
+        return BinFile(bin_path)
+    return None
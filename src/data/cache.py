@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from src.data.store import WaveStore, store_paths, parse_csv_name
+from src.data.binfile import BinFile
+
+
+""" ============= """
+""" CONFIGURATION """
+""" ============= """
+
+# Size cap of the cache directory, least recently used entries are evicted beyond it
+DEFAULT_CACHE_BYTES = 1 << 30
+
+# Bumped whenever the entry layout or the processing it caches changes,
+# so that entries written by an older version are never matched
+CACHE_VERSION = 1
+
+# Every entry is one float64 array: [baseline, x_origin, x_increment, y...]
+ENTRY_HEADER = 3
+
+# Processes sharing a cache directory only see each other's entries when
+# they list it. Each one lists it again once it wrote this fraction of the
+# cap since its last listing, so that N processes overshoot the cap by at
+# most N / RESCAN_FRACTION of it before the oldest entries are evicted.
+RESCAN_FRACTION = 16
+
+""" ============ """
+
+
+def source_identity(waveform):
+    """
+    Identifies the file the samples of a waveform are read from, by its path,
+    size and modification time, so that entries go stale when the data is
+    reconverted.
+
+    Args:
+        waveform (WaveForm) : waveform that was not loaded from its csv yet
+
+    Returns:
+        identity (tuple) : (path, size, mtime_ns, name of the waveform)
+    """
+    store = waveform.store
+    if isinstance(store, WaveStore):
+        _, _, channel = parse_csv_name(waveform.csvfile)
+        path, _       = store_paths(store.dirpath, store.scope, channel)
+    elif isinstance(store, BinFile):
+        path = store.bin_path
+    else:
+        path = waveform.csvfile
+
+    stat = os.stat(path)
+    return (os.path.realpath(path), stat.st_size, stat.st_mtime_ns, os.path.basename(waveform.csvfile))
+
+
+def processing_params(waveform):
+    """
+    Returns:
+        params (tuple) : every configured processing parameter of a waveform, the
+                         baseline bin edges by their digest
+    """
+    baseline = None
+    if waveform.baseline_params is not None:
+        bins, p0, mode = waveform.baseline_params
+        baseline = (hashlib.sha1(np.ascontiguousarray(bins).tobytes()).hexdigest(),
+                    tuple(float(p) for p in p0), mode)
+    return (tuple(float(s) for s in waveform.scale), waveform.sigma, baseline, waveform.zeroed)
+
+
+class WaveformCache:
+    """
+    Persistent on-disk cache of processed waveforms. An entry is keyed by the
+    identity of the source file and the processing parameters, so that a
+    second pass over a run with the same settings reads the processed samples
+    back instead of loading and processing them again. The directory is kept
+    under a size cap by evicting the least recently used entries.
+    It pays off on csv runs and with the Gaussian baseline fit; a store run with
+    a closed-form baseline is about as fast to process again as to read back.
+    """
+    def __init__(self, cache_dir, max_bytes=DEFAULT_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.entries   = OrderedDict()   # key -> size in bytes, least recently used first
+        self.size      = 0
+        self.unscanned = None   # bytes written since the directory was last listed, None before
+        self.hits      = 0
+        self.misses    = 0
+        self.lock      = threading.Lock()   # guards the index, entries are read and written outside it
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+
+    """ ================== """
+    """ Processing Methods """
+    """ ================== """
+
+    def scan(self):
+        """
+        Builds the LRU index of the entries on disk, written by this or any
+        other process, ordered by their last access (the modification time
+        is bumped on every hit). Called with the lock held.
+        """
+        found = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".npy") and entry.is_file():
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    # Evicted by another process since the listing
+                    continue
+                found.append((stat.st_mtime_ns, entry.name[:-4], stat.st_size))
+        found.sort()
+
+        self.entries   = OrderedDict((key, size) for _, key, size in found)
+        self.size      = sum(self.entries.values())
+        self.unscanned = 0
+
+
+    def ensure_scanned(self):
+        """ Lists the directory on first use. Called with the lock held. """
+        if self.unscanned is None:
+            self.scan()
+
+
+    def refresh(self):
+        """
+        Lists the directory again, after other processes (e.g. the workers of
+        Run.process_segments_parallel) wrote entries.
+        """
+        with self.lock:
+            self.scan()
+
+
+    def make_key(self, waveform):
+        identity = (CACHE_VERSION, source_identity(waveform), processing_params(waveform))
+        return hashlib.sha1(repr(identity).encode("utf-8")).hexdigest()
+
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+
+    def fetch(self, waveform):
+        """
+        Sets the processed data of a configured waveform from the cache, or
+        evaluates its stages and stores the result when it is not cached.
+
+        Args:
+            waveform (WaveForm) : waveform with its processing configured, not
+                                  evaluated yet
+
+        Returns:
+            hit (bool) : True if the processed data was read from the cache
+        """
+        try:
+            key = self.make_key(waveform)
+        except (OSError, ValueError):
+            # Unknown source, nothing to key the entry on
+            with self.lock:
+                self.misses += 1
+            return False
+
+        with self.lock:
+            self.ensure_scanned()
+            cached = key in self.entries
+
+        entry = self.read(key) if cached else None
+        if entry is not None:
+            baseline, x_origin, x_increment = entry[:ENTRY_HEADER]
+            waveform.set_time_base(float(x_origin), float(x_increment))
+            waveform.set_processed_data(entry[ENTRY_HEADER:], None if np.isnan(baseline) else float(baseline))
+            with self.lock:
+                self.hits += 1
+            return True
+
+        with self.lock:
+            self.misses += 1
+        _, y = waveform.evaluate()
+        if y is not None:
+            baseline = np.nan if waveform.baseline is None else waveform.baseline
+            self.write(key, np.concatenate(([baseline, waveform.x_origin, waveform.x_increment], y)))
+        return False
+
+
+    def read(self, key):
+        path = self.entry_path(key)
+        try:
+            entry = np.load(path)
+            os.utime(path)
+        except (OSError, ValueError):
+            # Removed or truncated behind our back
+            with self.lock:
+                self.size -= self.entries.pop(key, 0)
+            return None
+
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+        return entry
+
+
+    def write(self, key, entry):
+        """
+        Writes an entry atomically, then evicts the least recently used
+        entries until the cache is within its size cap again. The size is
+        taken from a new listing of the directory when this process may
+        have missed the entries of others (see RESCAN_FRACTION).
+        """
+        path = self.entry_path(key)
+        tmp  = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, entry.astype(np.float64, copy=False))
+        os.replace(tmp, path)
+
+        size = os.path.getsize(path)
+        with self.lock:
+            self.ensure_scanned()
+            self.size         += size - self.entries.pop(key, 0)
+            self.entries[key]  = size
+            self.unscanned    += size
+            if self.unscanned * RESCAN_FRACTION >= self.max_bytes:
+                self.scan()
+            self.evict()
+
+
+    def evict(self):
+        """ Called with the lock held. """
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            key, size = self.entries.popitem(last=False)
+            self.size -= size
+            try:
+                os.remove(self.entry_path(key))
+            except FileNotFoundError:
+                pass
+
+
+    def clear(self):
+        with self.lock:
+            self.scan()
+            for key in list(self.entries):
+                try:
+                    os.remove(self.entry_path(key))
+                except FileNotFoundError:
+                    pass
+            self.entries.clear()
+            self.size = 0
+
+
+    """ =========== """
+    """ Get Methods """
+    """ =========== """
+
+    def get_stats(self):
+        """
+        Returns:
+            stats (dict) : hits and misses since the cache was opened, and the
+                           number and total size of the entries on disk
+        """
+        with self.lock:
+            self.ensure_scanned()
+            return {"hits"    : self.hits,
+                    "misses"  : self.misses,
+                    "entries" : len(self.entries),
+                    "bytes"   : self.size}
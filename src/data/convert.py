@@ -0,0 +1,499 @@
+#!/usr/bin/env python3
+
+# *********************************************************
+# Importable converter of InfiniiVision oscilloscope binary
+# files to CSV waveform files and/or the columnar store.
+# bintocsv.py is the command line wrapper around convert().
+# *********************************************************
+
+import os
+import re
+import struct
+import numpy as np
+
+from src.data.store import ChannelWriter, store_paths, open_store
+from src.data.index import write_index, load_index, index_path
+from src.data.manifest import update_manifest
+from src.data.binfile import BUFFER_LABEL_SUFFIX, BUFFER_TYPE_DTYPE, scan
+
+
+""" ============= """
+""" CONFIGURATION """
+""" ============= """
+
+waveform_type_dict = {
+    0 : "Unknown",
+    1 : "Normal",
+    2 : "Peak Detect",
+    3 : "Average",
+    4 : "Horizontal Histogram",
+    5 : "Vertical Histogram",
+    6 : "Logic",
+}
+buffer_type_dict = {
+    0 : "Unknown data",
+    1 : "Normal 32-bit float data",
+    2 : "Maximum float data",
+    3 : "Minimum float data",
+    4 : "Time float data",
+    5 : "Counts 32-bit float data",
+    6 : "Digital unsigned 8-bit character data",
+}
+units_dict = {
+    0 : "Unknown",
+    1 : "Volts",
+    2 : "Seconds",
+    3 : "Constant",
+    4 : "Amps",
+    5 : "dB",
+    6 : "Hz",
+}
+
+FORMATS = ("csv", "npy", "both")
+
+# One csv row of a float buffer: time and voltage
+FLOAT_ROW_FORMAT = "%E, %f\n"
+
+# Samples decoded per block. The read buffer is allocated once per
+# conversion and reused for every block, and csv output is written through
+# a large file buffer, so memory use stays bounded however long the
+# segments are.
+CHUNK_POINTS = 1 << 16
+WRITE_BUFFER = 1 << 20
+
+# The ", b7, b6, ..., b0\n" tail of a digital csv row for every byte value,
+# from a (256 x 8) bit matrix unpacked MSB first in one np.unpackbits call.
+digital_bits     = np.unpackbits(np.arange(256, dtype=np.uint8)[:, np.newaxis], axis=1)
+digital_row_tail = np.array(["".join(", %d" % bit for bit in bits) + "\n" for bits in digital_bits], dtype=object)
+
+""" ============ """
+
+
+def format_float_rows(times, voltages):
+    """
+    Formats a block of float samples as legacy '%E, %f' csv rows with a
+    single string formatting call over the whole block, instead of one
+    format and one write per sample.
+
+    Args:
+        times (ndarray)    : time axis in seconds
+        voltages (ndarray) : samples in Volts
+
+    Returns:
+        rows (str)
+    """
+    values = np.column_stack((times, voltages.astype(float))).ravel().tolist()
+    return (FLOAT_ROW_FORMAT * len(times)) % tuple(values)
+
+
+def scope_name(bin_path):
+    """ 'path/to/scope-1.bin' -> 'scope-1' """
+    return re.sub(r"\.bin$", "", bin_path.split('/')[-1])
+
+
+def output_names(out_dir, scope, format="csv"):
+    """
+    Lists the files a conversion of a scope file wrote, from its segment
+    header index.
+
+    Args:
+        out_dir (str) : directory the scope file was converted to
+        scope (str)   : scope file name without extension
+        format (str)  : "csv", "npy" or "both"
+
+    Returns:
+        names (set) : file names in out_dir, only the index when it is missing
+    """
+    names = {os.path.basename(index_path(out_dir, scope)), f"{scope}_info.txt"}
+    index = load_index(out_dir, scope)
+    if index is None:
+        return names
+
+    for segment, label, buffer_type in zip(index["segment"], index["label"], index["buffer_type"]):
+        label = label.decode("utf-8")
+        if buffer_type in (1, 2, 3) and format in ("npy", "both"):
+            names.update(os.path.basename(path) for path in store_paths(out_dir, scope, label))
+        if buffer_type in (1, 2, 3, 6) and format in ("csv", "both"):
+            if segment == 0:
+                names.add(f"{scope}-ch{label}.csv")
+            else:
+                names.add(f"{scope}-seg{segment}-ch{label}.csv")
+    return names
+
+
+def missing_outputs(out_dir, scope, format="csv"):
+    """
+    Returns:
+        names (list) : files of a conversion (see output_names) that are not in out_dir
+    """
+    if not os.path.isdir(out_dir):
+        return [os.path.basename(index_path(out_dir, scope))]
+    return sorted(output_names(out_dir, scope, format) - set(os.listdir(out_dir)))
+
+
+def iter_waveforms(bin_path):
+    """
+    Iterates over every waveform buffer of a scope binary file.
+
+    Args:
+        bin_path (str) : path to scope-N.bin
+
+    Yields:
+        record, data (np.record, ndarray) : the typed header record of the buffer
+                                            (see binfile.BUFFER_DTYPE) and its samples,
+                                            float32 Volts or uint8 digital bytes
+    """
+    records = scan(bin_path)
+    with open(bin_path, "rb") as f:
+        for record in records.view(np.recarray):
+            dtype = np.dtype(BUFFER_TYPE_DTYPE.get(int(record.buffer_type), "u1"))
+            f.seek(int(record.offset))
+            data  = np.fromfile(f, dtype=dtype, count=int(record.buffer_size) // dtype.itemsize)
+            yield record, data
+
+
+def convert(bin_path, out_dir, format="csv"):
+    """
+    Converts one scope binary file. Always writes <scope>_info.txt and the
+    <scope>_index.npy segment header index to out_dir, plus the waveforms as
+    per-segment csv files ("csv"), the columnar store ("npy") or both. The
+    store holds float channels only, so digital channels are skipped with
+    "npy".
+
+    Args:
+        bin_path (str) : path to scope-N.bin
+        out_dir (str)  : directory to save to
+        format (str)   : "csv", "npy" or "both"
+
+    Returns:
+        summary (dict) : number of waveforms and segments, and bytes read
+    """
+    if format not in FORMATS:
+        raise ValueError(f"Unknown output format '{format}', expected one of {FORMATS}.")
+    return Converter(bin_path, out_dir, format).run()
+
+
+class Converter:
+    """
+    State of one conversion: the open input and info files, the reusable
+    read buffer, the store writers and the index records.
+    """
+    def __init__(self, bin_path, out_dir, out_format="csv"):
+        self.bin_path        = bin_path
+        self.out_dir         = out_dir
+        self.out_format      = out_format
+        self.read_buffer     = bytearray(CHUNK_POINTS * 4)
+        self.store_writers   = {}
+        self.index_records   = []
+        self.segments        = set()
+        self.skipped_digital = set()
+        self.bin_input       = None
+        self.msg             = None
+
+
+    # =========================================================
+    # Function to place an output file derived from the input
+    # file name in the output directory.
+    # =========================================================
+    def split_to_loc(self, pattern, replacement):
+        file = re.sub(pattern, replacement, self.bin_path).split('/')[-1]
+        return f'{self.out_dir}/{file}'
+
+
+    def csv_path(self, label, segment_index):
+        if segment_index == 0:
+            return self.split_to_loc(r"\.bin", "-ch%s.csv" % label)
+        return self.split_to_loc(r"\.bin", "-seg%d-ch%s.csv" % (segment_index, label))
+
+
+    # =========================================================
+    # Function to print and save output information.
+    # =========================================================
+    def prtsv(self, string, on=False):
+        self.msg.write("%s\n" % string)
+        if on == True:
+            print(string)
+
+
+    # =========================================================
+    # Function to read the next block of a buffer into the
+    # reusable read buffer.
+    # =========================================================
+    def read_block(self, nbytes):
+        count = self.bin_input.readinto(memoryview(self.read_buffer)[:nbytes])
+        if count != nbytes:
+            # The rest of the read buffer holds the previous block
+            raise ValueError("Truncated buffer in %s: %d of %d bytes read at offset %d"
+                             % (self.bin_path, count, nbytes, self.bin_input.tell()))
+        return self.read_buffer
+
+
+    # =========================================================
+    # Function to read 8-bit digital data from the binary data
+    # file.
+    # =========================================================
+    def read_8bit_digital_data(self, buffer_size, x_origin, x_increment, label, segment_index):
+        csv_output_file = self.csv_path(label, segment_index)
+        csv = open(csv_output_file, "w", buffering=WRITE_BUFFER)
+
+        # Decode a whole block of bytes at once: the bits of every sample are
+        # looked up in the unpacked bit table with one fancy index, and each row
+        # is its time (formatted as '%s' was) followed by that tail.
+        for start in range(0, buffer_size, CHUNK_POINTS):
+            count = min(CHUNK_POINTS, buffer_size - start)
+            digital_data = np.frombuffer(self.read_block(count), dtype=np.uint8, count=count)
+
+            times = x_origin + (np.arange(start, start + count) * x_increment)
+            tails = digital_row_tail[digital_data]
+            csv.write("".join(map(str.__add__, map(str, times.tolist()), tails.tolist())))
+
+        csv.close()
+        self.prtsv("CSV waveform data saved to: %s" % csv_output_file)
+
+
+    # =========================================================
+    # Function to read 32-bit float data from the binary data
+    # file.
+    # =========================================================
+    def read_32bit_float_data(self, buffer_size, bytes_per_point, x_origin, x_increment, label, segment_index, time_tags):
+        points = int(buffer_size / bytes_per_point)
+
+        writer = self.store_writers.get(label)
+        if writer is not None:
+            writer.start_segment(segment_index, time_tags, x_origin, x_increment, points)
+
+        csv = None
+        if self.out_format in ("csv", "both"):
+            csv_output_file = self.csv_path(label, segment_index)
+            csv = open(csv_output_file, "w", buffering=WRITE_BUFFER)
+
+        # Decode the buffer block by block with one np.frombuffer call per block
+        # instead of one struct.unpack per sample, and build the matching part
+        # of the time axis in one shot.
+        for start in range(0, points, CHUNK_POINTS):
+            count = min(CHUNK_POINTS, points - start)
+            voltages = np.frombuffer(self.read_block(count * bytes_per_point), dtype='<f4', count=count)
+
+            if writer is not None:
+                writer.write(voltages)
+
+            if csv is not None:
+                times = x_origin + (np.arange(start, start + count) * x_increment)
+                csv.write(format_float_rows(times, voltages))
+
+        if writer is not None:
+            writer.end_segment()
+
+        if csv is not None:
+            csv.close()
+            self.prtsv("CSV waveform data saved to: %s" % csv_output_file)
+
+
+    # =========================================================
+    # Functions to open one streaming store writer per float
+    # channel, sized from a scan of the file headers, and to
+    # close them at the end.
+    # =========================================================
+    def open_store_writers(self):
+        layout = scan(self.bin_path)
+        layout = layout[np.isin(layout["buffer_type"], (1, 2, 3))]
+        for label in np.unique(layout["label"]):
+            buffers = layout[layout["label"] == label]
+            points  = int(np.max(buffers["buffer_size"] // buffers["bytes_per_point"]))
+            label   = label.decode("utf-8")
+            self.store_writers[label] = ChannelWriter(self.out_dir, scope_name(self.bin_path), label, len(buffers), points)
+
+
+    def close_store_writers(self):
+        writers, self.store_writers = self.store_writers, {}
+        for writer in writers.values():
+            data_path = writer.close()
+            self.prtsv("Columnar waveform data saved to: %s" % data_path)
+
+
+    def discard_store_writers(self):
+        writers, self.store_writers = self.store_writers, {}
+        for writer in writers.values():
+            writer.discard()
+
+
+    # =========================================================
+    # Function to print data from individual waveforms in binary
+    # data file.
+    # =========================================================
+    def read_waveform_data(self, x_origin, x_increment, label, segment_index, time_tags):
+        bin_input = self.bin_input
+        prtsv     = self.prtsv
+
+        prtsv("---------- Waveform Data Header ----------")
+
+        (waveform_data_header_size,) = struct.unpack('i', bin_input.read(4))
+        prtsv("Waveform Data Header Size = '%d'" % waveform_data_header_size)
+
+        (buffer_type,) = struct.unpack('h', bin_input.read(2))
+        if buffer_type in buffer_type_dict:
+            prtsv("Buffer Type = '%s'" % buffer_type_dict[buffer_type])
+        else:
+            prtsv("Buffer Type (unknown) = '%d'" % buffer_type)
+            raise ValueError("Unknown buffer type %d in %s" % (buffer_type, self.bin_path))
+
+        (bytes_per_point,) = struct.unpack('h', bin_input.read(2))
+        prtsv("Bytes Per Point = '%s'" % bytes_per_point)
+
+        (buffer_size,) = struct.unpack('i', bin_input.read(4))
+        prtsv("Buffer Size = '%d'" % buffer_size)
+
+        index_label = label + BUFFER_LABEL_SUFFIX.get(buffer_type, "")
+        self.index_records.append((segment_index, index_label, buffer_type, time_tags, x_origin, x_increment,
+                                   int(buffer_size / bytes_per_point)))
+
+        if buffer_type == 1:   # Normal 32-bit float data.
+            self.read_32bit_float_data(buffer_size, bytes_per_point, x_origin, x_increment, label, segment_index, time_tags)
+        elif buffer_type == 2:   # Maximum float data.
+            label = label + "_PkMax"
+            self.read_32bit_float_data(buffer_size, bytes_per_point, x_origin, x_increment, label, segment_index, time_tags)
+        elif buffer_type == 3:   # Minimum float data.
+            label = label + "_PkMin"
+            self.read_32bit_float_data(buffer_size, bytes_per_point, x_origin, x_increment, label, segment_index, time_tags)
+        elif buffer_type == 6 and self.out_format in ("csv", "both"):   # Digital unsigned 8-bit char data.
+            self.read_8bit_digital_data(buffer_size, x_origin, x_increment, label, segment_index)
+        elif buffer_type == 6:
+            # The store only holds float channels: digital data is csv only
+            self.skipped_digital.add(label)
+            bin_input.seek(buffer_size, os.SEEK_CUR)
+        else:
+            bin_input.seek(buffer_size, os.SEEK_CUR)
+
+
+    # =========================================================
+    # Function to print data from individual waveforms in binary
+    # data file.
+    # =========================================================
+    def read_waveform(self):
+        bin_input = self.bin_input
+        prtsv     = self.prtsv
+
+        prtsv("---------- Waveform Header ----------")
+
+        (waveform_header_size,) = struct.unpack('i', bin_input.read(4))
+        prtsv("Waveform Header Size = '%d'" % waveform_header_size)
+
+        (waveform_type,) = struct.unpack('i', bin_input.read(4))
+        if waveform_type in waveform_type_dict:
+            prtsv("Waveform Type = '%s'" % waveform_type_dict[waveform_type])
+        else:
+            prtsv("Waveform Type (unknown) = '%d'" % waveform_type)
+            raise ValueError("Unknown waveform type %d in %s" % (waveform_type, self.bin_path))
+
+        (waveform_buffers,) = struct.unpack('i', bin_input.read(4))
+        prtsv("Number of Waveform buffers = '%d'" % waveform_buffers)
+
+        (points,) = struct.unpack('i', bin_input.read(4))
+        prtsv("Points = '%d'" % points)
+
+        (count,) = struct.unpack('i', bin_input.read(4))
+        prtsv("Count = '%d'" % count)
+
+        (x_display_range,) = struct.unpack('f', bin_input.read(4))
+        prtsv("X Display Range = '%E'" % x_display_range)
+
+        (x_display_origin,) = struct.unpack('d', bin_input.read(8))
+        prtsv("X Display Origin = '%E'" % x_display_origin)
+
+        (x_increment,) = struct.unpack('d', bin_input.read(8))
+        prtsv("X Increment = '%E'" % x_increment)
+
+        (x_origin,) = struct.unpack('d', bin_input.read(8))
+        prtsv("X Origin = '%E'" % x_origin)
+
+        (x_units,) = struct.unpack('i', bin_input.read(4))
+        if x_units in units_dict:
+            prtsv("X Units = '%s'" % units_dict[x_units])
+        else:
+            prtsv("X Units = '%d'" % x_units)
+
+        (y_units,) = struct.unpack('i', bin_input.read(4))
+        if x_units in units_dict:
+            prtsv("Y Units = '%s'" % units_dict[y_units])
+        else:
+            prtsv("Y Units = '%d'" % y_units)
+
+        (date,) = struct.unpack('16s', bin_input.read(16))
+        prtsv("Date = '%s'" % date.decode("utf-8"))
+
+        (time,) = struct.unpack('16s', bin_input.read(16))
+        prtsv("Time = '%s'" % time.decode("utf-8"))
+
+        (frame,) = struct.unpack('24s', bin_input.read(24))
+        prtsv("Frame = '%s'" % frame.decode("utf-8"))
+
+        (waveform_label,) = struct.unpack('16s', bin_input.read(16))
+        label = waveform_label.decode("utf-8").rstrip(chr(0))
+        prtsv("Waveform Label = '%s'" % label)
+
+        (time_tags,) = struct.unpack('d', bin_input.read(8))
+        prtsv("Time Tags = '%E'" % time_tags)
+
+        (segment_index,) = struct.unpack('I', bin_input.read(4))
+        prtsv("Segment Index = '%d'" % segment_index)
+
+        self.segments.add(segment_index)
+        for i in range(waveform_buffers):
+            self.read_waveform_data(x_origin, x_increment, label, segment_index, time_tags)
+
+
+    # =========================================================
+    # Main conversion.
+    # =========================================================
+    def run(self):
+        self.msg       = open(self.split_to_loc(r"\.bin", "_info.txt"), "w")
+        self.bin_input = open(self.bin_path, "rb")
+
+        try:
+            prtsv = self.prtsv
+            prtsv("---------- File Header ----------")
+
+            (cookie,) = struct.unpack('2s', self.bin_input.read(2))
+            prtsv("Cookie = '%s'" % cookie.decode("utf-8"))
+
+            (file_version,) = struct.unpack('2s', self.bin_input.read(2))
+            prtsv("File version = '%s'" % file_version.decode("utf-8"))
+
+            (file_size,) = struct.unpack('i', self.bin_input.read(4))
+            prtsv("File size = '%d'" % file_size)
+
+            (waveforms,) = struct.unpack('i', self.bin_input.read(4))
+            prtsv("Number of Waveforms = '%d'" % waveforms)
+
+            if self.out_format in ("npy", "both"):
+                self.open_store_writers()
+
+            for i in range(waveforms):
+                self.read_waveform()
+
+            self.close_store_writers()
+
+            if len(self.skipped_digital) > 0:
+                prtsv("Digital channels %s of %s not converted: format '%s' does not write csv files."
+                      % (", ".join(sorted(self.skipped_digital)), self.bin_path, self.out_format), on=True)
+
+            # Save the segment header index
+            index_output_file = write_index(self.out_dir, scope_name(self.bin_path), self.index_records)
+            prtsv("Segment header index saved to: %s" % index_output_file)
+
+            # Record the segments and channels of this scope file in the run manifest,
+            # without the digital channels that were not converted
+            records = [rec for rec in self.index_records if not (rec[2] == 6 and len(self.skipped_digital) > 0)]
+            manifest_output_file = update_manifest(self.out_dir, scope_name(self.bin_path), records)
+            prtsv("Run manifest saved to: %s" % manifest_output_file)
+
+            return {"waveforms" : waveforms,
+                    "segments"  : len(self.segments),
+                    "bytes"     : self.bin_input.tell()}
+
+        finally:
+            self.discard_store_writers()
+            self.bin_input.close()
+            self.msg.close()
+            # Stores opened in this process before the conversion are stale
+            open_store.cache_clear()
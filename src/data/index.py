@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+import os
+import numpy as np
+
+
+""" ============= """
+""" CONFIGURATION """
+""" ============= """
+
+# One record per waveform buffer of a scope file, in file order
+INDEX_DTYPE = np.dtype([("segment",     "<u4"),
+                        ("label",       "S24"),
+                        ("buffer_type", "<i2"),
+                        ("time_tag",    "<f8"),
+                        ("x_origin",    "<f8"),
+                        ("x_increment", "<f8"),
+                        ("points",      "<i4")])
+
+""" ============ """
+
+
+def index_path(dirpath, scope):
+    """
+    Returns the path of the segment header index of a scope file.
+
+    Args:
+        dirpath (str) : directory the scope file was converted to
+        scope (str)   : scope file name without extension (e.g. 'scope-1')
+    """
+    return os.path.join(dirpath, f"{scope}_index.npy")
+
+
+def write_index(dirpath, scope, records):
+    """
+    Args:
+        dirpath (str)  : output directory
+        scope (str)    : scope file name without extension
+        records (list) : (segment, label, buffer_type, time_tag, x_origin,
+                          x_increment, points) tuples in file order
+
+    Returns:
+        path (str)
+    """
+    path = index_path(dirpath, scope)
+    np.save(path, np.array(records, dtype=INDEX_DTYPE))
+    return path
+
+
+def load_index(dirpath, scope):
+    """
+    Loads the typed header index of a scope file in one call.
+
+    Returns:
+        index (ndarray) : INDEX_DTYPE array, or None if the file was converted
+                          without an index
+    """
+    path = index_path(dirpath, scope)
+    if os.path.exists(path):
+        return np.load(path)
+    return None
+
+
+def get_time_tags(index):
+    """
+    Returns the time tags of every segment, in seconds and at full float64
+    precision, taken from the first channel recorded in the file.
+
+    Args:
+        index (ndarray) : INDEX_DTYPE array
+
+    Returns:
+        time_tags (ndarray) : time tag of segment k at position k-1
+    """
+    first = index[index["label"] == index["label"][0]]
+    order = np.argsort(first["segment"], kind="stable")
+    return first["time_tag"][order]
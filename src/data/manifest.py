@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import json
+import fcntl
+from contextlib import contextmanager
+from functools import lru_cache
+
+from src.data.store import CSV_NAME_PATTERN, store_paths
+from src.data.index import load_index
+from src.data.binfile import scan
+
+
+""" ============= """
+""" CONFIGURATION """
+""" ============= """
+
+MANIFEST_NAME    = "manifest.json"
+MANIFEST_VERSION = 2
+
+# Held by every writer of the manifest, e.g. the conversions of the scope
+# files of a run running in parallel
+LOCK_NAME = "manifest.json.lock"
+
+INDEX_NAME_PATTERN = re.compile(r"(?P<scope>scope-\d+)_index\.npy$")
+BIN_NAME_PATTERN   = re.compile(r"(?P<scope>scope-\d+)\.bin$")
+
+""" ============ """
+
+
+def manifest_path(dirpath):
+    return os.path.join(dirpath, MANIFEST_NAME)
+
+
+@contextmanager
+def manifest_lock(dirpath):
+    """ Exclusive lock on the manifest of a run directory, across processes. """
+    with open(os.path.join(dirpath, LOCK_NAME), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def scope_entry(present, corrupt, segments=None):
+    """
+    Args:
+        present (dict)  : channel label -> set of segments recorded
+        corrupt (dict)  : channel label -> set of segments that are unreadable
+        segments (int)  : last segment of the scope file, by default the last
+                          one present
+
+    Returns:
+        entry (dict) : the manifest entry of one scope file, missing segments
+                       counted from 1 up to its last segment
+    """
+    if segments is None:
+        segments = max((max(s) for s in present.values() if len(s) > 0), default=0)
+    expected = set(range(1, segments + 1))
+    channels = sorted(present)
+    return {"segments" : segments,
+            "channels" : channels,
+            "missing"  : {ch: sorted(expected - present[ch]) for ch in channels},
+            "corrupt"  : {ch: sorted(corrupt.get(ch, ())) for ch in channels}}
+
+
+def records_by_channel(segments, labels, points):
+    """
+    Groups segment header records (see index.INDEX_DTYPE) by channel.
+
+    Returns:
+        present, corrupt (dict, dict) : channel label -> set of segments recorded, and
+                                        of those without samples
+    """
+    present, corrupt = {}, {}
+    for segment, label, n in zip(segments, labels, points):
+        label = label.decode("utf-8") if isinstance(label, bytes) else str(label)
+        if int(segment) == 0:
+            continue
+        present.setdefault(label, set()).add(int(segment))
+        if int(n) <= 0:
+            corrupt.setdefault(label, set()).add(int(segment))
+    return present, corrupt
+
+
+def scope_entry_from_records(segments, labels, points):
+    """
+    Builds the manifest entry of a scope file from its segment header records
+    (see index.INDEX_DTYPE): a record without samples is corrupt.
+    """
+    return scope_entry(*records_by_channel(segments, labels, points))
+
+
+def scope_entry_from_csv(index, present, corrupt):
+    """
+    Builds the manifest entry of a scope file read from per-segment csv
+    files: the segments and channels of its index (when there is one) that
+    have no csv file are missing, and empty csv files are corrupt.
+
+    Args:
+        index (ndarray) : INDEX_DTYPE array, or None
+        present (dict)  : channel label -> set of segments with a csv file
+        corrupt (dict)  : channel label -> set of segments with an empty csv file
+    """
+    if index is None:
+        return scope_entry(present, corrupt)
+
+    recorded, unreadable = records_by_channel(index["segment"], index["label"], index["points"])
+    segments = max((max(s) for s in recorded.values() if len(s) > 0), default=0)
+    present  = {ch: recorded[ch] & present.get(ch, set()) for ch in recorded}
+    corrupt  = {ch: unreadable.get(ch, set()) | corrupt.get(ch, set()) for ch in recorded}
+    return scope_entry(present, corrupt, segments)
+
+
+def make_manifest(scopes, source):
+    return {"version"  : MANIFEST_VERSION,
+            "source"   : source,
+            "segments" : max((entry["segments"] for entry in scopes.values()), default=0),
+            "scopes"   : scopes}
+
+
+def scan_run(dirpath):
+    """
+    Builds the manifest of a run directory with a single listing, from the
+    source each scope file is read from (see store.open_store): the channels
+    of the columnar store recorded in its segment header index, else the raw
+    scope file, else the per-segment csv files (see scope_entry_from_csv).
+
+    Args:
+        dirpath (str) : run directory (e.g. lcd/Run5)
+
+    Returns:
+        manifest (dict)
+    """
+    present, corrupt, indexed, binaries, names = {}, {}, [], [], set()
+    with os.scandir(dirpath) as entries:
+        for entry in entries:
+            names.add(entry.name)
+            match = INDEX_NAME_PATTERN.match(entry.name)
+            if match is not None:
+                indexed.append(match["scope"])
+                continue
+
+            match = BIN_NAME_PATTERN.match(entry.name)
+            if match is not None:
+                binaries.append(match["scope"])
+                continue
+
+            match = CSV_NAME_PATTERN.match(entry.name)
+            if match is None:
+                continue
+            scope, segment, channel = match["scope"], int(match["segment"]), match["channel"]
+            present.setdefault(scope, {}).setdefault(channel, set()).add(segment)
+            if entry.stat().st_size == 0:
+                corrupt.setdefault(scope, {}).setdefault(channel, set()).add(segment)
+
+    def in_store(scope, channel):
+        return all(os.path.basename(path) in names for path in store_paths(dirpath, scope, channel))
+
+    scopes = {}
+    for scope in sorted(set(present) | set(indexed) | set(binaries)):
+        index = load_index(dirpath, scope) if scope in indexed else None
+        if index is not None and in_store(scope, "1"):
+            stored        = [in_store(scope, label.decode("utf-8")) for label in index["label"]]
+            index         = index[stored]
+            scopes[scope] = scope_entry_from_records(index["segment"], index["label"], index["points"])
+        elif scope in binaries:
+            records       = scan(os.path.join(dirpath, f"{scope}.bin"))
+            scopes[scope] = scope_entry_from_records(records["segment"], records["label"],
+                                                     records["buffer_size"] // records["bytes_per_point"])
+        else:
+            scopes[scope] = scope_entry_from_csv(index, present.get(scope, {}), corrupt.get(scope, {}))
+
+    return make_manifest(scopes, "index" if len(indexed) > 0 else "listing")
+
+
+def read_manifest(dirpath):
+    """
+    Returns:
+        manifest (dict) : manifest.json of a run directory, None if there is none
+                          or it was written by another version
+    """
+    path = manifest_path(dirpath)
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            manifest = json.load(f)
+        if manifest.get("version") == MANIFEST_VERSION:
+            return manifest
+    return None
+
+
+def write_manifest(dirpath, manifest):
+    """ Writes the manifest atomically, so readers never see a partial file. """
+    path = manifest_path(dirpath)
+    tmp  = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, path)
+    get_manifest.cache_clear()
+    return path
+
+
+def update_manifest(dirpath, scope, records):
+    """
+    Sets the entry of one converted scope file in the manifest of its output
+    directory, keeping those of the other scope files of the run. The read
+    and the write hold the manifest lock, so that the scope files of a run
+    can be converted in parallel.
+
+    Args:
+        dirpath (str)  : output directory of the conversion
+        scope (str)    : scope file name without extension
+        records (list) : (segment, label, buffer_type, time_tag, x_origin,
+                          x_increment, points) tuples, as for index.write_index
+
+    Returns:
+        path (str)
+    """
+    segments = [rec[0] for rec in records]
+    labels   = [rec[1] for rec in records]
+    points   = [rec[6] for rec in records]
+
+    with manifest_lock(dirpath):
+        manifest = read_manifest(dirpath)
+        if manifest is None:
+            # Entries of the other scope files, as written by an older version
+            manifest = scan_run(dirpath)
+
+        scopes        = manifest["scopes"]
+        scopes[scope] = scope_entry_from_records(segments, labels, points)
+        return write_manifest(dirpath, make_manifest(scopes, "conversion"))
+
+
+class RunManifest:
+    """
+    What a run directory holds: the number of segments, the channels of
+    every scope file and its missing and corrupt segments. It is read from
+    the manifest.json written at conversion, or built once from the
+    directory (see scan_run) and saved there for the next time.
+    """
+    def __init__(self, manifest):
+        self.manifest = manifest
+        self.scopes   = manifest["scopes"]
+
+
+    def get_segment_number(self):
+        """
+        Returns:
+            segments (int) : highest segment number recorded in the run
+        """
+        return int(self.manifest["segments"])
+
+
+    def get_channels(self, segment):
+        """
+        Returns:
+            channels (list) : (scope, channel) pairs recorded and readable for a segment
+        """
+        channels = []
+        for scope, entry in self.scopes.items():
+            for channel in entry["channels"]:
+                if segment > entry["segments"] or segment in entry["missing"][channel] or segment in entry["corrupt"][channel]:
+                    continue
+                channels.append((scope, channel))
+        return channels
+
+
+    def get_missing_segments(self):
+        """
+        Returns:
+            segments (list) : segments lacking at least one channel of the run
+        """
+        segments = self.get_segment_number()
+        missing  = set()
+        for entry in self.scopes.values():
+            for channel in entry["channels"]:
+                missing.update(entry["missing"][channel])
+            missing.update(range(entry["segments"] + 1, segments + 1))
+        return sorted(missing)
+
+
+    def get_corrupt_segments(self):
+        """
+        Returns:
+            segments (list) : segments with at least one unreadable channel
+        """
+        corrupt = set()
+        for entry in self.scopes.values():
+            for segments in entry["corrupt"].values():
+                corrupt.update(segments)
+        return sorted(corrupt)
+
+
+@lru_cache(maxsize=64)
+def get_manifest(dirpath):
+    """
+    Returns the RunManifest of a run directory: a single small file read
+    when it has a manifest.json, else built from the directory once and
+    saved (when the directory is writable).
+    """
+    manifest = read_manifest(dirpath)
+    if manifest is not None:
+        return RunManifest(manifest)
+
+    try:
+        with manifest_lock(dirpath):
+            # Unless a conversion wrote it in the meantime
+            manifest = read_manifest(dirpath)
+            if manifest is None:
+                manifest = scan_run(dirpath)
+                write_manifest(dirpath, manifest)
+    except OSError:
+        manifest = scan_run(dirpath)
+    return RunManifest(manifest)
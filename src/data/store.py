@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+
+import os
+import re
+from functools import lru_cache
+import numpy as np
+
+from src.data.binfile import open_binfile
+
+
+""" ============= """
+""" CONFIGURATION """
+""" ============= """
+
+# One record per segment, stored alongside every channel array
+HEADER_DTYPE = np.dtype([("segment",     "<u4"),
+                         ("time_tag",    "<f8"),
+                         ("x_origin",    "<f8"),
+                         ("x_increment", "<f8"),
+                         ("points",      "<i4")])
+
+CSV_NAME_PATTERN = re.compile(r"(?P<scope>scope-\d+)-seg(?P<segment>\d+)-ch(?P<channel>\w+)\.csv$")
+
+""" ============ """
+
+
+def store_paths(dirpath, scope, channel):
+    """
+    Returns the paths of the data and header arrays of one channel.
+
+    Args:
+        dirpath (str)  : directory holding the store (e.g. lcd/Run5)
+        scope (str)    : scope file name without extension (e.g. 'scope-1')
+        channel (str)  : channel label (e.g. '1')
+
+    Returns:
+        data_path, header_path (str, str)
+    """
+    data_path   = os.path.join(dirpath, f"{scope}-ch{channel}.npy")
+    header_path = os.path.join(dirpath, f"{scope}-ch{channel}_header.npy")
+    return data_path, header_path
+
+
+def parse_csv_name(csvfile):
+    """
+    Splits a per-segment csv file name into its store coordinates.
+
+    Args:
+        csvfile (str) : path such as '.../scope-1-seg17-ch2.csv'
+
+    Returns:
+        scope, segment, channel (str, int, str)
+    """
+    match = CSV_NAME_PATTERN.search(csvfile)
+    if match is None:
+        raise ValueError(f"{csvfile} is not a segmented waveform file name.")
+    return match["scope"], int(match["segment"]), match["channel"]
+
+
+class ChannelWriter:
+    """
+    Streams one channel of a scope file into the store as a (segments x
+    samples) float32 .npy matrix. Rows are appended to the file as they are
+    decoded, so memory use does not grow with the size of the capture.
+    Segments shorter than the longest one are padded with NaN; the true
+    length is kept in header['points'].
+    Both arrays are written to temporary files that replace the previous
+    ones on close, so a store another process has memory-mapped is never
+    truncated under it.
+    """
+    def __init__(self, dirpath, scope, channel, segments, points):
+        """
+        Args:
+            dirpath (str)  : output directory
+            scope (str)    : scope file name without extension
+            channel (str)  : channel label
+            segments (int) : number of segments of this channel in the file
+            points (int)   : samples of the longest segment
+        """
+        self.data_path, self.header_path = store_paths(dirpath, scope, channel)
+        self.segments = segments
+        self.points   = points
+        self.header   = np.empty(segments, dtype=HEADER_DTYPE)
+        self.rows     = 0
+        self.written  = 0
+        self.tmp_path = f"{self.data_path}.{os.getpid()}.tmp"
+
+        self.file = open(self.tmp_path, "wb")
+        np.lib.format.write_array_header_1_0(self.file, {"descr"         : "<f4",
+                                                         "fortran_order" : False,
+                                                         "shape"         : (segments, points)})
+
+
+    def start_segment(self, segment, time_tag, x_origin, x_increment, points):
+        self.header[self.rows] = (segment, time_tag, x_origin, x_increment, points)
+        self.written           = 0
+
+
+    def write(self, y):
+        """ Appends a block of samples to the current segment. """
+        self.file.write(memoryview(np.ascontiguousarray(y, dtype="<f4")))
+        self.written += len(y)
+
+
+    def end_segment(self):
+        if self.written < self.points:
+            self.file.write(np.full(self.points - self.written, np.nan, dtype="<f4").tobytes())
+        self.rows += 1
+
+
+    def close(self):
+        # Rows announced in the array header but never written stay NaN
+        for _ in range(self.segments - self.rows):
+            self.file.write(np.full(self.points, np.nan, dtype="<f4").tobytes())
+        self.file.close()
+
+        header_tmp = f"{self.header_path}.{os.getpid()}.tmp"
+        with open(header_tmp, "wb") as f:
+            np.save(f, self.header[:self.rows])
+        os.replace(self.tmp_path, self.data_path)
+        os.replace(header_tmp, self.header_path)
+        return self.data_path
+
+
+    def discard(self):
+        """ Drops a store that could not be written completely, leaving the previous one. """
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class WaveStore:
+    """
+    Columnar waveform store of one scope file: every channel is held in a
+    single (segments x samples) float32 array that is memory-mapped on
+    first use, so single waveforms can be read without parsing any csv.
+    """
+    def __init__(self, dirpath, scope):
+        self.dirpath  = dirpath
+        self.scope    = scope
+        self.data     = {}
+        self.headers  = {}
+        self.rows     = {}
+
+
+    def has_channel(self, channel):
+        data_path, header_path = store_paths(self.dirpath, self.scope, channel)
+        return os.path.exists(data_path) and os.path.exists(header_path)
+
+
+    def load_channel(self, channel):
+        if channel not in self.data:
+            data_path, header_path = store_paths(self.dirpath, self.scope, channel)
+            self.data[channel]    = np.load(data_path, mmap_mode="r")
+            self.headers[channel] = np.load(header_path)
+            self.rows[channel]    = {int(s): row for row, s in enumerate(self.headers[channel]["segment"])}
+        return self.data[channel], self.headers[channel]
+
+
+    def get_matrix(self, channel):
+        """
+        Returns the (segments x samples) matrix and header array of a channel.
+        """
+        return self.load_channel(channel)
+
+
+    def get_samples(self, channel, segment):
+        """
+        Args:
+            channel (str) : channel label
+            segment (int) : segment index as recorded by the scope (1-based)
+
+        Returns:
+            y, x_origin, x_increment (ndarray, float, float) : float32 view of the voltages
+                                                               in Volts, and the time base
+                                                               in seconds
+        """
+        data, header = self.load_channel(channel)
+        row          = self.rows[channel][segment]
+        rec          = header[row]
+
+        y = data[row, :rec["points"]]
+        return y, float(rec["x_origin"]), float(rec["x_increment"])
+
+
+    def get_waveform(self, channel, segment):
+        """
+        Returns:
+            x, y (ndarray, ndarray) : time axis in seconds and voltages in Volts
+        """
+        y, x_origin, x_increment = self.get_samples(channel, segment)
+        x = x_origin + np.arange(len(y)) * x_increment
+        return x, y
+
+
+    def get_timestamps(self, channel="1"):
+        _, header = self.load_channel(channel)
+        return header["time_tag"]
+
+
+@lru_cache(maxsize=64)
+def open_store(dirpath, scope):
+    """
+    Returns a shared WaveStore for a scope file in dirpath. When there is no
+    converted store but the raw <scope>.bin is in dirpath, a memory-mapped
+    BinFile is returned instead, which has the same get_samples/get_waveform
+    interface.
+    Returns None when neither exists (e.g. it was converted to csv only).
+    """
+    store = WaveStore(dirpath, scope)
+    if store.has_channel("1"):
+        return store
+    return open_binfile(dirpath, scope)
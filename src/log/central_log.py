@@ -1,28 +1,119 @@
 #!/usr/bin/env python3
 
+# *********************************************************
+# Central logger of the package. Its level and destination
+# are read from the environment on import, and can be
+# changed at any time with configure():
+#
+#   MUONS_LOG_LEVEL : DEBUG, INFO, WARNING, ERROR (default)
+#                     or CRITICAL
+#   MUONS_LOG_FILE  : log file path (default src/log/log.log),
+#                     '-' for stderr or 'none' to disable
+#
+# The file is appended to, and only opened once a record
+# is actually written.
+# *********************************************************
+
+import os
+import sys
 import logging
+import logging.handlers
+import multiprocessing
+from contextlib import contextmanager
+
+
+""" ============= """
+""" CONFIGURATION """
+""" ============= """
+
+LOG_FORMAT          = "%(asctime)s %(message)s"
+DEFAULT_LEVEL       = "ERROR"
+DEFAULT_DESTINATION = os.path.join(os.path.dirname(os.path.abspath(__file__)), "log.log")
+
+""" ============ """
+
+
+# Logger of the package, kept off the root logger so that importing a module
+# does not reconfigure the logging of the application using it
+logger = logging.getLogger("muons")
+logger.propagate = False
+
+
+def make_handler(destination, filemode="a"):
+    if destination in (False, "") or str(destination).lower() == "none":
+        return logging.NullHandler()
+
+    if destination == "-":
+        handler = logging.StreamHandler(sys.stderr)
+    else:
+        handler = logging.FileHandler(destination, mode=filemode, delay=True)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    return handler
+
+
+def set_handler(handler):
+    for old in logger.handlers[:]:
+        logger.removeHandler(old)
+        old.close()
+    logger.addHandler(handler)
+
+
+def configure(level=None, destination=None, filemode="a"):
+    """
+    Sets the level and destination of the logger.
+
+    Args:
+        level (str or int)  : logging level, MUONS_LOG_LEVEL or ERROR if None
+        destination (str)   : log file path, '-' for stderr, 'none' or False to
+                              disable, MUONS_LOG_FILE or src/log/log.log if None
+        filemode (str)      : 'a' to append to the log file, 'w' to truncate it
+
+    Returns:
+        logger (logging.Logger)
+    """
+    if level is None:
+        level = os.environ.get("MUONS_LOG_LEVEL", DEFAULT_LEVEL)
+    if destination is None:
+        destination = os.environ.get("MUONS_LOG_FILE", DEFAULT_DESTINATION)
+
+    set_handler(make_handler(destination, filemode))
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    return logger
+
+
+@contextmanager
+def log_queue():
+    """
+    Collects the records of parallel worker processes on a queue, which a
+    single listener thread of this process writes through the configured
+    handler. Pass the queue and level to configure_worker, e.g. as the
+    initializer of a process pool:
+
+        with log_queue() as queue:
+            with ProcessPoolExecutor(initializer=configure_worker,
+                                     initargs=(queue, logger.level)) as pool:
+                ...
+
+    Yields:
+        queue (multiprocessing.Queue)
+    """
+    queue    = multiprocessing.Queue(-1)
+    listener = logging.handlers.QueueListener(queue, *logger.handlers)
+    listener.start()
+    try:
+        yield queue
+    finally:
+        listener.stop()
+        queue.close()
+
+
+def configure_worker(queue, level):
+    """
+    Routes every record of a worker process to the queue of log_queue,
+    instead of having each worker write the log file.
+    """
+    set_handler(logging.handlers.QueueHandler(queue))
+    logger.setLevel(level)
+
 
-# Reset logging configuration
-for handler in logging.root.handlers[:]:
-    logging.root.removeHandler(handler)
-
-# Create and configure logger
-logging.basicConfig(filename = "/home/hargy/Science/Projects/sci-muons_gesher_v2/src/log/log.log",
-                    format   = "%(asctime)s %(message)s",
-                    filemode = "w"
-    )
-
-# Create logging object
-logger = logging.getLogger()
-
-# Setting threshold of logger to DEBUG
-logger.setLevel(logging.ERROR)
-
-# Test message
-"""
-logger.debug("Harmless debug Message")
-logger.info("Just an information")
-logger.warning("Its a Warning")
-logger.error("Did you try to divide by zero")
-logger.critical("Internet is down")
-"""
\ No newline at end of file
+configure()
@@ -0,0 +1,548 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import logging
+from pathlib import Path
+import numpy as np
+from scipy.optimize import curve_fit
+from scipy.ndimage import gaussian_filter1d
+import warnings
+
+# Ignore warnings
+warnings.filterwarnings("ignore")
+
+# Add src directory to system path
+project_path = Path.cwd().parent
+sys.path.append(str(project_path))
+
+# Import local modules
+try:
+    from src.log.central_log import logger
+    logger.debug("Imported centralised logger module.")
+except ImportError as e:
+    print("Failed to import logger.")
+    print(e)
+
+try:
+    from src.models.waveform import (WaveForm,
+                                     BASELINE_MODES,
+                                     DEFAULT_BASELINE_MODE,
+                                     DEFAULT_BASELINE_BINS,
+                                     DEFAULT_BASELINE_P0,
+                                     DEFAULT_BASELINE_TRIM,
+                                     DEFAULT_SMOOTH_SIGMA,
+                                     DEFAULT_WIDTH,
+                                     DEFAULT_DISTANCE,
+                                     DEFAULT_PROMINENCE,
+                                     find_peaks_stable,
+                                     time_axis,
+                                     time_to_index)
+    logger.debug("Imported models.waveform module.")
+except ImportError as e:
+    logger.warning("Failed to import models.waveform module: %s", e)
+
+try:
+    from src.utils.functions import gaussian
+    logger.debug("Imported utils.gaussian module.")
+except ImportError as e:
+    logger.warning("Failed utils.gaussian module: %s", e)
+
+try:
+    from src.data.store import WaveStore, open_store
+    logger.debug("Imported data.store module.")
+except ImportError as e:
+    logger.warning("Failed to import data.store module: %s", e)
+
+
+""" ============= """
+""" CONFIGURATION """
+""" ============= """
+
+# (scope, channel) of every waveform of an event, in the layout of
+# Event.waveform_matrix: one [left, right] pair per plate
+PLATE_CHANNELS = [[(1, "1"), (1, "2")],
+                  [(1, "3"), (1, "4")],
+                  [(2, "1"), (2, "2")],
+                  [(2, "3"), (2, "4")]]
+
+""" ============ """
+
+
+def batch_histogram(Y, bins):
+    """
+    Histograms every row of a matrix at once, with the same bin assignment as
+    np.histogram(row, bins): bins are closed on the left, the last one is also
+    closed on the right and samples outside the edges (or NaN) are dropped.
+
+    Args:
+        Y (ndarray)    : (rows x samples) matrix
+        bins (ndarray) : monotonically increasing bin edges
+
+    Returns:
+        hist (ndarray) : (rows x bins-1) integer counts
+    """
+    nbins = len(bins) - 1
+    idx   = np.searchsorted(bins, Y, side="right") - 1
+    idx[Y == bins[-1]] = nbins - 1
+
+    inside = (idx >= 0) & (idx < nbins)
+    rows   = np.broadcast_to(np.arange(Y.shape[0])[:, None], Y.shape)
+    flat   = rows[inside] * nbins + idx[inside]
+    return np.bincount(flat, minlength=Y.shape[0] * nbins).reshape(Y.shape[0], nbins)
+
+
+def trimmed_median(P, trim=DEFAULT_BASELINE_TRIM):
+    """
+    Row-wise median after trimming samples further than `trim` robust sigmas
+    (1.4826 * MAD) from the row median, as in WaveForm.pretrigger_median_baseline.
+
+    Args:
+        P (ndarray)  : (rows x samples) matrix
+        trim (float) : outlier cut in units of 1.4826 * MAD
+
+    Returns:
+        medians (ndarray) : one value per row
+    """
+    median = np.median(P, axis=1)
+    dev    = np.abs(P - median[:, None])
+    sigma  = 1.4826 * np.median(dev, axis=1)
+
+    medians = median.copy()
+    for row in np.flatnonzero(sigma != 0):
+        kept = P[row][dev[row] <= trim * sigma[row]]
+        medians[row] = np.median(kept)
+    return medians
+
+
+def find_first_peaks(roi,
+                     height,
+                     width      = DEFAULT_WIDTH,
+                     distance   = DEFAULT_DISTANCE,
+                     prominence = DEFAULT_PROMINENCE):
+    """
+    First peak of every row of an ROI matrix, with one find_peaks_stable
+    call for all rows. The rows are laid end to end with +inf separators at
+    least `distance` samples wide: the separators bound the prominence and
+    width searches exactly like the ends of a single ROI slice would, and
+    they are dropped by the height upper bound before the distance filter,
+    which then never compares peaks of different rows. As that filter breaks
+    ties between equal peaks by position, not by the order of the whole
+    array, the result per row is the same as WaveForm.detect_main_peak on
+    that row.
+
+    Args:
+        roi (ndarray)      : (rows x samples) matrix of ROI slices
+        height (float)     : minimum peak height
+        width (float)      : minimum peak width in samples
+        distance (float)   : minimum distance between peaks in samples
+        prominence (float) : minimum peak prominence
+
+    Returns:
+        peak_idx (ndarray) : index of the first peak of each row within the ROI,
+                             -1 where there is none
+    """
+    rows, n = roi.shape
+    stride  = n + max(int(np.ceil(distance)), 1)
+
+    laid = np.full((rows, stride), np.inf)
+    laid[:, :n] = roi
+
+    peaks = find_peaks_stable(laid.ravel(),
+                              height     = (height, np.finfo(float).max),
+                              width      = width,
+                              distance   = distance,
+                              prominence = prominence)
+
+    peak_idx = np.full(rows, -1, dtype=np.int64)
+    row, first = np.unique(peaks // stride, return_index=True)
+    peak_idx[row] = peaks[first] % stride
+    return peak_idx
+
+
+def find_ingress(roi, peak_idx, threshold):
+    """
+    First sample of every row at or above the threshold before the row's
+    peak, as in WaveForm.identify_ingress.
+
+    Args:
+        roi (ndarray)      : (rows x samples) matrix of ROI slices
+        peak_idx (ndarray) : peak index of each row within the ROI, -1 for none
+        threshold (float)  : ingress threshold
+
+    Returns:
+        ingress_idx (ndarray) : index within the ROI, -1 where there is no peak
+                                or no crossing before it
+    """
+    before   = np.arange(roi.shape[1])[None, :] < peak_idx[:, None]
+    crossing = (roi >= threshold) & before
+    return np.where(crossing.any(axis=1), crossing.argmax(axis=1), -1)
+
+
+class ChannelBatch:
+    """
+    One channel of a scope file across all segments of a run, held as
+    (segments x samples) matrices so that every processing step of
+    WaveForm runs once per channel instead of once per waveform.
+    """
+    def __init__(self, y, x_origin, x_increment, valid, paths):
+        """
+        Args:
+            y (ndarray)           : (segments x samples) float32 sample values
+            x_origin (ndarray)    : time of the first sample of every segment
+            x_increment (ndarray) : sampling interval of every segment
+            valid (ndarray)       : bool per segment, False where the waveform could not be read
+            paths (list)          : csv path of every segment, naming its WaveForm
+        """
+        self.raw_y       = y
+        self.x_origin    = x_origin
+        self.x_increment = x_increment
+        self.xfactor     = 1
+        self.y           = y.astype(float)
+        self.valid       = valid
+        self.paths       = paths
+        self.baseline    = np.full(len(y), np.nan)
+        self.peak_idx    = np.full(len(y), -1, dtype=np.int64)
+        self.ingress_idx = np.full(len(y), -1, dtype=np.int64)
+
+
+    """ ================== """
+    """ Processing Methods """
+    """ ================== """
+
+    def rescale(self, xfactor=1, yfactor=1):
+        self.xfactor *= xfactor
+        self.y       *= yfactor
+
+
+    def smooth(self, sigma=DEFAULT_SMOOTH_SIGMA):
+        self.y = gaussian_filter1d(self.y, sigma=sigma, axis=1)
+
+
+    def calculate_baseline(self,
+                           bins = DEFAULT_BASELINE_BINS,
+                           p0   = DEFAULT_BASELINE_P0,
+                           mode = DEFAULT_BASELINE_MODE):
+        """
+        Estimates the pedestal of every segment, with the same result as
+        WaveForm.calculate_baseline on each row.
+
+        Args:
+            bins (ndarray) : histogram bin edges, used by the 'gaussian' and 'mode' modes
+            p0 (list)      : initial (A, mean, sigma) of the 'gaussian' fit
+            mode (str)     : one of BASELINE_MODES
+
+        Returns:
+        """
+        if mode == "gaussian":
+            self.fit_gaussian_baseline(bins, p0)
+        elif mode == "mode":
+            self.baseline = self.histogram_mode_baseline(bins)
+        elif mode == "median":
+            self.baseline = self.pretrigger_median_baseline()
+        else:
+            raise ValueError(f"Unknown baseline mode '{mode}', expected one of {BASELINE_MODES}")
+
+
+    def fit_gaussian_baseline(self, bins, p0):
+        """
+        One histogram call for the whole channel, then the Gaussian fit of
+        each row. Rows whose fit fails on bad input are marked invalid, as
+        their WaveForm would be dropped; rows that do not converge get 0.
+        """
+        hist     = batch_histogram(self.y, bins)
+        bin_mids = bins[:-1] + np.diff(bins)/2
+
+        for row in np.flatnonzero(self.valid):
+            filled = hist[row] != 0
+            try:
+                popt, pcov = curve_fit(gaussian, bin_mids[filled], hist[row][filled], p0=p0)
+                self.baseline[row] = popt[1]
+            except RuntimeError:
+                self.baseline[row] = 0
+            except Exception as e:
+                logger.error("%s Failed to fit Gaussian to baseline histogram: %s", self.paths[row], e)
+                self.valid[row] = False
+
+
+    def histogram_mode_baseline(self, bins):
+        """
+        Row-wise histogram mode refined by a parabola through its neighbours,
+        as in WaveForm.histogram_mode_baseline.
+        """
+        hist     = batch_histogram(self.y, bins).astype(float)
+        bin_mids = bins[:-1] + np.diff(bins)/2
+        rows     = np.arange(len(hist))
+
+        k     = np.argmax(hist, axis=1)
+        inner = (k > 0) & (k < hist.shape[1] - 1)
+        km    = np.where(inner, k - 1, k)
+        kp    = np.where(inner, k + 1, k)
+
+        left, centre, right = hist[rows, km], hist[rows, k], hist[rows, kp]
+        curvature = left - 2*centre + right
+        refine    = inner & (curvature != 0)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            shift = 0.5 * (left - right) / curvature
+        width = 0.5 * (bin_mids[kp] - bin_mids[km])
+        return np.where(refine, bin_mids[k] + shift * width, bin_mids[k])
+
+
+    def pretrigger_median_baseline(self, trim=DEFAULT_BASELINE_TRIM):
+        """
+        Row-wise trimmed median of the samples with x < 0, as in
+        WaveForm.pretrigger_median_baseline.
+        """
+        baseline = np.full(len(self.y), np.nan)
+        rows     = np.flatnonzero(self.valid)
+        masks    = {}
+        for row in rows:
+            mask = self.get_time_axis(row) < 0
+            masks.setdefault(mask.tobytes(), (mask, []))[1].append(row)
+
+        # One vectorised median per trigger position, usually one for the run
+        for mask, group in masks.values():
+            block = self.y[group][:, mask] if mask.any() else self.y[group]
+            baseline[group] = trimmed_median(block, trim)
+        return baseline
+
+
+    def zero_baseline(self):
+        self.y -= self.baseline[:, None]
+
+
+    def get_time_axis(self, row):
+        """
+        Returns:
+            x (ndarray) : read-only, shared time axis of a segment
+        """
+        return time_axis(self.y.shape[1], float(self.x_origin[row]), float(self.x_increment[row]), self.xfactor)
+
+
+    def get_roi(self, ROI, rows):
+        """
+        Args:
+            ROI (tuple[int,int]) : first and last index of the Region Of Interest
+            rows (ndarray)       : segment rows sharing that ROI
+
+        Returns:
+            roi (ndarray) : (rows x samples) ROI slice of the processed matrix,
+                            with invalid segments set to -inf so they hold no peak
+        """
+        a = int(ROI[0]); b = int(ROI[1])
+        return np.where(self.valid[rows, None], self.y[rows, a:b], -np.inf)
+
+
+    def get_roi_index(self, ROI, row):
+        """
+        Returns:
+            ROI (tuple[int,int]) : ROI in nanoseconds converted to indices on the time
+                                   base of a segment, as Event.set_ROI does
+        """
+        base = (self.y.shape[1], float(self.x_origin[row]), float(self.x_increment[row]))
+        return (time_to_index(ROI[0] / self.xfactor, *base),
+                time_to_index(ROI[1] / self.xfactor, *base))
+
+
+    def reset_peak_and_ingress(self):
+        self.peak_idx    = np.full(len(self.y), -1, dtype=np.int64)
+        self.ingress_idx = np.full(len(self.y), -1, dtype=np.int64)
+
+
+    def set_peak_and_ingress(self, ROI, rows, peak_idx, ingress_idx):
+        """
+        Stores peak and ingress indices found within the ROI of some segment
+        rows, as indices of the full waveform (-1 where there is none).
+        """
+        a = int(ROI[0])
+        self.peak_idx[rows]    = np.where(peak_idx >= 0, a + peak_idx, -1)
+        self.ingress_idx[rows] = np.where(ingress_idx >= 0, a + ingress_idx, -1)
+
+
+    def process(self, mode=DEFAULT_BASELINE_MODE):
+        """
+        Same steps as Event.process_waveform, on the whole channel.
+        """
+        self.rescale(1e9, -1e3)
+        self.smooth()
+        self.calculate_baseline(mode=mode)
+        self.zero_baseline()
+
+
+    """ =========== """
+    """ Get Methods """
+    """ =========== """
+
+    def get_waveform(self, row):
+        """
+        Returns:
+            waveform (WaveForm) : processed WaveForm of a segment whose arrays are
+                                  views into the batch matrices, or None if invalid
+        """
+        if not self.valid[row]:
+            return None
+        wf = WaveForm(self.paths[row])
+        wf.set_data(self.raw_y[row], float(self.x_origin[row]), float(self.x_increment[row]))
+        wf.rescale(self.xfactor, 1)
+        wf.set_processed_data(self.y[row], float(self.baseline[row]))
+        if self.peak_idx[row] >= 0:
+            wf.main_peak_idx = self.peak_idx[row]
+        if self.ingress_idx[row] >= 0:
+            wf.ingress_idx = self.ingress_idx[row]
+        return wf
+
+
+def read_channel(dirpath, scope, channel, segments):
+    """
+    Reads one channel of all segments into (segments x samples) matrices.
+    A columnar WaveStore is sliced as a whole; other sources (raw BinFile or
+    csv files) are read waveform by waveform.
+
+    Args:
+        dirpath (str)  : run directory
+        scope (int)    : scope number
+        channel (str)  : channel label
+        segments (int) : number of segments of the run
+
+    Returns:
+        batch (ChannelBatch)
+    """
+    paths = [os.path.join(dirpath, f'scope-{scope}-seg{segment}-ch{channel}.csv')
+             for segment in range(1, segments + 1)]
+    store = open_store(dirpath, f'scope-{scope}')
+
+    if isinstance(store, WaveStore):
+        data, header = store.get_matrix(channel)
+        rows   = np.array([store.rows[channel].get(segment, -1) for segment in range(1, segments + 1)])
+        valid  = rows >= 0
+        points = header["points"][rows[valid]]
+        if len(np.unique(points)) > 1:
+            raise ValueError(f"{dirpath} scope-{scope} ch{channel}: segments of different lengths")
+        n = int(points[0]) if len(points) else 0
+
+        y = np.full((segments, n), np.nan, dtype=np.float32)
+        y[valid] = data[rows[valid], :n]
+
+        x_origin    = np.full(segments, np.nan)
+        x_increment = np.full(segments, np.nan)
+        x_origin[valid]    = header["x_origin"][rows[valid]]
+        x_increment[valid] = header["x_increment"][rows[valid]]
+        return ChannelBatch(y, x_origin, x_increment, valid, paths)
+
+    waveforms = [WaveForm(path, store=store) for path in paths]
+    valid     = np.array([wf.load() is not None for wf in waveforms], dtype=bool)
+    lengths   = {len(wf.raw_y) for wf in waveforms if wf.raw_y is not None}
+    if len(lengths) > 1:
+        raise ValueError(f"{dirpath} scope-{scope} ch{channel}: segments of different lengths")
+    n = lengths.pop() if lengths else 0
+
+    y           = np.full((segments, n), np.nan, dtype=np.float32)
+    x_origin    = np.full(segments, np.nan)
+    x_increment = np.full(segments, np.nan)
+    for row, wf in enumerate(waveforms):
+        if valid[row]:
+            y[row]           = wf.raw_y
+            x_origin[row]    = wf.x_origin
+            x_increment[row] = wf.x_increment
+    return ChannelBatch(y, x_origin, x_increment, valid, paths)
+
+
+class RunBatch:
+    """
+    Batch engine for a whole run: every channel of both scopes is read and
+    processed as one ChannelBatch, and each Event is then handed the
+    processed WaveForms of its segment instead of gathering them itself.
+    """
+    def __init__(self, dirpath, segments, baseline_mode=DEFAULT_BASELINE_MODE):
+        self.dirpath        = dirpath
+        self.segments       = segments
+        self.baseline_mode  = baseline_mode
+        self.channels       = {}
+        self.detection      = None
+
+
+    def process(self):
+        for plate in PLATE_CHANNELS:
+            for scope, channel in plate:
+                try:
+                    batch = read_channel(self.dirpath, scope, channel, self.segments)
+                    batch.process(mode=self.baseline_mode)
+                    self.channels[(scope, channel)] = batch
+                except Exception as e:
+                    logger.error("%s scope-%s ch%s: batch processing failed: %s", self.dirpath, scope, channel, e)
+        logger.info("%s batch processed %d channels of %d segments.", self.dirpath, len(self.channels), self.segments)
+
+
+    def calculate_peak_and_ingress(self, ROI, peak_threshold, ingress_threshold):
+        """
+        Finds the main peak and ingress of every waveform of the run with a
+        single find_peaks_stable call over the ROI slices of all channels. Runs once
+        per set of arguments, so it can be called for every event.
+
+        Args:
+            ROI (tuple[float,float]) : Region Of Interest in nanoseconds, converted to
+                                       indices on the time axis of each segment as in
+                                       Event.set_ROI
+            peak_threshold (float)   : minimum peak height
+            ingress_threshold (float): ingress threshold
+
+        Returns:
+            peak_idx, ingress_idx (ndarray, ndarray) : (segments x channels) indices in
+                                                       the order of self.channels, -1
+                                                       where there is none
+        """
+        args = (tuple(ROI), peak_threshold, ingress_threshold)
+        if self.detection is not None and self.detection[0] == args:
+            return self.detection[1]
+
+        batches = list(self.channels.values())
+        if len(batches) == 0:
+            return None
+
+        # ROI from nanoseconds to indices on the time base of the first valid
+        # channel of each segment, as in Event.set_ROI, and the segments
+        # grouped by ROI: usually a single group for the whole run
+        groups = {}
+        for row in range(self.segments):
+            batch = next((batch for batch in batches if batch.valid[row]), None)
+            if batch is not None:
+                groups.setdefault(batch.get_roi_index(ROI, row), []).append(row)
+
+        for batch in batches:
+            batch.reset_peak_and_ingress()
+
+        for roi_idx, rows in groups.items():
+            rows        = np.array(rows)
+            roi         = np.concatenate([batch.get_roi(roi_idx, rows) for batch in batches])
+            peak_idx    = find_first_peaks(roi, peak_threshold)
+            ingress_idx = find_ingress(roi, peak_idx, ingress_threshold)
+
+            peak_idx    = peak_idx.reshape(len(batches), len(rows))
+            ingress_idx = ingress_idx.reshape(len(batches), len(rows))
+            for batch, peaks, ingress in zip(batches, peak_idx, ingress_idx):
+                batch.set_peak_and_ingress(roi_idx, rows, peaks, ingress)
+
+        result = (np.stack([batch.peak_idx for batch in batches], axis=1),
+                  np.stack([batch.ingress_idx for batch in batches], axis=1))
+        self.detection = (args, result)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("%s peaks found in %d of %d waveforms.", self.dirpath, np.sum(result[0] >= 0), result[0].size)
+        return result
+
+
+    def get_waveform_matrix(self, segment):
+        """
+        Returns:
+            waveform_matrix (list) : processed WaveForms of a segment, laid out as
+                                     Event.waveform_matrix, with None where missing
+        """
+        row = segment - 1
+        waveform_matrix = []
+        for plate in PLATE_CHANNELS:
+            pair = []
+            for key in plate:
+                batch = self.channels.get(key)
+                pair.append(batch.get_waveform(row) if batch is not None else None)
+            waveform_matrix.append(pair)
+        return waveform_matrix
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import json
+import hashlib
+
+try:
+    from src.models.table import EventTable
+    from src.data.manifest import LOCK_NAME
+except ImportError as e:
+    print("Failed to import local modules:")
+    print(e)
+
+
+""" ============= """
+""" CONFIGURATION """
+""" ============= """
+
+# Segments processed between two checkpoints of a run
+DEFAULT_CHECKPOINT_EVERY = 100
+
+CHUNK_NAME_PATTERN = re.compile(r"segments-(?P<first>\d+)-(?P<last>\d+)\.npz$")
+
+""" ============ """
+
+
+def chunk_name(first, last):
+    return f"segments-{first:06d}-{last:06d}.npz"
+
+
+def source_fingerprint(runpath):
+    """
+    Fingerprints the data of a run by the name, size and modification time of
+    every file of its directory (index, stores, scope and csv files, manifest),
+    so that the checkpoints of a run go stale when it is reconverted.
+
+    Args:
+        runpath (str) : run directory
+
+    Returns:
+        digest (str)
+    """
+    files = []
+    with os.scandir(runpath) as entries:
+        for entry in entries:
+            if entry.name == LOCK_NAME or entry.name.endswith(".tmp") or not entry.is_file():
+                continue
+            stat = entry.stat()
+            files.append((entry.name, stat.st_size, stat.st_mtime_ns))
+    return hashlib.sha1(repr(sorted(files)).encode("utf-8")).hexdigest()
+
+
+class RunCheckpoint:
+    """
+    Completed segments of one run, saved as EventTable chunks of consecutive
+    segments, so that processing killed partway through resumes after the
+    last completed chunk. The chunks are only used with the processing
+    parameters they were written with; any other parameters start the run
+    over.
+    """
+    def __init__(self, checkpoint_dir, runpath, params):
+        """
+        Args:
+            checkpoint_dir (str) : directory of the checkpoints of all runs
+            runpath (str)        : run directory
+            params (dict)        : JSON-serialisable processing parameters of the run
+        """
+        # The run name keeps the directory readable, the hash of its path unique
+        runpath      = os.path.realpath(runpath)
+        digest       = hashlib.sha1(runpath.encode("utf-8")).hexdigest()[:10]
+        self.dirpath = os.path.join(checkpoint_dir, f"{os.path.basename(runpath)}-{digest}")
+        self.params  = dict(params, runpath=runpath)
+
+        os.makedirs(self.dirpath, exist_ok=True)
+
+
+    def params_path(self):
+        return os.path.join(self.dirpath, "params.json")
+
+
+    def chunks(self):
+        """
+        Returns:
+            chunks (list) : (first, last, file name) of every saved chunk, in order
+        """
+        chunks = []
+        for name in os.listdir(self.dirpath):
+            match = CHUNK_NAME_PATTERN.match(name)
+            if match is not None:
+                chunks.append((int(match["first"]), int(match["last"]), name))
+        return sorted(chunks)
+
+
+    def load(self):
+        """
+        Loads the chunks completed from the first segment on, after checking
+        that they were written with the same parameters. Chunks that do not
+        follow on (left by a run with other chunk boundaries) are removed.
+
+        Returns:
+            tables, next_segment (list, int) : EventTables of the completed segments,
+                                               and the first segment to process
+        """
+        saved = None
+        if os.path.exists(self.params_path()):
+            with open(self.params_path(), "r") as f:
+                saved = json.load(f)
+
+        if saved != self.params:
+            self.clear()
+            tmp = f"{self.params_path()}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.params, f, indent=1)
+            os.replace(tmp, self.params_path())
+
+        # Left by a process killed while writing a chunk
+        for name in os.listdir(self.dirpath):
+            if name.endswith(".tmp"):
+                os.remove(os.path.join(self.dirpath, name))
+
+        tables, next_segment = [], 1
+        for first, last, name in self.chunks():
+            path = os.path.join(self.dirpath, name)
+            if first == next_segment:
+                try:
+                    tables.append(EventTable.load(path))
+                    next_segment = last + 1
+                    continue
+                except (OSError, ValueError, KeyError):
+                    pass
+            os.remove(path)
+
+        return tables, next_segment
+
+
+    def save(self, segments, table):
+        """
+        Args:
+            segments (list)     : consecutive segments that were processed
+            table (EventTable)  : their events
+        """
+        segments = list(segments)
+        if len(segments) == 0:
+            return None
+        return table.save(os.path.join(self.dirpath, chunk_name(segments[0], segments[-1])))
+
+
+    def clear(self):
+        for _, _, name in self.chunks():
+            os.remove(os.path.join(self.dirpath, name))
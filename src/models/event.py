@@ -3,8 +3,9 @@
 import sys
 import os
 from pathlib import Path
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from scipy.optimize import curve_fit
 import warnings
 
 # Ignore warnings
@@ -23,16 +24,67 @@ except ImportError as e:
     print(e)
 
 try:
-    from src.models.waveform import WaveForm
+    from src.models.waveform import WaveForm, DEFAULT_BASELINE_MODE
     logger.debug("Imported models.waveform module.")
 except ImportError as e:
-    logger.warning("Failed to import models.waveform module: ", e)
+    logger.warning("Failed to import models.waveform module: %s", e)
 
 try:
     from src.utils.functions import linear
     logger.debug("Imported utils.linear module.")
 except ImportError as e:
-    logger.warning("Failed to import utils.linear module: ", e)
+    logger.warning("Failed to import utils.linear module: %s", e)
+
+try:
+    from src.models.track import fit_tracks, clamp_hits, track_angle, MIN_HIT, MAX_HIT
+    logger.debug("Imported models.track module.")
+except ImportError as e:
+    logger.warning("Failed to import models.track module: %s", e)
+
+try:
+    from src.data.store import open_store
+    logger.debug("Imported data.store module.")
+except ImportError as e:
+    logger.warning("Failed to import data.store module: %s", e)
+
+try:
+    from src.data.manifest import get_manifest
+    logger.debug("Imported data.manifest module.")
+except ImportError as e:
+    logger.warning("Failed to import data.manifest module: %s", e)
+
+try:
+    from src.models.runinfo import get_run_info
+    logger.debug("Imported models.runinfo module.")
+except ImportError as e:
+    logger.warning("Failed to import models.runinfo module: %s", e)
+
+
+""" ============= """
+""" CONFIGURATION """
+""" ============= """
+
+# Channels of an event as (scope, channel), in waveform_matrix order
+EVENT_CHANNELS = [(1, 1), (1, 2), (1, 3), (1, 4), (2, 1), (2, 2), (2, 3), (2, 4)]
+
+# Threads of the pool shared by every event that loads its channels concurrently
+LOADER_THREADS = 8
+
+""" ============ """
+
+
+@lru_cache(maxsize=None)
+def get_loader_pool(threads=LOADER_THREADS):
+    """
+    Returns the thread pool shared by all events for concurrent channel
+    loading, so the number of files read at once stays bounded however many
+    events are gathered.
+    """
+    return ThreadPoolExecutor(max_workers=threads, thread_name_prefix="channel-loader")
+
+
+# The threads of a pool do not survive a fork, a forked worker process starts its own
+os.register_at_fork(after_in_child=get_loader_pool.cache_clear)
 
 
 class Event:
@@ -53,7 +105,11 @@ class Event:
         self.ingress_threshold = None
         self.angle             = None
         self.track_popt        = None
+        self.track_pcov        = None
         self.hit_coordinates   = None
+        self.baseline_mode     = DEFAULT_BASELINE_MODE
+        self.cache             = None
+        self.cache_stats       = (0, 0)
 
 
     """ ================== """
@@ -61,64 +117,86 @@ class Event:
     """ ================== """
 
     def read_timestamp(self):
-        info_path = os.path.join(self.dirpath, 'scope-1_info.txt')
-        with open(info_path, 'r') as f:
-            lines = f.readlines()
-
-            count = 0
-            for line in lines:
-                if 'Time Tags' in line:
-                    count+=1
-                    if count == self.segment:
-                        timestamp = line.split(" = ")[-1]
-                        timestamp = float(timestamp.split('\'')[1])
-                        break
-
-        self.timestamp = timestamp
+        # Timestamps are loaded once per run directory and shared by all events
+        run_info       = get_run_info(self.dirpath)
+        self.timestamp = run_info.get_timestamp(self.segment)
 
 
     def process_waveform(self, waveform):
         waveform.rescale(1e9, -1e3)
         waveform.smooth()
-        waveform.calculate_baseline()
+        waveform.calculate_baseline(mode=self.baseline_mode)
         waveform.zero_baseline()
 
 
     def calculate_peak_and_ingress(self):
-        try:
-            for i in self.waveform_matrix:
-                for wf in i:
+        """
+        Finds the main peak and ingress of every waveform of the event. A
+        waveform that is missing or cannot be read is skipped on its own, so
+        the other channels of the event are still processed.
+        """
+        for i in self.waveform_matrix:
+            for wf in i:
+                if wf is None:
+                    continue
+                try:
                     wf.detect_main_peak((self.ROI[0], self.ROI[1]), self.peak_threshold)
                     wf.identify_ingress(self.ingress_threshold, (self.ROI[0], self.ROI[1]))
-        except:
-            pass
+                except Exception as e:
+                    logger.info("Event %s: no peak and ingress for %s: %s", self.segment, wf.name, e)
+
 
+    def gather_waveforms(self, concurrent=False):
+        """
+        Instantiates and processes the waveforms of the eight channels of the
+        event into waveform_matrix. Channels that the run manifest lists as
+        missing or corrupt for the segment are left as None without being read.
 
-    def gather_waveforms(self):
+        Args:
+            concurrent (bool) : read and process the channels in the shared loader
+                                pool (see get_loader_pool) instead of one after the
+                                other, to overlap the waits on a slow disk
+        """
         def channel_path(scope, channel):
             path = os.path.join(self.dirpath, f'scope-{scope}-seg{self.segment}-ch{channel}.csv')
             return path
 
+        # (scope, channel) pairs recorded and readable for this segment
+        available = set(map(tuple, get_manifest(self.dirpath).get_channels(self.segment)))
+
         def inst_and_process_waveform(scope, channel):
+            if (f'scope-{scope}', str(channel)) not in available:
+                return None, None
             try:
-                path = channel_path(scope, channel)
-                wf = WaveForm(path)
+                path  = channel_path(scope, channel)
+                store = open_store(self.dirpath, f'scope-{scope}')
+                wf = WaveForm(path, store=store)
                 self.process_waveform(wf)
-                return wf
+                hit = None
+                if self.cache is not None:
+                    # Processed waveforms are read back from the cache when it has them
+                    hit = self.cache.fetch(wf)
+                elif concurrent == True:
+                    # Read and process now, in the loader thread
+                    wf.evaluate()
+                return wf, hit
             except:
-                return None
+                return None, None
+
+        if concurrent == True:
+            results = list(get_loader_pool().map(lambda args: inst_and_process_waveform(*args), EVENT_CHANNELS))
+        else:
+            results = [inst_and_process_waveform(scope, channel) for scope, channel in EVENT_CHANNELS]
 
-        wf1 = inst_and_process_waveform(1,1)
-        wf2 = inst_and_process_waveform(1,2)
-        wf3 = inst_and_process_waveform(1,3)
-        wf4 = inst_and_process_waveform(1,4)
-        wf5 = inst_and_process_waveform(2,1)
-        wf6 = inst_and_process_waveform(2,2)
-        wf7 = inst_and_process_waveform(2,3)
-        wf8 = inst_and_process_waveform(2,4)
+        wf1, wf2, wf3, wf4, wf5, wf6, wf7, wf8 = [wf for wf, _ in results]
 
         self.waveform_matrix = [[wf1, wf2],[wf3, wf4],[wf5, wf6],[wf7, wf8]]
 
+        if self.cache is not None:
+            hits = [hit for _, hit in results if hit is not None]
+            self.cache_stats = (sum(hits), len(hits) - sum(hits))
+            logger.info("Event %s: %d cache hits, %d misses.", self.segment, *self.cache_stats)
+
 
     def calculate_ingress_matrix(self):
 
@@ -145,35 +223,30 @@ class Event:
         self.delta_t_array = delta_t_array
         
         
-    def calculate_track(self, min_hit=0, max_hit=144):
-        
-        positions, linear_popt = self.get_track_params()
-        
-        delta_t_array = self.get_delta_t_array()
-        hit_coordinates = linear(delta_t_array, *linear_popt)
-        
-        for idx, hit in enumerate(hit_coordinates):
-            if hit < min_hit:
-                hit_coordinates[idx] = min_hit
-            elif hit > max_hit:
-                hit_coordinates[idx] = max_hit
-        
-        # Remove NaN values
-        valid_indices = ~np.isnan(positions) & ~np.isnan(hit_coordinates)
-        x_clean = positions[valid_indices]
-        y_clean = hit_coordinates[valid_indices]
+    def calculate_hit_coordinates(self, min_hit=MIN_HIT, max_hit=MAX_HIT):
+        """
+        Returns:
+            hit_coordinates (ndarray) : hit position along each plate from its delta t,
+                                        clamped to the plate, NaN where there is none
+        """
+        _, linear_popt = self.get_track_params()
+        return clamp_hits(linear(self.get_delta_t_array(), *linear_popt), min_hit, max_hit)
 
-        # Fit track to linear function
-        popt, pcov = curve_fit(linear, x_clean, y_clean)
 
-        gradient = popt[0]
-        delta_gradient = pcov[0][0]**2
-        angle    = -np.arctan(gradient) * 180/np.pi
-        
+    def calculate_track(self, min_hit=MIN_HIT, max_hit=MAX_HIT):
+        """
+        Fits the straight track through the hits of the event (see
+        track.fit_tracks, which Run uses to fit all events at once).
+        Raises a ValueError when fewer than two plates were hit.
+        """
+        positions, _    = self.get_track_params()
+        hit_coordinates = self.calculate_hit_coordinates(min_hit, max_hit)
 
-        self.angle = angle
-        self.track_popt = popt
-        self.hit_coordinates = hit_coordinates
+        popt, pcov, angle = fit_tracks(positions, hit_coordinates)
+        if np.isnan(popt[0][0]):
+            raise ValueError(f"Event {self.segment}: a track needs at least 2 hits.")
+
+        self.set_track(popt[0], pcov[0], hit_coordinates)
 
 
     """ =========== """
@@ -185,6 +258,14 @@ class Event:
         return timestamp
 
 
+    def get_cache_stats(self):
+        """
+        Returns:
+            hits, misses (int, int) : waveform cache hits and misses of gather_waveforms
+        """
+        return self.cache_stats
+
+
     def get_waveform_matrix(self):
         waveform_matrix = self.waveform_matrix
         return waveform_matrix
@@ -236,23 +317,56 @@ class Event:
         self.ingress_threshold = ingress_threshold
 
 
+    def set_track(self, popt, pcov, hit_coordinates):
+        """
+        Args:
+            popt (ndarray)            : track gradient and intercept
+            pcov (ndarray)            : their covariance
+            hit_coordinates (ndarray) : hits the track was fitted to
+        """
+        self.track_popt      = popt
+        self.track_pcov      = pcov
+        self.angle           = float(track_angle(popt[0]))
+        self.hit_coordinates = hit_coordinates
+
+
+    def set_waveform_matrix(self, waveform_matrix):
+        # Processed waveforms given by the batch engine instead of gather_waveforms
+        self.waveform_matrix = waveform_matrix
+
+
+    def set_baseline_mode(self, baseline_mode):
+        self.baseline_mode = baseline_mode
+
+
+    def set_cache(self, cache):
+        """
+        Args:
+            cache (WaveformCache) : on-disk cache of processed waveforms that
+                                    gather_waveforms consults, None to disable it
+        """
+        self.cache = cache
+
+
     def set_ROI(self, ROI, index=False):
 
         if index == True:
             self.ROI = ROI
 
         elif index == False:
-            # This is the case where the user enters ROI in nanoseconds
-            try:
-                x, _ = self.waveform_matrix[0][0].get_data(zipped=False)
-
-                a = np.argmin(np.abs(x - ROI[0]))
-                b = np.argmin(np.abs(x - ROI[1]))
-
-                self.ROI = (a,b)
-            except Exception as e:
-                print(e)
-                print(f"{self.dirpath}, {self.segment} - Could not find any waveform object in wavefrom_matrix.")
+            # This is the case where the user enters ROI in nanoseconds,
+            # converted to indices on the time base of the first waveform
+            # of the event that could be read
+            for wf in [wf for plate in (self.waveform_matrix or []) for wf in plate]:
+                try:
+                    a = wf.get_index(ROI[0])
+                    b = wf.get_index(ROI[1])
+
+                    self.ROI = (a,b)
+                    return
+                except Exception:
+                    continue
+            print(f"{self.dirpath}, {self.segment} - Could not find any waveform object in wavefrom_matrix.")
 
 
     def set_track_params(self, positions=None, linear_popt=None):
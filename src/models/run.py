@@ -1,5 +1,6 @@
 import sys, os
 import json
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 from scipy.optimize import curve_fit
 import warnings
@@ -12,8 +13,17 @@ sys.path.append(project_path)
 
 try:
     from src.models.event import Event
-    from src.utils.functions import gaussian
+    from src.utils.functions import gaussian, linear
     from src.utils.functions import hist_to_scatter
+    from src.models.runinfo import get_run_info
+    from src.models.waveform import DEFAULT_BASELINE_MODE
+    from src.models.batch import RunBatch
+    from src.models.track import fit_tracks, clamp_hits
+    from src.models.table import EventTable, run_number
+    from src.data.cache import WaveformCache
+    from src.data.manifest import get_manifest
+    from src.models.checkpoint import RunCheckpoint, DEFAULT_CHECKPOINT_EVERY, source_fingerprint
+    from src.log.central_log import logger, log_queue, configure_worker
 except ImportError as e:
     print("Failed to import local modules:")
     print(e)
@@ -23,6 +33,17 @@ lcd_path  = os.path.join(project_path, "lcd")
 out_path  = os.path.join(project_path, "out")
 plt_path  = os.path.join(project_path, "plt")
 
+# Chunks of segments per worker of the process pool when no chunk size is given:
+# a few per worker balance the load, without paying the pool overhead per segment
+CHUNKS_PER_WORKER = 4
+
+# Event processing parameters (see event_processor)
+PEAK_THRESH    = 125
+INGRESS_THRESH = 25
+T_MIN          = -50
+T_MAX          = 75
+L              = 43
+
 
 # extract calibration.json popt
 json_path = os.path.join(out_path, "calibration.json")
@@ -33,32 +54,32 @@ with open(json_path, "r") as f:
 
 class Run:
 
-    def __init__(self):
-        self.data  = []
+    def __init__(self, cache=None, checkpoint_dir=None):
+        self.tables = []     # EventTable of every added run
+        self.table  = None   # their concatenation, see get_table
         self.rates = []
         self.total_time = 0
         self.event_num = 0
+        self.cache = cache   # optional data.cache.WaveformCache of processed waveforms
+        self.checkpoint_dir = checkpoint_dir   # optional directory of RunCheckpoints to resume from
 
 
     def check_segment_number(self, runpath):
-
-        seg = 1
-        for file in os.listdir(runpath):
-            #print(f"Current seg: {seg}")
-            try:
-                segment_number = int(file.split("seg")[1].split("-")[0])
-                if segment_number > seg:
-                    seg = segment_number
-            except:
-                pass
-
-        return segment_number
+        """
+        Returns the number of segments of a run, the highest segment recorded,
+        from its manifest (see data.manifest.get_manifest) rather than from
+        listing the directory every time.
+        """
+        return get_manifest(runpath).get_segment_number()
 
 
     def get_timestamps(self, filepath, segments):
         """
         Reads the <filename>_info.txt files generated by IF_bin_to_csv.py script
-        and extracts an array of timestamps.
+        and extracts an array of timestamps. If the converter also wrote a
+        <filename>_index.npy segment header index next to it, the full precision
+        time tags are taken from there instead of parsing the text file. The
+        result is cached in the run's RunInfo, which its Events share.
 
         Args:
             filepath (str) : path to <filename>_info.txt file
@@ -69,29 +90,13 @@ class Run:
             timestamps (ndarray) : numpy array of floats in seconds
         """
         try:
-            with open(filepath, 'r') as f:
-                lines = f.readlines()
-
-            # Initialise empty timestamps numpy array, expect floats
-            timestamps = np.empty(segments, dtype=float)
-            count      = 0
-
-            # Loop through all the lines in the file to find 'Time Tags'
-            for line in lines:
-                if count >= segments:
-                    break
-                if 'Time Tags' in line:
-                    timestamp = line.split(" = ")[-1]
-                    timestamp = float(timestamp.split('\'')[1])
-                    timestamps[count] = timestamp
-                    count += 1
+            dirpath    = os.path.dirname(filepath)
+            scope      = os.path.basename(filepath).split("_info")[0]
+            timestamps = get_run_info(dirpath).get_timestamps(scope)
 
             # Cut the timestamps array if there are less events than
             # expected segments
-            if count < segments:
-                timestamps = timestamps[:count]
-
-            return timestamps
+            return timestamps[:segments]
 
         except Exception as e:
             print("Error in 'get_timestamps'")
@@ -99,7 +104,7 @@ class Run:
             return None
 
 
-    def event_processor(self, event, linear_popt = linear_popt, PEAK_THRESH=125, INGRESS_THRESH=25, T_MIN=-50, T_MAX=75, L=43):
+    def event_processor(self, event, linear_popt = linear_popt, PEAK_THRESH=PEAK_THRESH, INGRESS_THRESH=INGRESS_THRESH, T_MIN=T_MIN, T_MAX=T_MAX, L=L, BASELINE_MODE=DEFAULT_BASELINE_MODE, batch=None, concurrent=False, track=True):
 
         # timestamp
         event.read_timestamp()
@@ -109,8 +114,17 @@ class Run:
         event.set_peak_threshold(PEAK_THRESH)
         event.set_ingress_threshold(INGRESS_THRESH)
 
-        # gather waveforms of event
-        event.gather_waveforms()
+        # set pedestal estimator (see waveform.BASELINE_MODES)
+        event.set_baseline_mode(BASELINE_MODE)
+
+        # gather waveforms of event, or take them from the run's batch engine,
+        # whose peaks and ingresses are found for the whole run at once
+        if batch is None:
+            event.set_cache(self.cache)
+            event.gather_waveforms(concurrent=concurrent)
+        else:
+            batch.calculate_peak_and_ingress((T_MIN, T_MAX), PEAK_THRESH, INGRESS_THRESH)
+            event.set_waveform_matrix(batch.get_waveform_matrix(event.segment))
 
         # set Region Of Interest (ROI)
         event.set_ROI((T_MIN, T_MAX))
@@ -120,10 +134,15 @@ class Run:
         event.set_track_params(positions=positions, linear_popt=linear_popt)
 
         # calculate
-        event.calculate_peak_and_ingress()
+        if batch is None:
+            event.calculate_peak_and_ingress()
         event.calculate_ingress_matrix()
         event.calculate_delta_t_array()
 
+        # the tracks of a whole run are fitted at once by calculate_tracks
+        if track == False:
+            return
+
         try:
             event.calculate_track()
         except Exception as e:
@@ -131,11 +150,141 @@ class Run:
             pass
 
 
-    def add_run(self, runpath):
+    def calculate_tracks(self, events):
+        """
+        Fits the tracks of all events in one vectorized least-squares pass
+        (see track.fit_tracks), with the same result as Event.calculate_track
+        on each. Events with fewer than two hits are left without a track.
+
+        Args:
+            events (list) : Events processed up to their delta t array
+        """
+        if len(events) == 0:
+            return
+
+        positions   = np.array([event.get_track_params()[0] for event in events], dtype=float)
+        delta_t     = np.array([event.get_delta_t_array() for event in events], dtype=float)
+        linear_popt = events[0].get_track_params()[1]
+
+        hit_coordinates   = clamp_hits(linear(delta_t, *linear_popt))
+        popt, pcov, angle = fit_tracks(positions, hit_coordinates)
+
+        for event, p, c, hits in zip(events, popt, pcov, hit_coordinates):
+            if not np.isnan(p[0]):
+                event.set_track(p, c, hits)
+
+
+    def process_segments(self, runpath, segments, BASELINE_MODE=DEFAULT_BASELINE_MODE, batch=None, concurrent=False):
+        """
+        Processes the given segments of a run, in order.
+
+        Args:
+            runpath (str)       : run directory
+            segments (iterable) : segment numbers
+            BASELINE_MODE (str) : pedestal estimator (see waveform.BASELINE_MODES)
+            batch (RunBatch)    : processed batch engine of the run, None to process
+                                  waveform by waveform
+            concurrent (bool)   : load the eight channels of each event concurrently
+
+        Returns:
+            table (EventTable) : one row per segment that could be processed
+        """
+        events = []
+        for segment in segments:
+            try:
+                event = Event(runpath, segment)
+                self.event_processor(event, BASELINE_MODE=BASELINE_MODE, batch=batch, concurrent=concurrent, track=False)
+                events.append(event)
+            except Exception as e:
+                print(e)
+
+        self.calculate_tracks(events)
+        return EventTable.from_events(events, run=run_number(runpath))
+
+
+    def process_segments_parallel(self, runpath, segments, BASELINE_MODE=DEFAULT_BASELINE_MODE, concurrent=False,
+                                  workers=2, chunksize=None, on_chunk=None):
+        """
+        Processes the segments of a run in a pool of worker processes, each
+        taking chunks of consecutive segments (see process_segments_worker).
+        The chunks are merged in segment order, so the table is the same as
+        that of process_segments. Their log records are written by this
+        process (see central_log.log_queue).
+
+        Args:
+            workers (int)   : number of worker processes
+            chunksize (int) : segments per chunk, by default enough for
+                              CHUNKS_PER_WORKER chunks per worker
+            on_chunk (func) : called with the segments and EventTable of every chunk,
+                              in segment order, as soon as it and those before it are done
+
+        Returns:
+            table (EventTable)
+        """
+        segments = list(segments)
+        if chunksize is None:
+            chunksize = max(1, -(-len(segments) // (workers * CHUNKS_PER_WORKER)))
+        chunks = [segments[i:i + chunksize] for i in range(0, len(segments), chunksize)]
+
+        cache_config = None
+        if self.cache is not None:
+            cache_config = (self.cache.cache_dir, self.cache.max_bytes)
+
+        with log_queue() as queue:
+            with ProcessPoolExecutor(max_workers=workers, initializer=configure_worker,
+                                     initargs=(queue, logger.level)) as pool:
+                futures = [pool.submit(process_segments_worker, runpath, chunk, BASELINE_MODE, concurrent, cache_config)
+                           for chunk in chunks]
+                results = []
+                for chunk, future in zip(chunks, futures):
+                    results.append(future.result())
+                    if on_chunk is not None:
+                        on_chunk(chunk, results[-1][0])
+
+        if self.cache is not None:
+            self.cache.hits   += sum(hits for _, (hits, _) in results)
+            self.cache.misses += sum(misses for _, (_, misses) in results)
+            self.cache.refresh()
+
+        return EventTable.concatenate(table for table, _ in results)
+
+
+    def add_run(self, runpath, batch=False, BASELINE_MODE=DEFAULT_BASELINE_MODE, concurrent=False,
+                workers=1, chunksize=None, checkpoint_every=DEFAULT_CHECKPOINT_EVERY):
+        """
+        Processes every segment of a run and appends its EventTable to the
+        tables of this Run.
+
+        Args:
+            runpath (str)       : run directory
+            batch (bool)        : process each channel of all segments at once with
+                                  the batch engine, instead of waveform by waveform.
+                                  The results are identical.
+            BASELINE_MODE (str) : pedestal estimator (see waveform.BASELINE_MODES)
+            concurrent (bool)   : load the eight channels of each event concurrently
+                                  (see Event.gather_waveforms)
+            workers (int)       : process the segments in this many worker processes
+                                  (see process_segments_parallel). The results are
+                                  identical.
+            chunksize (int)     : segments per task of the workers
+            checkpoint_every (int) : with a checkpoint_dir, segments processed between
+                                     two checkpoints (with workers, every chunk is one).
+                                     A run that was interrupted resumes after its last
+                                     checkpoint, with the same resulting table.
+        """
+        if batch == True and workers > 1:
+            raise ValueError("The batch engine processes a run in one process, it cannot be used with workers.")
 
         segment_number   = self.check_segment_number(runpath)
         self.event_num  += segment_number
 
+        manifest = get_manifest(runpath)
+        missing  = manifest.get_missing_segments()
+        corrupt  = manifest.get_corrupt_segments()
+        if len(missing) > 0 or len(corrupt) > 0:
+            print(f"{runpath}: {len(missing)} segments with missing channels and {len(corrupt)} with corrupt ones, "
+                  f"those channels are skipped")
+
         info_path        = os.path.join(runpath, "scope-1_info.txt")
         timestamps       = self.get_timestamps(info_path, segment_number)
         total_time       = timestamps[-1]
@@ -144,32 +293,72 @@ class Run:
         rate           = np.round(segment_number / total_time,3)
         self.rates.append(rate)
 
-        for segment in range(1, segment_number+1):
-            try:
-                event = Event(runpath, segment)
-                self.event_processor(event)
-
-                timestamp = event.get_timestamp()
-                angle     = event.get_angle()
-                hits      = np.sum(event.get_hit_bools())
-
-                if angle == None:
-                    angle = np.nan
-                if timestamp == None:
-                    timestamp = np.nan
+        # Segments completed before an interruption are read back
+        tables, first_segment, checkpoint = [], 1, None
+        if self.checkpoint_dir is not None:
+            params = {"segments"       : int(segment_number),
+                      "BASELINE_MODE"  : BASELINE_MODE,
+                      "linear_popt"    : [float(p) for p in linear_popt],
+                      "PEAK_THRESH"    : PEAK_THRESH,
+                      "INGRESS_THRESH" : INGRESS_THRESH,
+                      "T_MIN"          : T_MIN,
+                      "T_MAX"          : T_MAX,
+                      "L"              : L,
+                      "source"         : source_fingerprint(runpath)}
+            checkpoint            = RunCheckpoint(self.checkpoint_dir, runpath, params)
+            tables, first_segment = checkpoint.load()
+            if first_segment > segment_number:
+                print(f"All {segment_number} segments of {runpath} read from checkpoints")
+            elif first_segment > 1:
+                print(f"Resuming {runpath} from segment {first_segment}")
+
+        segments = range(first_segment, segment_number+1)
+        on_chunk = None if checkpoint is None else checkpoint.save
+
+        run_batch = None
+        if batch == True and len(segments) > 0:
+            run_batch = RunBatch(runpath, segment_number, baseline_mode=BASELINE_MODE)
+            run_batch.process()
+
+        if workers > 1:
+            tables.append(self.process_segments_parallel(runpath, segments, BASELINE_MODE=BASELINE_MODE, concurrent=concurrent,
+                                                         workers=workers, chunksize=chunksize, on_chunk=on_chunk))
+        else:
+            step = checkpoint_every if checkpoint is not None else max(len(segments), 1)
+            for start in range(0, len(segments), step):
+                chunk = segments[start:start + step]
+                table = self.process_segments(runpath, chunk, BASELINE_MODE=BASELINE_MODE, batch=run_batch, concurrent=concurrent)
+                if on_chunk is not None:
+                    on_chunk(chunk, table)
+                tables.append(table)
+
+        self.tables.append(EventTable.concatenate(tables))
+        self.table = None
+
+        if self.cache is not None and batch == False:
+            stats = self.cache.get_stats()
+            print(f"Waveform cache: {stats['hits']} hits, {stats['misses']} misses, "
+                  f"{stats['entries']} entries ({stats['bytes'] / 1e6:.1f} MB)")
 
-                tup       = (timestamp, angle, hits) #, hits)
-                self.data.append(tup)
 
-            except Exception as e:
-                print(e)
+    # == Get Methods == #
 
+    def get_table(self):
+        """
+        Returns:
+            table (EventTable) : events of every added run, concatenated once
+        """
+        if self.table is None:
+            self.table = EventTable.concatenate(self.tables)
+        return self.table
 
-    # == Get Methods == #
 
     def get_data(self):
-        data = np.array(self.data)
-        return data
+        """
+        Returns:
+            data (ndarray) : (events x 3) timestamp, angle and number of hits
+        """
+        return self.get_table().get_summary()
 
 
     def get_rate(self):
@@ -178,6 +367,21 @@ class Run:
         return rate, drate
 
 
+def process_segments_worker(runpath, segments, BASELINE_MODE, concurrent, cache_config):
+    """
+    Task of the worker processes of Run.process_segments_parallel. Returns the
+    EventTable of a chunk of segments rather than its Events, which are much
+    larger to send back, and the waveform cache hits and misses of the chunk.
+    """
+    cache = None
+    if cache_config is not None:
+        cache = WaveformCache(*cache_config)
+
+    table = Run(cache=cache).process_segments(runpath, segments, BASELINE_MODE=BASELINE_MODE, concurrent=concurrent)
+    stats = (0, 0) if cache is None else (cache.hits, cache.misses)
+    return table, stats
+
+
 # --------
 # Testing
 # --------
@@ -210,25 +414,15 @@ if __name__ == "__main__":
         run_path = os.path.join(lcd_path, f"Run{run_num}")
         run.add_run(run_path)
 
-    data = run.get_data()
-
-    angle_vals = np.array([tup[1] for tup in data if np.sum(tup[2])==2])
-    angle_vals_3 = np.array([tup[1] for tup in data if np.sum(tup[2])==3])
-    angle_vals_4 = np.array([tup[1] for tup in data if np.sum(tup[2])==4])
-    timestamps = np.array([tup[0] for tup in data])
-
-    # Remove NaN values
-    valid_indices = ~np.isnan(angle_vals)
-    valid_indices_3 = ~np.isnan(angle_vals_3)
-    valid_indices_4 = ~np.isnan(angle_vals_4)
+    table = run.get_table()
 
-    angle_vals_clean = angle_vals[valid_indices]
-    angle_vals_clean_3 = angle_vals_3[valid_indices_3]
-    angle_vals_clean_4 = angle_vals_4[valid_indices_4]
+    # Events with a track, by number of plates hit
+    angle_vals_clean   = table.select_valid().select_hits(2).angle
+    angle_vals_clean_3 = table.select_valid().select_hits(3).angle
+    angle_vals_clean_4 = table.select_valid().select_hits(4).angle
 
-    valid_indices = ~np.isnan(timestamps)
-    timestamps_clean = timestamps[valid_indices]
-    timestamps_diff = np.diff(np.array(timestamps_clean))
+    timestamps_clean = table.select_time().timestamp
+    timestamps_diff = np.diff(timestamps_clean)
 
     bins = np.arange(0,60*10, 10)
     timestamps_x, diff_y = hist_to_scatter(timestamps_diff, bins = bins)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import os
+from functools import lru_cache
+import numpy as np
+
+try:
+    from src.data.index import load_index, get_time_tags
+    from src.data.binfile import open_binfile
+except ImportError as e:
+    print("Failed to import local modules:")
+    print(e)
+
+
+def read_info_timestamps(info_path):
+    """
+    Parses every 'Time Tags' line of a <filename>_info.txt file written by
+    bintocsv.py, in a single pass.
+
+    Args:
+        info_path (str) : path to the info file
+
+    Returns:
+        timestamps (ndarray) : numpy array of floats in seconds
+    """
+    timestamps = []
+    with open(info_path, 'r') as f:
+        for line in f:
+            if 'Time Tags' in line:
+                timestamp = line.split(" = ")[-1]
+                timestamps.append(float(timestamp.split('\'')[1]))
+    return np.array(timestamps, dtype=float)
+
+
+class RunInfo:
+    """
+    Per-run metadata that is read once and shared by every Event of the run,
+    so looking up the timestamp of a segment does not reopen any file.
+    """
+    def __init__(self, dirpath):
+        self.dirpath    = dirpath
+        self.timestamps = {}
+
+
+    def get_timestamps(self, scope='scope-1'):
+        """
+        Returns the time tags of all segments of a scope file, from the
+        segment header index when available, else from its _info.txt file,
+        else from the headers of the raw scope file of a run that was not
+        converted.
+
+        Args:
+            scope (str) : scope file name without extension
+
+        Returns:
+            timestamps (ndarray) : timestamp of segment k at position k-1
+        """
+        if scope not in self.timestamps:
+            index = load_index(self.dirpath, scope)
+            info_path = os.path.join(self.dirpath, f'{scope}_info.txt')
+            binfile   = None if os.path.exists(info_path) else open_binfile(self.dirpath, scope)
+            if index is not None:
+                timestamps = get_time_tags(index)
+            elif binfile is not None:
+                timestamps = binfile.get_timestamps()
+            else:
+                timestamps = read_info_timestamps(info_path)
+            self.timestamps[scope] = timestamps
+        return self.timestamps[scope]
+
+
+    def get_timestamp(self, segment, scope='scope-1'):
+        return float(self.get_timestamps(scope)[segment - 1])
+
+
+@lru_cache(maxsize=64)
+def get_run_info(dirpath):
+    """
+    Returns the shared RunInfo of a run directory.
+    """
+    return RunInfo(dirpath)
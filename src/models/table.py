@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import numpy as np
+
+from src.models.track import MIN_HIT, MAX_HIT
+
+
+""" ============= """
+""" CONFIGURATION """
+""" ============= """
+
+PLATES = 4
+
+# Column name -> (dtype, shape of one event)
+COLUMNS = {"run"             : (np.int32,   ()),
+           "segment"         : (np.int32,   ()),
+           "timestamp"       : (np.float64, ()),
+           "ingress"         : (np.float64, (PLATES, 2)),
+           "delta_t"         : (np.float64, (PLATES,)),
+           "hit_coordinates" : (np.float64, (PLATES,)),
+           "hit_mask"        : (np.bool_,   (PLATES,)),
+           "angle"           : (np.float64, ()),
+           "track_pcov"      : (np.float64, (2, 2))}
+
+RUN_NAME_PATTERN = re.compile(r"Run(?P<run>\d+)$")
+
+""" ============ """
+
+
+def run_number(runpath):
+    """
+    Returns:
+        run (int) : number of a run directory such as 'lcd/Run5', -1 if it has none
+    """
+    match = RUN_NAME_PATTERN.search(str(runpath).rstrip("/"))
+    return int(match["run"]) if match is not None else -1
+
+
+def as_row(value, shape):
+    # Missing per-event values (no ingress, no track) become NaN rows
+    if value is None:
+        return np.full(shape, np.nan)
+    return np.asarray(value, dtype=float).reshape(shape)
+
+
+class EventTable:
+    """
+    Column-wise results of the events of one or more runs: one array per
+    quantity, with the events along the first axis (see COLUMNS). Selections
+    are boolean masks over all events at once, and tables of several runs
+    are joined with EventTable.concatenate.
+    """
+    def __init__(self, **columns):
+        for name, (dtype, shape) in COLUMNS.items():
+            column = np.asarray(columns.get(name, []), dtype=dtype)
+            setattr(self, name, column.reshape((-1,) + shape))
+
+
+    @classmethod
+    def empty(cls):
+        return cls()
+
+
+    @classmethod
+    def from_events(cls, events, run=-1):
+        """
+        Builds the table of processed Events, with the hits counted as in
+        Event.get_hit_bools: only on the plates of a fitted track, strictly
+        inside the plate.
+
+        Args:
+            events (list) : Events processed up to their track
+            run (int)     : run number of the events (see run_number)
+
+        Returns:
+            table (EventTable)
+        """
+        shape_of = {name: shape for name, (_, shape) in COLUMNS.items()}
+
+        timestamps = [event.get_timestamp() for event in events]
+        hits       = np.array([as_row(event.hit_coordinates, shape_of["hit_coordinates"]) for event in events])
+        hits       = hits.reshape((-1,) + shape_of["hit_coordinates"])
+
+        with np.errstate(invalid="ignore"):
+            hit_mask = (hits > MIN_HIT) & (hits < MAX_HIT)
+
+        return cls(run             = np.full(len(events), run),
+                   segment         = [event.segment for event in events],
+                   timestamp       = [np.nan if t is None else t for t in timestamps],
+                   ingress         = [as_row(event.get_ingress_matrix(), shape_of["ingress"]) for event in events],
+                   delta_t         = [as_row(event.delta_t_array, shape_of["delta_t"]) for event in events],
+                   hit_coordinates = hits,
+                   hit_mask        = hit_mask,
+                   angle           = [np.nan if event.get_angle() is None else event.get_angle() for event in events],
+                   track_pcov      = [as_row(event.track_pcov, shape_of["track_pcov"]) for event in events])
+
+
+    @classmethod
+    def concatenate(cls, tables):
+        """
+        Joins tables, e.g. of several runs, with one copy of each column.
+        """
+        tables = list(tables)
+        if len(tables) == 0:
+            return cls.empty()
+        return cls(**{name: np.concatenate([getattr(table, name) for table in tables]) for name in COLUMNS})
+
+
+    @classmethod
+    def load(cls, path):
+        """
+        Returns:
+            table (EventTable) : table saved with EventTable.save
+        """
+        with np.load(path) as data:
+            return cls(**{name: data[name] for name in COLUMNS})
+
+
+    def save(self, path):
+        """
+        Writes the columns to an .npz file, atomically, so that a process
+        killed while writing never leaves a partial table behind.
+        """
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, **self.get_columns())
+        os.replace(tmp, path)
+        return path
+
+
+    def __len__(self):
+        return len(self.timestamp)
+
+
+    """ ================= """
+    """ Selection Methods """
+    """ ================= """
+
+    def select(self, mask):
+        """
+        Args:
+            mask (ndarray) : boolean mask or indices over the events
+
+        Returns:
+            table (EventTable) : the selected events
+        """
+        return EventTable(**{name: getattr(self, name)[mask] for name in COLUMNS})
+
+
+    def select_hits(self, hits):
+        """ Events with exactly `hits` plates hit (an int) or any of several (a list). """
+        return self.select(np.isin(self.get_hits(), hits))
+
+
+    def select_angle(self, min_angle=-90, max_angle=90):
+        """ Events with a track angle in [min_angle, max_angle] degrees, which drops those without one. """
+        return self.select((self.angle >= min_angle) & (self.angle <= max_angle))
+
+
+    def select_time(self, t_min=-np.inf, t_max=np.inf):
+        """ Events with a timestamp in [t_min, t_max) seconds. """
+        return self.select((self.timestamp >= t_min) & (self.timestamp < t_max))
+
+
+    def select_run(self, run):
+        return self.select(self.run == run)
+
+
+    def select_valid(self):
+        """ Events with a track. """
+        return self.select(~np.isnan(self.angle))
+
+
+    """ =========== """
+    """ Get Methods """
+    """ =========== """
+
+    def get_hits(self):
+        """
+        Returns:
+            hits (ndarray) : number of plates hit per event
+        """
+        return np.sum(self.hit_mask, axis=1)
+
+
+    def get_columns(self):
+        return {name: getattr(self, name) for name in COLUMNS}
+
+
+    def get_summary(self):
+        """
+        Returns:
+            data (ndarray) : (events x 3) timestamp, angle and hits, the layout of
+                             Run.get_data
+        """
+        return np.column_stack((self.timestamp, self.angle, self.get_hits())).reshape(-1, 3)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+
+""" ============= """
+""" CONFIGURATION """
+""" ============= """
+
+# Hit coordinates are clamped to the length of the plates (cm)
+MIN_HIT = 0
+MAX_HIT = 144
+
+""" ============ """
+
+
+def clamp_hits(hits, min_hit=MIN_HIT, max_hit=MAX_HIT):
+    """
+    Clamps hit coordinates to the plates, leaving missing (NaN) hits as they are.
+    """
+    return np.clip(hits, min_hit, max_hit)
+
+
+def track_angle(gradient):
+    """
+    Returns:
+        angle (ndarray or float) : zenith angle in degrees of tracks of the given gradient
+    """
+    return -np.arctan(gradient) * 180/np.pi
+
+
+def fit_tracks(positions, hits):
+    """
+    Fits the straight track hit = m * position + c through the valid points
+    of every event at once, by closed-form least squares over the points that
+    are not NaN. The result and covariance are those of
+    curve_fit(linear, positions, hits) on the valid points of each event: the
+    covariance is scaled by the residual variance RSS / (n - 2), and is
+    infinite when there are only two points.
+
+    Args:
+        positions (ndarray) : (events x plates) plate positions, or (plates,) shared
+                              by all events
+        hits (ndarray)      : (events x plates) hit coordinates, NaN where missing
+
+    Returns:
+        popt, pcov, angle (ndarray, ndarray, ndarray) : (events x 2) gradient and intercept,
+                                                        (events x 2 x 2) covariance and
+                                                        (events,) angle in degrees; NaN for
+                                                        events with fewer than 2 valid points
+    """
+    hits      = np.atleast_2d(np.asarray(hits, dtype=float))
+    positions = np.broadcast_to(np.asarray(positions, dtype=float), hits.shape)
+
+    valid = ~np.isnan(positions) & ~np.isnan(hits)
+    n     = valid.sum(axis=1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Centred sums keep the fit accurate for positions far from zero
+        x_mean = np.where(valid, positions, 0).sum(axis=1) / n
+        y_mean = np.where(valid, hits, 0).sum(axis=1) / n
+        dx     = np.where(valid, positions - x_mean[:, None], 0)
+        dy     = np.where(valid, hits - y_mean[:, None], 0)
+        sxx    = np.sum(dx * dx, axis=1)
+
+        gradient  = np.sum(dx * dy, axis=1) / sxx
+        intercept = y_mean - gradient * x_mean
+
+        residuals = np.where(valid, hits - (gradient[:, None] * positions + intercept[:, None]), 0)
+        dof       = n - 2
+        s_sq      = np.where(dof > 0, np.sum(residuals**2, axis=1) / np.maximum(dof, 1), np.inf)
+
+        # s_sq * inverse of J^T J, J = [position, 1] at the valid points
+        pcov = np.empty((len(hits), 2, 2))
+        pcov[:, 0, 0] = 1 / sxx
+        pcov[:, 0, 1] = -x_mean / sxx
+        pcov[:, 1, 0] = pcov[:, 0, 1]
+        pcov[:, 1, 1] = 1 / n + x_mean**2 / sxx
+        pcov *= s_sq[:, None, None]
+
+    # As curve_fit, the whole covariance is infinite without degrees of freedom
+    pcov[dof <= 0] = np.inf
+
+    popt = np.stack([gradient, intercept], axis=1)
+    popt[n < 2] = np.nan
+    pcov[n < 2] = np.nan
+    return popt, pcov, track_angle(popt[:, 0])
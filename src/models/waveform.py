@@ -1,13 +1,16 @@
 #!/usr/bin/env python3
 
 import sys
+import time
+import logging
+import threading
+from functools import lru_cache
 from pathlib import Path
-import csv
 import numpy as np
 #import matplotlib.pyplot as plt
 from scipy.optimize import curve_fit
 from scipy.ndimage import gaussian_filter1d
-from scipy.signal import find_peaks
+from scipy.signal import find_peaks, peak_prominences, peak_widths
 import warnings
 
 # Ignore warnings
@@ -30,7 +33,13 @@ try:
     from src.utils.functions import gaussian
     logger.debug("Imported utils.gaussian module.")
 except ImportError as e:
-    logger.warning("Failed utils.gaussian module: ", e)
+    logger.warning("Failed utils.gaussian module: %s", e)
+
+try:
+    from src.data.store import parse_csv_name
+    logger.debug("Imported data.store module.")
+except ImportError as e:
+    logger.warning("Failed to import data.store module: %s", e)
 
 
 """ ============= """
@@ -41,6 +50,17 @@ DEFAULT_BASELINE_BINS = np.arange(-49.5, 299.5,1)
 
 DEFAULT_BASELINE_P0   = [100,0,20]
 
+# 'gaussian' : Gaussian fit to the histogram of all samples (reference)
+# 'mode'     : histogram mode refined by a parabola through its neighbours
+# 'median'   : trimmed median of the pre-trigger samples (x < 0)
+BASELINE_MODES        = ("gaussian", "mode", "median")
+
+DEFAULT_BASELINE_MODE = "gaussian"
+
+# Pre-trigger samples further than this many robust sigmas (1.4826 * MAD)
+# from their median are trimmed before taking the median again
+DEFAULT_BASELINE_TRIM = 3
+
 DEFAULT_SMOOTH_SIGMA  = 2
 
 DEFAULT_WIDTH         = 6
@@ -52,35 +72,195 @@ DEFAULT_PROMINENCE    = 12
 """ ============ """
 
 
+@lru_cache(maxsize=256)
+def time_axis(points, x_origin, x_increment, xfactor=1):
+    """
+    Returns the time axis x_origin + i * x_increment of a waveform, multiplied
+    by xfactor. Waveforms with the same time base share one read-only array.
+
+    Args:
+        points (int)        : number of samples
+        x_origin (float)    : time of the first sample
+        x_increment (float) : sampling interval
+        xfactor (float)     : rescale factor
+
+    Returns:
+        x (ndarray)
+    """
+    x = x_origin + np.arange(points) * x_increment
+    if xfactor != 1:
+        x = x * xfactor
+    x.flags.writeable = False
+    return x
+
+
+def time_to_index(t, points, x_origin, x_increment):
+    """
+    Returns the index of the sample closest to time t by arithmetic on the
+    time base, clipped to the waveform.
+    """
+    idx = int(np.rint((t - x_origin) / x_increment))
+    return min(max(idx, 0), points - 1)
+
+
+def select_by_distance(peaks, heights, distance):
+    """
+    Keeps the highest of every group of peaks closer than `distance`, like
+    the distance condition of scipy.signal.find_peaks, and the latest of
+    peaks of equal height. find_peaks breaks such ties by an argsort of all
+    the peaks, whose order depends on the whole array: the latest peak on a
+    single waveform, but often another one once rows are laid end to end.
+
+    Args:
+        peaks (ndarray)   : peak indices, increasing
+        heights (ndarray) : height of every peak
+        distance (float)  : minimum distance between peaks in samples
+
+    Returns:
+        keep (ndarray) : bool per peak
+    """
+    distance = np.ceil(distance)
+    keep     = np.ones(len(peaks), dtype=bool)
+
+    # Highest first, and the latest first among equal heights
+    for j in np.lexsort((-peaks, -heights)):
+        if not keep[j]:
+            continue
+        k = j - 1
+        while k >= 0 and peaks[j] - peaks[k] < distance:
+            keep[k] = False
+            k -= 1
+        k = j + 1
+        while k < len(peaks) and peaks[k] - peaks[j] < distance:
+            keep[k] = False
+            k += 1
+    return keep
+
+
+def find_peaks_stable(y,
+                      height,
+                      width      = DEFAULT_WIDTH,
+                      distance   = DEFAULT_DISTANCE,
+                      prominence = DEFAULT_PROMINENCE):
+    """
+    scipy.signal.find_peaks(y, height, width=width, distance=distance,
+    prominence=prominence), with its conditions applied in the same order,
+    but with ties of the distance condition broken by select_by_distance.
+
+    Args:
+        y (ndarray)        : samples
+        height (float)     : minimum peak height, or (min, max)
+        width (float)      : minimum peak width in samples
+        distance (float)   : minimum distance between peaks in samples
+        prominence (float) : minimum peak prominence
+
+    Returns:
+        peaks (ndarray) : indices of the peaks
+    """
+    peaks, properties = find_peaks(y, height=height)
+    peaks = peaks[select_by_distance(peaks, properties["peak_heights"], distance)]
+
+    prominences, left_bases, right_bases = peak_prominences(y, peaks)
+    keep  = prominences >= prominence
+    peaks = peaks[keep]
+
+    widths = peak_widths(y, peaks, rel_height=0.5,
+                         prominence_data=(prominences[keep], left_bases[keep], right_bases[keep]))[0]
+    return peaks[widths >= width]
+
+
+# Running totals of csv parsing, reported by get_csv_read_stats(). Events may
+# read their channels from several threads, so updates hold the lock.
+csv_read_stats      = {"files": 0, "bytes": 0, "seconds": 0.0}
+csv_read_stats_lock = threading.Lock()
+
+
+def get_csv_read_stats():
+    """
+    Returns:
+        stats (dict) : number of csv files parsed, bytes, seconds and MB/s
+    """
+    with csv_read_stats_lock:
+        stats = dict(csv_read_stats)
+    stats["MB/s"] = stats["bytes"] / stats["seconds"] / 1e6 if stats["seconds"] > 0 else np.nan
+    return stats
+
+
 class WaveForm:
     """
-    <Description>
+    A single scope waveform. Nothing is computed up front: the samples are
+    read on first access, and the processing stages
+
+        load -> rescale + smooth -> baseline -> zero
+
+    are only configured by the processing methods, then evaluated on demand.
+    They always run in this order, whatever the order of the calls: a stage
+    configured after zero_baseline changes what is zeroed, it does not act on
+    the zeroed waveform (zero_baseline(recalculate=True) measures that).
+    Each stage is memoized against its own parameters and those of the stages
+    before it, so asking again with the same parameters is free and changing
+    one parameter only recomputes the stages after it.
+
+    Only the float32 samples and the time base (x_origin, x_increment) are
+    kept: the time axis is generated on demand and shared between waveforms.
     """
-    def __init__(self, csvfile):
+    __slots__ = ("csvfile", "store", "name", "loaded", "raw_y", "x_origin", "x_increment",
+                 "processed", "scale", "sigma", "baseline_params", "zeroed", "stages",
+                 "baseline", "main_peak_idx", "ingress_idx")
+
+    def __init__(self, csvfile, store=None):
         """
         <Description>
 
         Args:
+            csvfile (str)       : path to the waveform csv file. When a store is given
+                                  the file is not opened, its name only identifies the
+                                  scope, segment and channel to read.
+            store (WaveStore)   : optional columnar store (or raw BinFile) to read the
+                                  waveform from.
 
         Returns:
         """
         self.csvfile            = csvfile
-        self.raw_data           = None
-        self.processed_data     = None
+        self.store              = store
+        self.loaded             = False
+        self.raw_y              = None   # float32 samples, read on first access
+        self.x_origin           = None   # time base of the samples
+        self.x_increment        = None
+        self.processed          = None   # y processed outside, see set_processed_data
+        self.scale              = (1, 1)
+        self.sigma              = None
+        self.baseline_params    = None   # (bins, p0, mode) of the baseline stage
+        self.zeroed             = False
+        self.stages             = {}     # stage name -> (parameters key, output)
         self.baseline           = None
         self.main_peak_idx      = None
         self.ingress_idx        = None
         
-        self.name               = self.csvfile.split("lcd")[1]
-
-        # Read data from csv
-        self.read_from_csv()
+        self.name               = self.csvfile.split("lcd")[-1]
 
 
     """ ================== """
     """ Processing Methods """
     """ ================== """
 
+    def load(self):
+        """
+        Reads the data from csv, or from the columnar store, the first time it
+        is needed.
+
+        Returns:
+            y (ndarray) : raw float32 samples, None if they could not be read
+        """
+        if self.loaded == False:
+            self.loaded = True
+            if self.store is None:
+                self.read_from_csv()
+            else:
+                self.read_from_store(self.store)
+        return self.raw_y
+
+
     def read_from_csv(self):
         """
         <Description>
@@ -90,147 +270,333 @@ class WaveForm:
         Returns:
         """
         try:
+            t0 = time.perf_counter()
             with open(self.csvfile, 'r') as f:
                 
-                reader = csv.reader(f)
-                
                 try:
-                    data   = np.array(list(reader), dtype=float)
+                    # Parse both columns in one pass with numpy's C-level parser
+                    data   = np.loadtxt(f, delimiter=",", dtype=float, ndmin=2)
+                    x      = data[:, 0]
+                    y      = data[:, 1]
                 except ValueError:
-                    logger.error(f"Value error occured when processing {self.name} numpy float array")
+                    logger.error("Value error occured when processing %s numpy float array", self.name)
                     return # stops the function from running further
                 
-                try:
-                    data   = data.T
-                    data   = np.array(list(zip(data[0], data[1])))
-    
-                    self.raw_data       = data
-                    self.processed_data = data
-                    
-                    logger.info(f"{self.name} successfully read.")
-                    
-                except Exception as e:
-                    logger.error(f"Unexpected error when attempting to process {self.name}.")
-                    logger.error(e)
+                nbytes  = f.tell()
+                seconds = time.perf_counter() - t0
+
+                with csv_read_stats_lock:
+                    csv_read_stats["files"]   += 1
+                    csv_read_stats["bytes"]   += nbytes
+                    csv_read_stats["seconds"] += seconds
+
+                # The time column is uniform: keep its time base only
+                x_increment = (x[-1] - x[0]) / (len(x) - 1) if len(x) > 1 else 0.0
+                self.set_data(y, float(x[0]), float(x_increment))
+
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info("%s successfully read at %.1f MB/s.", self.name, nbytes / max(seconds, 1e-9) / 1e6)
             
         except FileNotFoundError:
-            logger.error(f"{self.csvfile} not found!")
+            logger.error("%s not found!", self.csvfile)
         
         except PermissionError:
-            logger.error(f"Permission denied when trying to read {self.csvfile}.")
+            logger.error("Permission denied when trying to read %s.", self.csvfile)
         
         except OSError:
-            logger.error(f"OSError when trying to read {self.csvfile}.")
+            logger.error("OSError when trying to read %s.", self.csvfile)
             
         except Exception as e:
-            logger.error(f"Unexpected error when attempting to read {self.csvfile}: {e}")
+            logger.error("Unexpected error when attempting to read %s: %s", self.csvfile, e)
+
+
+    def read_from_store(self, store):
+        """
+        Reads the waveform from a columnar WaveStore, or straight from the raw
+        scope file through a memory-mapped BinFile, instead of its csv file.
+
+        Args:
+            store (WaveStore or BinFile) : store of the scope file this waveform belongs to
+
+        Returns:
+        """
+        try:
+            _, segment, channel = parse_csv_name(self.csvfile)
+            y, x_origin, x_increment = store.get_samples(channel, segment)
+
+            self.set_data(y, x_origin, x_increment)
+
+            logger.info("%s successfully read from store.", self.name)
+
+        except KeyError:
+            logger.error("%s not found in store %s.", self.name, store.dirpath)
+
+        except Exception as e:
+            logger.error("Unexpected error when attempting to read %s from store: %s", self.name, e)
 
 
     def rescale(self, xfactor=1, yfactor=1):
         """
-        <Description>
+        Multiplies the x and y scale factors of the rescale stage.
 
         Args:
+            xfactor (float) : x-axis factor
+            yfactor (float) : y-axis factor
 
         Returns:
         """
-        # Get the processed data to rescale
-        processed_data = self.get_data(zipped=True, raw=False)
-        
-        # Apply rescaling
-        rescaled_data  = [(x * xfactor, y * yfactor) for x, y in processed_data]
-        
-        # Update
-        self.processed_data = rescaled_data
-        
-        logger.info(f"{self.name} rescaled by ({xfactor},{yfactor}).")
+        self.scale = (self.scale[0] * xfactor, self.scale[1] * yfactor)
+
+
+    def smooth(self, sigma=DEFAULT_SMOOTH_SIGMA):
+        """
+        Sets the Gaussian kernel width of the smoothing stage.
+
+        Args:
+            sigma (float) : kernel standard deviation in samples
+
+        Returns:
+        """
+        self.sigma = sigma
 
 
     def calculate_baseline(self, 
                            bins = DEFAULT_BASELINE_BINS, 
-                           p0   = DEFAULT_BASELINE_P0):
+                           p0   = DEFAULT_BASELINE_P0,
+                           mode = DEFAULT_BASELINE_MODE):
         """
-        <Description>
+        Sets how the pedestal is estimated from the rescaled and smoothed
+        waveform. The estimate itself is made by get_baseline or zeroing.
+
+        Args:
+            bins (ndarray) : histogram bin edges, used by the 'gaussian' and 'mode' modes
+            p0 (list)      : initial (A, mean, sigma) of the 'gaussian' fit
+            mode (str)     : one of BASELINE_MODES
+
+        Returns:
+        """
+        if mode not in BASELINE_MODES:
+            raise ValueError(f"Unknown baseline mode '{mode}', expected one of {BASELINE_MODES}")
+
+        self.baseline_params = (np.asarray(bins, dtype=float), list(p0), mode)
+
+
+    def zero_baseline(self, recalculate=False, mode=DEFAULT_BASELINE_MODE):
+        """
+        Enables the zeroing stage, which subtracts the baseline.
 
         Args:
+            recalculate (bool) : estimate the baseline of the zeroed waveform right
+                                 away, for comparison. It is logged and returned,
+                                 the stored baseline stays the subtracted pedestal.
+            mode (str)         : baseline mode of the recalculation
 
         Returns:
+            residual (float) : baseline after zeroing, when recalculate is True
         """
-        # Extract waveform y-axis data
-        _, y = self.get_data(zipped=False)
+        self.zeroed = True
+
+        if recalculate == True:
+            x, y     = self.get_data(zipped=False)
+            residual = self.estimate_baseline(x, y, (DEFAULT_BASELINE_BINS, DEFAULT_BASELINE_P0, mode))
+            logger.info("%s baseline after zeroing (%s): %s", self.name, mode, residual)
+            return residual
+
+
+    def memoize(self, stage, key, compute, *args):
+        """
+        Returns the output of a stage, computing it only if its key (the
+        parameters of the stage and of every stage before it) has changed
+        since it was last computed.
+        """
+        cached = self.stages.get(stage)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        value = compute(*args)
+        self.stages[stage] = (key, value)
+        return value
 
+
+    def evaluate(self):
+        """
+        Runs the configured stages on demand, reusing every memoized stage
+        whose parameters did not change.
+
+        Returns:
+            x, y (ndarray, ndarray) : processed samples, (None, None) if the data could
+                                      not be read
+        """
+        if self.processed is not None:
+            return self.get_time_axis(), self.processed
+
+        y = self.load()
+        if y is None:
+            return None, None
+        x = self.get_time_axis()
+
+        # Rescaling is a single multiply, it shares the memoized output of the
+        # smoothing stage rather than keeping its own copy of the samples
+        key = (self.scale, self.sigma)
+        y   = self.memoize("smooth", key, self.apply_rescale_and_smooth, y)
+
+        if self.baseline_params is not None:
+            bins, p0, mode = self.baseline_params
+            # The edges enter the key through their hash, not a copy of them
+            key += ((len(bins), hash(bins.tobytes()), tuple(p0), mode),)
+            self.baseline = self.memoize("baseline", key, self.estimate_baseline, x, y, self.baseline_params)
+
+        if self.zeroed == True:
+            key += (self.baseline,)
+            y = self.memoize("zero", key, self.apply_zero, y)
+
+        return x, y
+
+
+    def apply_rescale(self, y):
+        # Processing runs in float64 on the float32 samples
+        y = y.astype(float)
+        xfactor, yfactor = self.scale
+        if (xfactor, yfactor) == (1, 1):
+            return y
+
+        logger.info("%s rescaled by (%s,%s).", self.name, xfactor, yfactor)
+        y *= yfactor
+        return y
+
+
+    def apply_smooth(self, y):
+        if self.sigma is None:
+            return y
+
+        logger.info("%s waveform smoothed according to sigma=%s.", self.name, self.sigma)
+        return gaussian_filter1d(y, sigma=self.sigma)
+
+
+    def apply_rescale_and_smooth(self, y):
+        return self.apply_smooth(self.apply_rescale(y))
+
+
+    def apply_zero(self, y):
+        return y - self.baseline
+
+
+    def estimate_baseline(self, x, y, params):
+        """
+        Args:
+            x, y (ndarray, ndarray) : samples to estimate the pedestal of
+            params (tuple)          : (bins, p0, mode), see calculate_baseline
+
+        Returns:
+            baseline (float) : None if the Gaussian fit failed on bad input
+        """
+        bins, p0, mode = params
+        if mode == "gaussian":
+            baseline = self.fit_gaussian_baseline(y, bins, p0)
+        elif mode == "mode":
+            baseline = self.histogram_mode_baseline(y, bins)
+        else:
+            baseline = self.pretrigger_median_baseline(x, y)
+
+        logger.info("%s baseline (%s): %s", self.name, mode, baseline)
+        return baseline
+
+
+    def fit_gaussian_baseline(self, y, bins, p0):
+        """
+        Fits a Gaussian to the histogram of the samples and returns its mean.
+        Returns None if the fit fails on bad input, and 0 if it does not converge.
+
+        Args:
+            y (ndarray)    : samples
+            bins (ndarray) : histogram bin edges
+            p0 (list)      : initial (A, mean, sigma)
+
+        Returns:
+            baseline (float)
+        """
         # Generate numpy histogram
         hist, bin_edges = np.histogram(y, bins)
 
         # Get mid-pounts of bin edges so as to make x and y arrays plottable
         bin_mids = bin_edges[:-1] + np.diff(bin_edges)/2
 
-        # Catch all zero indices
-        zero_indexes = []
-        for idx, y_val in enumerate(hist):
-            if y_val == 0:
-                zero_indexes.append(idx)
-
-        # Remove zeros
-        hist = np.delete(hist, zero_indexes, axis=None)
-        bin_mids = np.delete(bin_mids, zero_indexes, axis=None)
-        
-        #plt.plot(bin_mids, hist)
-        #plt.show()
+        # Remove empty bins
+        filled   = hist != 0
+        hist     = hist[filled]
+        bin_mids = bin_mids[filled]
         
-        logger.info(f"{self.name} Baseline histogram mean: {np.mean(hist)}")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("%s Baseline histogram mean: %s", self.name, np.mean(hist))
 
         # Fit to Gaussian
         try:
             popt, pcov = curve_fit(gaussian, bin_mids, hist, p0=p0)
-            baseline = popt[1] # the mean value of the fitted gaussian
-            self.baseline = baseline
+            return popt[1] # the mean value of the fitted gaussian
         except ValueError:
-            logger.error(f"{self.name} ValueError when fitting Gaussian to baseline histogram.")
+            logger.error("%s ValueError when fitting Gaussian to baseline histogram.", self.name)
         except RuntimeError:
-            logger.error(f"{self.name} Failed to converge when fitting Gaussian to baseline histogram.")
-            logger.error(f"{self.name} Setting baseline to 0.")
-            self.baseline = 0
+            logger.error("%s Failed to converge when fitting Gaussian to baseline histogram.", self.name)
+            logger.error("%s Setting baseline to 0.", self.name)
+            return 0
         except Exception as e:
-            logger.error(f"{self.name} Unexpected error when fitting Gaussian to baseline histogram: {e}")
-        
-        logger.info(f"{self.name} baseline: {self.baseline}")
+            logger.error("%s Unexpected error when fitting Gaussian to baseline histogram: %s", self.name, e)
+        return None
 
 
-    def zero_baseline(self):
+    def histogram_mode_baseline(self, y, bins=DEFAULT_BASELINE_BINS):
         """
-        <Description>
+        Closed-form pedestal estimate: the most populated histogram bin, refined
+        by the vertex of the parabola through it and its two neighbours.
 
         Args:
+            y (ndarray)    : samples
+            bins (ndarray) : histogram bin edges
 
         Returns:
+            baseline (float)
         """
-        baseline = self.get_baseline()
+        hist, bin_edges = np.histogram(y, bins)
+        bin_mids        = bin_edges[:-1] + np.diff(bin_edges)/2
 
-        data = self.get_data()
-        baseline_corrected_data = [(x, y-baseline) for x,y in data]
+        k = int(np.argmax(hist))
+        if k == 0 or k == len(hist) - 1:
+            return float(bin_mids[k])
 
-        self.processed_data = baseline_corrected_data
-        
-        # Recalculate baseline for comparison
-        self.calculate_baseline()
+        left, centre, right = hist[k-1:k+2].astype(float)
+        curvature = left - 2*centre + right
+        if curvature == 0:
+            return float(bin_mids[k])
 
+        shift = 0.5 * (left - right) / curvature   # in bins, within [-0.5, 0.5]
+        width = 0.5 * (bin_mids[k+1] - bin_mids[k-1])
+        return float(bin_mids[k] + shift * width)
 
-    def smooth(self, sigma=DEFAULT_SMOOTH_SIGMA):
+
+    def pretrigger_median_baseline(self, x, y, trim=DEFAULT_BASELINE_TRIM):
         """
-        <Description>
+        Closed-form pedestal estimate from the samples recorded before the
+        trigger (x < 0): their median after trimming outliers further than
+        `trim` robust sigmas. Uses every sample if none precede the trigger.
 
         Args:
+            x, y (ndarray, ndarray) : samples
+            trim (float)            : outlier cut in units of 1.4826 * MAD
 
         Returns:
+            baseline (float)
         """
-        x,y       = self.get_data(zipped=False)
-        wf_smooth = gaussian_filter1d(y, sigma=sigma)
+        pretrigger = y[x < 0]
+        if len(pretrigger) == 0:
+            pretrigger = y
 
-        smoothed_data = np.array(list(zip(x, wf_smooth)))
-        self.processed_data = smoothed_data
-        
-        logger.info(f"{self.name} waveform smoothed according to sigma={sigma}.")
+        median = np.median(pretrigger)
+        sigma  = 1.4826 * np.median(np.abs(pretrigger - median))
+        if sigma == 0:
+            return float(median)
+
+        kept = pretrigger[np.abs(pretrigger - median) <= trim * sigma]
+        return float(np.median(kept))
 
 
     def detect_main_peak(self,
@@ -254,26 +620,26 @@ class WaveForm:
 
         # Find peaks
         try:
-            peaks, _ = find_peaks(wf_cut, 
-                                  height     = height, 
-                                  width      = width, 
-                                  distance   = distance, 
-                                  prominence = prominence)
-            logger.info(f"{self.name} find_peaks scipy function executed successfully in ROI: {a},{b}.")
+            peaks = find_peaks_stable(wf_cut,
+                                      height     = height,
+                                      width      = width,
+                                      distance   = distance,
+                                      prominence = prominence)
+            logger.info("%s find_peaks scipy function executed successfully in ROI: %d,%d.", self.name, a, b)
         except Exception as e:
-            logger.error(f"{self.name} Unexpected error when attempting to find peaks in waveform: {e}")
+            logger.error("%s Unexpected error when attempting to find peaks in waveform: %s", self.name, e)
 
         if len(peaks) > 0:
             try:
                 # Extract index of first peak
                 peak_idx = a + peaks[0]
                 self.main_peak_idx = peak_idx
-                logger.info(f"{self.name} Peaks identified and updated at peak index {peak_idx}.")
+                logger.info("%s Peaks identified and updated at peak index %s.", self.name, peak_idx)
                 return 1 # successfully found peaks
             except Exception as e:
-                logger.error(f"{self.name} Unexpected error when attempting to access peaks in waveform: {e}")
+                logger.error("%s Unexpected error when attempting to access peaks in waveform: %s", self.name, e)
         else:
-            logger.info(f"{self.name} No peaks detected.")
+            logger.info("%s No peaks detected.", self.name)
             return 0 # no peaks detected
 
 
@@ -294,48 +660,125 @@ class WaveForm:
 
             ingress_idx = a + np.argwhere(wf_cut >= threshold)[0][0]
             self.ingress_idx = ingress_idx
-            logger.info(f"{self.name} Identified ingress index at {ingress_idx}.")
+            logger.info("%s Identified ingress index at %s.", self.name, ingress_idx)
             return 1
         else:
-            logger.info(f"{self.name} No ingress index to identify.")
+            logger.info("%s No ingress index to identify.", self.name)
             return 0            
 
 
+    """ =========== """
+    """ Set Methods """
+    """ =========== """
+
+    def set_data(self, y, x_origin, x_increment):
+        """
+        Stores the raw samples as a contiguous float32 array (a view when they
+        already are, e.g. a row of a memory-mapped store) and their time base.
+        Every memoized stage is discarded, as it was computed from other data.
+
+        Args:
+            y (ndarray)         : sample values
+            x_origin (float)    : time of the first sample
+            x_increment (float) : sampling interval
+        """
+        self.loaded      = True
+        self.raw_y       = np.ascontiguousarray(y, dtype=np.float32)
+        self.x_origin    = x_origin
+        self.x_increment = x_increment
+        self.stages      = {}
+
+
+    def set_time_base(self, x_origin, x_increment):
+        """
+        Sets the time base without reading the samples, for a waveform whose
+        processed data is given through set_processed_data.
+        """
+        self.x_origin    = x_origin
+        self.x_increment = x_increment
+
+
+    def set_processed_data(self, y, baseline):
+        """
+        Sets the processed samples and baseline of a waveform that was processed
+        outside of this object, such as a row of a batch.ChannelBatch or a
+        cache.WaveformCache entry. They are returned as they are, instead of
+        evaluating the stages. The time base must be set (set_data or
+        set_time_base) and the rescale factors configured as for the stages.
+
+        Args:
+            y (ndarray)      : processed sample values
+            baseline (float) : baseline that was subtracted from y
+        """
+        self.processed = y
+        self.baseline  = baseline
+
+
     """ =========== """
     """ Get Methods """
     """ =========== """
 
     def get_data(self, zipped=True, raw=False):
         """
-        <Description>
-
         Args:
+            zipped (bool) : return a single (N, 2) array instead of separate x and y
+            raw (bool)    : return the data as read, before any processing
 
         Returns:
-
+            x, y (ndarray) : the stored or memoized arrays themselves (no copy) when
+                             zipped is False, else a newly built (N, 2) array. These
+                             are shared with the stages and must not be modified.
         """
-        if zipped == True:
-            if raw == False:
-                return self.processed_data
-            else:
-                return self.raw_data
+        if raw == False:
+            x, y = self.evaluate()
+        else:
+            y = self.load()
+            x = None if y is None else self.get_time_axis(raw=True)
 
+        if zipped == True:
+            return None if y is None else np.column_stack((x, y))
         else:
-            if raw == False:
-                x,y = zip(*self.processed_data)
-            else:
-                x,y = zip(*self.raw_data)
-            return np.array(x),np.array(y)
+            return x, y
 
 
-    def get_baseline(self):
+    def get_time_axis(self, raw=False):
         """
-        <Description>
+        Returns:
+            x (ndarray) : read-only time axis, shared by the waveforms with the same
+                          time base, rescaled unless raw is True
+        """
+        xfactor = 1 if raw == True else self.scale[0]
+        return time_axis(self.get_points(), self.x_origin, self.x_increment, xfactor)
+
+
+    def get_points(self):
+        if self.raw_y is not None:
+            return len(self.raw_y)
+        return len(self.processed)
 
+
+    def get_index(self, t):
+        """
         Args:
+            t (float) : time on the (rescaled) time axis, e.g. in ns
 
         Returns:
+            idx (int) : index of the closest sample
+        """
+        if self.processed is None:
+            self.load()
+        xfactor = self.scale[0]
+        return time_to_index(t / xfactor, self.get_points(), self.x_origin, self.x_increment)
+
+
+    def get_baseline(self):
+        """
+        Returns:
+            baseline (float) : pedestal estimated by the baseline stage, evaluated
+                               on demand
         """
+        if self.processed is None:
+            self.evaluate()
         return self.baseline
 
 
@@ -13,6 +13,7 @@ sys.path.append(project_path)
 
 try:
     from src.models.event import Event
+    from src.data.cache import WaveformCache
     from src.utils.functions import linear
 except Exception as e:
     print("Failed to import local modules:")
@@ -26,6 +27,10 @@ plt_path  = os.path.join(project_path, 'plt')
 # Define path to pdf
 pdf_path      = os.path.join(out_path, 'eventview.pdf')
 
+# Processed waveforms are cached here, so viewing the event again after a
+# threshold tweak does not process its waveforms again
+cache_path    = os.path.join(out_path, 'cache')
+
 # Initialise pdf
 pdf           = PdfPages(pdf_path)
 
@@ -51,6 +56,7 @@ run_path = os.path.join(lcd_path, f'Run{run}')
 
 # Initialise event
 event = Event(run_path, seg)
+event.set_cache(WaveformCache(cache_path))
 
 
 """ == Event Processes == """
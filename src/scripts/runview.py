@@ -1,5 +1,6 @@
 # runview.py
 import sys, os
+import argparse
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_pdf import PdfPages
@@ -14,10 +15,10 @@ plt.rcParams['ytick.labelsize'] = 16
 
 try:
     from src.models.run import Run
+    from src.data.cache import WaveformCache, DEFAULT_CACHE_BYTES
     from src.utils.functions import gaussian
     from src.utils.functions import decay
     from src.utils.functions import hist_to_scatter
-    from src.utils.functions import remove_nans
 except Exception as e:
     print("Failed to import local modules:")
     print(e)
@@ -30,6 +31,19 @@ plt_path  = os.path.join(project_path, 'plt')
 # Define path to pdf
 pdf_path      = os.path.join(out_path, 'runview.pdf')
 
+# With --checkpoint, completed segments are checkpointed here, so an interrupted job resumes.
+# With --cache, processed waveforms are kept on disk, so a second pass after a threshold
+# tweak reads them back instead of processing every waveform again.
+parser = argparse.ArgumentParser(description="Plot the timing and angular distributions of the runs.")
+parser.add_argument("--checkpoint", action="store_true", help="resume interrupted runs from out/checkpoints")
+parser.add_argument("--cache", metavar="DIR", default=None, help="directory of the processed waveform cache")
+parser.add_argument("--cache-bytes", metavar="N", type=int, default=DEFAULT_CACHE_BYTES,
+                    help="size cap of the cache directory")
+args   = parser.parse_args()
+
+checkpoint_path = os.path.join(out_path, 'checkpoints') if args.checkpoint else None
+cache           = WaveformCache(args.cache, max_bytes=args.cache_bytes) if args.cache is not None else None
+
 # Initialise pdf
 pdf           = PdfPages(pdf_path)
 
@@ -39,22 +53,24 @@ def make_run_figs(runs, time_bins, time_p0, savefig = None, rate_array=None):
     #colors = ['blue', 'darkred', 'magenta']
     colors = ['#1f77b4', '#d62728', '#2ca02c']
 
-    run = Run()
+    run = Run(cache=cache, checkpoint_dir=checkpoint_path)
 
     for run_num in runs:
         print(f" => Processing Run{run_num}")
         run_path = os.path.join(lcd_path, f"Run{run_num}")
         run.add_run(run_path)
 
-    data = run.get_data()
+    table  = run.get_table()
+    tracks = table.select_valid()
+    timed  = table.select_time()
 
-    angles_all = remove_nans(np.array([tup[1] for tup in data]))
-    angles_3   = remove_nans(np.array([tup[1] for tup in data if np.sum(tup[2])==3]))
-    angles_4   = remove_nans(np.array([tup[1] for tup in data if np.sum(tup[2])==4]))
+    angles_all = tracks.angle
+    angles_3   = tracks.select_hits(3).angle
+    angles_4   = tracks.select_hits(4).angle
 
-    timestamps_all = remove_nans(np.array([tup[0] for tup in data]))
-    timestamps_3   = remove_nans(np.array([tup[0] for tup in data if np.sum(tup[2]==3)]))
-    timestamps_4   = remove_nans(np.array([tup[0] for tup in data if np.sum(tup[2]==4)]))
+    timestamps_all = timed.timestamp
+    timestamps_3   = timed.select_hits(3).timestamp
+    timestamps_4   = timed.select_hits(4).timestamp
 
     diff   = np.diff(timestamps_all)
     diff_3 = np.diff(timestamps_3)
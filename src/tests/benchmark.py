@@ -0,0 +1,686 @@
+#!/usr/bin/env python3
+
+# *********************************************************
+# Benchmarks for the processing chain. Each benchmark runs
+# on synthetic scope files so it can be run anywhere:
+#
+#   python benchmark.py <name> [options]
+#   python benchmark.py ?
+# *********************************************************
+
+import sys, os
+import re
+import time
+import struct
+import filecmp
+import tempfile
+import logging
+import subprocess
+import numpy as np
+
+# Add src directory to system path
+project_path = os.getcwd().split('/src')[0]
+sys.path.append(project_path)
+
+try:
+    from src.tests.synthetic import write_bin, make_pulse, make_run, make_project
+    from src.data.convert import format_float_rows
+    from src.models.waveform import WaveForm, get_csv_read_stats
+    from src.log.central_log import logger, configure
+    from scipy.ndimage import gaussian_filter1d
+except Exception as e:
+    print("Failed to import local modules:")
+    print(e)
+
+
+def timed(func, *args, repeat=3, **kwargs):
+    """ Returns the best wall-clock time of func(*args) over `repeat` calls. """
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func(*args, **kwargs)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def report(name, legacy, new):
+    print(f"{name:<40s} legacy: {legacy*1e3:10.2f} ms   new: {new*1e3:10.2f} ms   speedup: {legacy/new:6.1f}x")
+
+
+# =========================================================
+# Reference per-sample converter (original bintocsv.py
+# decoding loop) used as the baseline for comparisons.
+# =========================================================
+def legacy_bintocsv(bin_path, out_dir):
+    hex_to_binary = {"%x" % i: "{:04b}".format(i) for i in range(16)}
+    name = os.path.basename(bin_path)
+    with open(bin_path, "rb") as f:
+        f.read(8)
+        (waveforms,) = struct.unpack('i', f.read(4))
+        for _ in range(waveforms):
+            f.read(4 * 5 + 4 + 8)
+            (x_increment,) = struct.unpack('d', f.read(8))
+            (x_origin,)    = struct.unpack('d', f.read(8))
+            f.read(4 * 2 + 16 * 2 + 24)
+            label = struct.unpack('16s', f.read(16))[0].decode("utf-8").rstrip(chr(0))
+            f.read(8)
+            (segment_index,) = struct.unpack('I', f.read(4))
+            f.read(4)
+            (buffer_type,)     = struct.unpack('h', f.read(2))
+            (bytes_per_point,) = struct.unpack('h', f.read(2))
+            (buffer_size,)     = struct.unpack('i', f.read(4))
+
+            csv_name = re.sub(r"\.bin", "-seg%d-ch%s.csv" % (segment_index, label), name)
+            with open(os.path.join(out_dir, csv_name), "w") as csv:
+                if buffer_type == 6:
+                    for i in range(buffer_size):
+                        (digital_data,) = struct.unpack('B', f.read(1))
+                        hex_string = hex(digital_data)
+                        if len(hex_string) == 4:
+                            un = hex_to_binary[hex_string[2]]
+                            ln = hex_to_binary[hex_string[3]]
+                        else:
+                            un = "0000"
+                            ln = hex_to_binary[hex_string[2]]
+                        csv.write("%s, %s, %s, %s, %s, %s, %s, %s, %s\n" % (x_origin + (i * x_increment), un[0], un[1], un[2], un[3], ln[0], ln[1], ln[2], ln[3], ))
+                    continue
+
+                for i in range(int(buffer_size / bytes_per_point)):
+                    (voltage,) = struct.unpack('f', f.read(bytes_per_point))
+                    csv.write("%E, %f\n" % (x_origin + (i * x_increment), voltage))
+
+
+def run_legacy_bintocsv(bin_path, out_dir):
+    subprocess.run([sys.executable, os.path.abspath(__file__), "legacy_bintocsv", bin_path, out_dir], check=True)
+
+
+def run_bintocsv(bin_path, out_dir):
+    script = os.path.join(project_path, "bintocsv.py")
+    subprocess.run([sys.executable, script, bin_path, out_dir], check=True)
+
+
+def bench_decoder(segments=200, points=1000, digital=0):
+    """ bintocsv.py per-file conversion time against the per-sample struct loop. """
+    with tempfile.TemporaryDirectory() as tmp:
+        bin_path   = os.path.join(tmp, "scope-1.bin")
+        legacy_dir = os.path.join(tmp, "legacy"); os.mkdir(legacy_dir)
+        new_dir    = os.path.join(tmp, "new");    os.mkdir(new_dir)
+        write_bin(bin_path, segments=segments, points=points, digital=bool(digital))
+
+        legacy = timed(run_legacy_bintocsv, bin_path, legacy_dir, repeat=1)
+        new    = timed(run_bintocsv, bin_path, new_dir, repeat=1)
+
+        csvs = sorted(f for f in os.listdir(legacy_dir) if f.endswith(".csv"))
+        _, mismatch, errors = filecmp.cmpfiles(legacy_dir, new_dir, csvs, shallow=False)
+
+        print(f"{len(csvs)} waveforms x {points} points, {os.path.getsize(bin_path)/1e6:.1f} MB")
+        report("bintocsv.py per file", legacy, new)
+        print(f"byte-identical CSV files: {len(csvs) - len(mismatch) - len(errors)}/{len(csvs)}")
+
+
+def bench_digital(segments=50, points=20000):
+    """ bintocsv.py on 8-bit digital buffers against the per-byte hex lookup. """
+    bench_decoder(segments=segments, points=points, digital=1)
+
+
+def bench_csvwriter(points=200000):
+    """ '%E, %f' block formatter against per-row writes and np.savetxt. """
+    rng      = np.random.default_rng(0)
+    times    = -1e-7 + np.arange(points) * 4e-10
+    voltages = rng.normal(0, 0.01, points).astype('<f4')
+
+    def per_row(f):
+        for i in range(points):
+            f.write("%E, %f\n" % (times[i], voltages[i]))
+
+    def savetxt(f):
+        np.savetxt(f, np.column_stack((times, voltages)), fmt="%E, %f")
+
+    def block(f):
+        for start in range(0, points, 1 << 16):
+            stop = start + (1 << 16)
+            f.write(format_float_rows(times[start:stop], voltages[start:stop]))
+
+    outputs = {}
+    for func in (per_row, savetxt, block):
+        with tempfile.TemporaryFile("w+") as f:
+            outputs[func.__name__] = timed(func, f, repeat=1)
+            f.seek(0)
+            outputs[func.__name__ + "_text"] = f.read()
+
+    print(f"{points} rows")
+    report("np.savetxt vs per-row write", outputs["per_row"], outputs["savetxt"])
+    report("block formatter vs per-row write", outputs["per_row"], outputs["block"])
+    print(f"identical output: {outputs['per_row_text'] == outputs['block_text'] == outputs['savetxt_text']}")
+
+
+def legacy_read_csv(csvfile):
+    """ Original WaveForm.read_from_csv parsing: csv.reader -> list -> array -> zip. """
+    import csv
+    with open(csvfile, 'r') as f:
+        data = np.array(list(csv.reader(f)), dtype=float)
+        data = data.T
+        return np.array(list(zip(data[0], data[1])))
+
+
+def bench_csvread(segments=25):
+    """ WaveForm.read_from_csv throughput against the csv.reader path. """
+    with tempfile.TemporaryDirectory() as tmp:
+        lcd = os.path.join(tmp, "lcd"); os.mkdir(lcd)
+        bin_path = os.path.join(tmp, "scope-1.bin")
+        write_bin(bin_path, segments=segments, points=2000)
+        run_bintocsv(bin_path, lcd)
+        csvs = [os.path.join(lcd, f) for f in sorted(os.listdir(lcd)) if f.endswith(".csv")]
+        mb   = sum(os.path.getsize(f) for f in csvs) / 1e6
+
+        legacy = timed(lambda: [legacy_read_csv(f) for f in csvs])
+        new    = timed(lambda: [WaveForm(f).load() for f in csvs])
+
+        # WaveForm keeps float32 samples and an implicit time axis
+        same = all(np.allclose(legacy_read_csv(f), WaveForm(f).get_data(raw=True), rtol=1e-6, atol=0)
+                   for f in csvs)
+        print(f"{len(csvs)} csv files, {mb:.1f} MB")
+        report("read all csv files", legacy, new)
+        print(f"legacy: {mb/legacy:.1f} MB/s   new: {get_csv_read_stats()['MB/s']:.1f} MB/s   same values (float32): {same}")
+
+
+def bench_waveform(points=2000, repeat=200):
+    """ WaveForm transforms on x/y arrays against the (N, 2) / list-of-tuples versions. """
+    with tempfile.TemporaryDirectory() as tmp:
+        lcd = os.path.join(tmp, "lcd"); os.mkdir(lcd)
+        bin_path = os.path.join(tmp, "scope-1.bin")
+        write_bin(bin_path, segments=1, channels=1, points=points)
+        run_bintocsv(bin_path, lcd)
+        wf = WaveForm(os.path.join(lcd, "scope-1-seg1-ch1.csv"))
+        wf.load()
+    data = wf.get_data(zipped=True)
+    x, y = wf.get_data(zipped=False)
+    wf.rescale(1e9, -1e3)
+    wf.smooth(2)
+    wf.baseline = 0.5
+
+    # Original method bodies, operating on the zipped data
+    def legacy_get_data():
+        x, y = zip(*data)
+        return np.array(x), np.array(y)
+
+    def legacy_rescale():
+        return [(x * 1e9, y * -1e3) for x, y in data]
+
+    def legacy_zero():
+        return [(x, y - 0.5) for x, y in data]
+
+    def legacy_smooth():
+        x, y = legacy_get_data()
+        return np.array(list(zip(x, gaussian_filter1d(y, sigma=2))))
+
+    # The stage functions, as evaluated on demand
+    methods = (("get_data(zipped=False)", legacy_get_data, lambda: wf.get_data(zipped=False)),
+               ("rescale",                legacy_rescale,  lambda: wf.apply_rescale(y)),
+               ("zero_baseline (subtract)", legacy_zero,   lambda: wf.apply_zero(y)),
+               ("smooth",                 legacy_smooth,   lambda: wf.apply_smooth(y)))
+
+    print(f"{points} samples, {repeat} calls per method")
+    for name, legacy, new in methods:
+        report(name,
+               timed(lambda: [legacy() for _ in range(repeat)]),
+               timed(lambda: [new() for _ in range(repeat)]))
+
+
+def bench_baseline(segments=100, points=1000, run=0, files=200):
+    """ Baseline modes: accuracy and time per waveform against the Gaussian fit. """
+    from src.models.waveform import BASELINE_MODES
+
+    def processed(wfs):
+        for wf in wfs:
+            wf.load()
+            wf.rescale(1e9, -1e3)
+            wf.smooth()
+            wf.get_data(zipped=False)
+        return wfs
+
+    if run > 0:
+        # Real run: no ground truth, deviations are taken from the Gaussian fit
+        run_path = os.path.join(project_path, "lcd", f"Run{run}")
+        csvs     = sorted(f for f in os.listdir(run_path) if f.endswith(".csv"))[:files]
+        wfs      = processed([WaveForm(os.path.join(run_path, f)) for f in csvs])
+        truth    = None
+    else:
+        # Synthetic run: pedestal of 2 mV before the (-1e3) rescale
+        with tempfile.TemporaryDirectory() as tmp:
+            bin_path = os.path.join(tmp, "scope-1.bin")
+            write_bin(bin_path, segments=segments, points=points)
+            run_bintocsv(bin_path, tmp)
+            from src.data.store import open_store
+            store = open_store(tmp, "scope-1")
+            wfs   = processed([WaveForm(os.path.join(tmp, f"scope-1-seg{s}-ch{c}.csv"), store=store)
+                               for s in range(1, segments + 1) for c in range(1, 5)])
+        truth = -2.0
+
+    estimates = {}
+    seconds   = {}
+    for mode in BASELINE_MODES:
+        def estimate():
+            values = []
+            for wf in wfs:
+                wf.calculate_baseline(mode=mode)
+                values.append(wf.get_baseline())
+            return values
+        seconds[mode]   = timed(estimate, repeat=1)
+        estimates[mode] = np.array(estimate(), dtype=float)
+
+    reference = estimates["gaussian"] if truth is None else truth
+    print(f"{len(wfs)} waveforms, deviation from {'the gaussian fit' if truth is None else 'the true pedestal'} in mV")
+    for mode in BASELINE_MODES:
+        err = estimates[mode] - reference
+        print(f"{mode:<10s} {seconds[mode]/len(wfs)*1e6:9.1f} us/waveform   "
+              f"mean {np.nanmean(err):+.3f}   rms {np.sqrt(np.nanmean(err**2)):.3f}   max {np.nanmax(np.abs(err)):.3f}")
+
+
+def bench_batch(segments=1000, points=1000, mode=0):
+    """ One channel of a run through ChannelBatch against WaveForm by WaveForm. """
+    from src.models.waveform import BASELINE_MODES
+    from src.models.event import Event
+    from src.models.batch import read_channel
+    from src.data.store import open_store
+    baseline_mode = BASELINE_MODES[mode]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bin_path = os.path.join(tmp, "scope-1.bin")
+        write_bin(bin_path, segments=segments, channels=1, points=points)
+        subprocess.run([sys.executable, os.path.join(project_path, "bintocsv.py"), bin_path, tmp, "npy"],
+                       check=True, stdout=subprocess.DEVNULL)
+        paths = [os.path.join(tmp, f"scope-1-seg{s}-ch1.csv") for s in range(1, segments + 1)]
+
+        event = Event(tmp, 1)
+        event.set_baseline_mode(baseline_mode)
+
+        def legacy():
+            wfs = [WaveForm(path, store=open_store(tmp, "scope-1")) for path in paths]
+            for wf in wfs:
+                event.process_waveform(wf)
+                wf.get_data(zipped=False)
+            return wfs
+
+        def new():
+            batch = read_channel(tmp, 1, "1", segments)
+            batch.process(mode=baseline_mode)
+            return batch
+
+        wfs, batch = legacy(), new()
+        same = all(np.array_equal(wf.get_data(zipped=False)[1], batch.y[row]) and wf.get_baseline() == batch.baseline[row]
+                   for row, wf in enumerate(wfs))
+
+        print(f"{segments} segments x {points} samples, baseline mode '{baseline_mode}'")
+        report("load + process one channel", timed(legacy), timed(new))
+        print(f"identical results: {same}")
+
+
+def bench_peaks(segments=1000, points=500, channels=8):
+    """ One find_peaks call over all ROI rows against detect_main_peak per waveform. """
+    from scipy.signal import find_peaks
+    from src.models.batch import find_first_peaks, find_ingress
+
+    rng = np.random.default_rng(0)
+    roi = np.array([-1e3 * make_pulse(points, rng) for _ in range(segments * channels)], dtype=float)
+    height, threshold = 125, 25
+
+    def legacy():
+        peaks, ingress = [], []
+        for row in roi:
+            found, _ = find_peaks(row, height=height, width=6, distance=10, prominence=12)
+            if len(found) > 0:
+                peaks.append(found[0])
+                crossing = np.argwhere(row[:found[0]] >= threshold)
+                ingress.append(crossing[0][0] if len(crossing) else -1)
+            else:
+                peaks.append(-1); ingress.append(-1)
+        return np.array(peaks), np.array(ingress)
+
+    def new():
+        peaks = find_first_peaks(roi, height)
+        return peaks, find_ingress(roi, peaks, threshold)
+
+    (lp, li), (np_, ni) = legacy(), new()
+    print(f"{roi.shape[0]} waveforms x {points} samples, {np.sum(np_ >= 0)} with a peak")
+    report("peak + ingress of all waveforms", timed(legacy), timed(new))
+    print(f"identical indices: {np.array_equal(lp, np_) and np.array_equal(li, ni)}")
+
+
+def bench_stages(points=1000, repeat=50):
+    """ Lazy WaveForm stages: full evaluation, memoized re-ask and single-parameter changes. """
+    with tempfile.TemporaryDirectory() as tmp:
+        bin_path = os.path.join(tmp, "scope-1.bin")
+        write_bin(bin_path, segments=1, channels=1, points=points)
+        subprocess.run([sys.executable, os.path.join(project_path, "bintocsv.py"), bin_path, tmp, "npy"],
+                       check=True, stdout=subprocess.DEVNULL)
+        from src.data.store import open_store
+        wf = WaveForm(os.path.join(tmp, "scope-1-seg1-ch1.csv"), store=open_store(tmp, "scope-1"))
+        wf.load()
+
+    def full():
+        # What every call cost before: all stages from the raw data
+        wf.stages = {}
+        return wf.get_data(zipped=False)
+
+    def sigma_change():
+        wf.smooth(3 if wf.sigma == 2 else 2)
+        return wf.get_data(zipped=False)
+
+    def mode_change():
+        wf.calculate_baseline(mode="median" if wf.baseline_params[2] == "mode" else "mode")
+        return wf.get_data(zipped=False)
+
+    wf.rescale(1e9, -1e3)
+    wf.smooth(2)
+    wf.calculate_baseline(mode="mode")
+    wf.zero_baseline()
+
+    t_full = timed(lambda: [full() for _ in range(repeat)]) / repeat
+    print(f"{points} samples, per call (mode / median baseline)")
+    for name, func in (("re-ask, same parameters", lambda: wf.get_data(zipped=False)),
+                       ("new sigma (rescale+smooth, baseline, zero)", sigma_change),
+                       ("new baseline mode (baseline, zero)", mode_change)):
+        wf.get_data(zipped=False)
+        report(name, t_full, timed(lambda: [func() for _ in range(repeat)]) / repeat)
+
+
+def bench_cache(segments=100, points=1000, csv=1, mode=0):
+    """ Event.gather_waveforms through a cold and a warm WaveformCache against no cache. """
+    from src.models.waveform import BASELINE_MODES
+    from src.models.event import Event
+    from src.data.cache import WaveformCache
+    fmt  = "csv" if csv else "npy"
+    mode = BASELINE_MODES[mode]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        make_run(tmp, segments=segments, points=points, fmt=fmt)
+        cache = WaveformCache(os.path.join(tmp, "cache"))
+
+        def gather(cache):
+            matrices = []
+            for segment in range(1, segments + 1):
+                event = Event(tmp, segment)
+                event.set_baseline_mode(mode)
+                event.set_cache(cache)
+                event.gather_waveforms()
+                matrices.append([wf.get_data(zipped=False)[1] for plate in event.waveform_matrix for wf in plate])
+            return matrices
+
+        t0 = time.perf_counter(); reference = gather(None);  t_none = time.perf_counter() - t0
+        t0 = time.perf_counter(); cold      = gather(cache); t_cold = time.perf_counter() - t0
+        t0 = time.perf_counter(); warm      = gather(cache); t_warm = time.perf_counter() - t0
+
+        identical = all(np.array_equal(a, b) for ref, c, w in zip(reference, cold, warm)
+                        for a, b in zip(ref + ref, c + w))
+        stats = cache.get_stats()
+        print(f"{segments} events x 8 waveforms of {points} samples ({fmt}, {mode} baseline)")
+        print(f"cache: {stats['hits']} hits, {stats['misses']} misses, {stats['bytes'] / 1e6:.1f} MB")
+        report("cold cache (process + write)", t_none, t_cold)
+        report("warm cache (read back)", t_none, t_warm)
+        print(f"processed data identical: {identical}")
+
+
+def legacy_log_calls(wf, hist, a, b, peak_idx, ingress_idx):
+    """ The f-string logging calls one waveform went through, evaluated even when discarded. """
+    logger.info(f"{wf.name} successfully read from store.")
+    logger.info(f"{wf.name} rescaled by ({1e9},{-1e3}).")
+    logger.info(f"{wf.name} waveform smoothed according to sigma={wf.sigma}.")
+    logger.info(f"{wf.name} Baseline histogram mean: {np.mean(hist)}")
+    logger.info(f"{wf.name} baseline (gaussian): {wf.baseline}")
+    logger.info(f"{wf.name} find_peaks scipy function executed successfully in ROI: {a},{b}.")
+    logger.info(f"{wf.name} Peaks identified and updated at peak index {peak_idx}.")
+    logger.info(f"{wf.name} Identified ingress index at {ingress_idx}.")
+
+
+def lazy_log_calls(wf, hist, a, b, peak_idx, ingress_idx):
+    """ The same calls as the waveform methods now make them. """
+    logger.info("%s successfully read from store.", wf.name)
+    logger.info("%s rescaled by (%s,%s).", wf.name, 1e9, -1e3)
+    logger.info("%s waveform smoothed according to sigma=%s.", wf.name, wf.sigma)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("%s Baseline histogram mean: %s", wf.name, np.mean(hist))
+    logger.info("%s baseline (%s): %s", wf.name, "gaussian", wf.baseline)
+    logger.info("%s find_peaks scipy function executed successfully in ROI: %d,%d.", wf.name, a, b)
+    logger.info("%s Peaks identified and updated at peak index %s.", wf.name, peak_idx)
+    logger.info("%s Identified ingress index at %s.", wf.name, ingress_idx)
+
+
+def bench_logging(segments=200, points=1000, repeat=20):
+    """ Logging cost per waveform: f-string against deferred calls, and the level/destination. """
+    from src.data.store import open_store
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bin_path = os.path.join(tmp, "scope-1.bin")
+        write_bin(bin_path, segments=segments, channels=1, points=points)
+        subprocess.run([sys.executable, os.path.join(project_path, "bintocsv.py"), bin_path, tmp, "npy"],
+                       check=True, stdout=subprocess.DEVNULL)
+        store = open_store(tmp, "scope-1")
+        paths = [os.path.join(tmp, f"scope-1-seg{s}-ch1.csv") for s in range(1, segments + 1)]
+
+        def process():
+            for path in paths:
+                wf = WaveForm(path, store=store)
+                wf.rescale(1e9, -1e3)
+                wf.smooth()
+                wf.calculate_baseline(mode="mode")
+                wf.zero_baseline()
+                wf.detect_main_peak((100, 900), 125)
+                wf.identify_ingress(25, (100, 900))
+
+        wf = WaveForm(paths[0], store=store)
+        wf.smooth()
+        hist = np.histogram(np.zeros(points), 100)[0]
+        args = (wf, hist, 100, 900, 612, 598)
+
+        configure(level="ERROR", destination="none")
+        t_legacy = timed(lambda: [legacy_log_calls(*args) for _ in range(repeat * segments)]) / (repeat * segments)
+        t_lazy   = timed(lambda: [lazy_log_calls(*args) for _ in range(repeat * segments)]) / (repeat * segments)
+        print(f"logging calls of one waveform at level ERROR, per waveform")
+        print(f"  f-string: {t_legacy*1e6:6.2f} us   deferred: {t_lazy*1e6:6.2f} us   speedup: {t_legacy/t_lazy:5.1f}x")
+
+        print(f"{segments} waveforms of {points} samples (mode baseline), per waveform")
+        log_file = os.path.join(tmp, "log.log")
+        for level, destination in (("ERROR", "none"), ("ERROR", log_file), ("INFO", log_file)):
+            configure(level=level, destination=destination)
+            t = timed(process) / segments
+            print(f"  {level:<5s} -> {os.path.basename(destination):<8s}: {t*1e6:8.1f} us")
+
+    configure()
+
+
+def drop_page_cache(dirpath):
+    """ Asks the kernel to evict the files of dirpath from the page cache, so they are read cold. """
+    for entry in os.scandir(dirpath):
+        if entry.is_file():
+            fd = os.open(entry.path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+
+
+def bench_gather(segments=50, points=1000, csv=1):
+    """ Per-event latency of Event.gather_waveforms, concurrent against sequential, cold and warm. """
+    from src.models.event import Event
+    from src.data.store import open_store
+    fmt = "csv" if csv else "npy"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        make_run(tmp, segments=segments, points=points, fmt=fmt)
+
+        def gather(concurrent, cold):
+            latencies = []
+            for segment in range(1, segments + 1):
+                if cold:
+                    drop_page_cache(tmp)
+                    open_store.cache_clear()
+                t0    = time.perf_counter()
+                event = Event(tmp, segment)
+                event.gather_waveforms(concurrent=concurrent)
+                for plate in event.waveform_matrix:
+                    for wf in plate:
+                        wf.get_data(zipped=False)
+                latencies.append(time.perf_counter() - t0)
+            return np.median(latencies)
+
+        gather(True, False)   # start the loader pool
+        print(f"median latency per event, 8 channels of {points} samples ({fmt})")
+        for cold in (True, False):
+            name = "cold page cache" if cold else "warm page cache"
+            report(name, gather(False, cold), gather(True, cold))
+
+
+def legacy_tracks(positions, hits):
+    """ Original Event.calculate_track: clamping loop and one curve_fit per event. """
+    from scipy.optimize import curve_fit
+    from src.utils.functions import linear
+    popts = []
+    for hit_coordinates in hits.copy():
+        for idx, hit in enumerate(hit_coordinates):
+            if hit < 0:
+                hit_coordinates[idx] = 0
+            elif hit > 144:
+                hit_coordinates[idx] = 144
+        valid = ~np.isnan(positions) & ~np.isnan(hit_coordinates)
+        try:
+            popt, pcov = curve_fit(linear, positions[valid], hit_coordinates[valid])
+        except Exception:
+            popt, pcov = np.full(2, np.nan), np.full((2, 2), np.nan)
+        popts.append((popt, pcov))
+    return popts
+
+
+def bench_tracks(events=1000, missing=20):
+    """ Track fits of a run: fit_tracks in one pass against a curve_fit call per event. """
+    import warnings
+    from src.models.track import fit_tracks, clamp_hits
+    warnings.filterwarnings("ignore")
+
+    rng       = np.random.default_rng(0)
+    positions = np.array([0, 43, 86, 129], dtype=float)
+    hits      = rng.normal(72, 50, (events, 4))
+    hits[rng.random((events, 4)) < missing / 100] = np.nan
+
+    legacy = legacy_tracks(positions, hits)
+    popt, pcov, angle = fit_tracks(positions, clamp_hits(hits))
+
+    fitted = [i for i, (p, _) in enumerate(legacy) if not np.isnan(p[0])]
+    d_popt = max(np.max(np.abs(legacy[i][0] - popt[i])) for i in fitted)
+    finite = [i for i in fitted if np.all(np.isfinite(legacy[i][1]))]
+    d_pcov = max(np.max(np.abs(legacy[i][1] - pcov[i]) / np.abs(legacy[i][1])) for i in finite)
+
+    print(f"{events} events, {missing}% missing hits, {events - len(fitted)} without a track")
+    print(f"max |popt - curve_fit popt| = {d_popt:.1e}, max relative pcov difference = {d_pcov:.1e}")
+    report("track fits", timed(legacy_tracks, positions, hits), timed(lambda: fit_tracks(positions, clamp_hits(hits))))
+
+
+SCALING_RUN = """
+import sys, time, json, hashlib
+import numpy as np
+sys.path.insert(0, {project_path!r})
+from src.models.run import Run
+run = Run()
+t0  = time.perf_counter()
+run.add_run({run_path!r}, BASELINE_MODE={mode!r}, workers={workers}, chunksize={chunksize})
+seconds = time.perf_counter() - t0
+digest  = hashlib.sha1(b"".join(np.ascontiguousarray(c).tobytes() for c in run.get_table().get_columns().values()))
+print(json.dumps({{"seconds": seconds, "events": len(run.get_table()), "digest": digest.hexdigest()}}))
+"""
+
+
+def bench_scaling(segments=400, points=1000, mode=1, chunksize=0):
+    """ Run.add_run over a process pool of 1, 2, 4, 8 and 16 workers against the serial loop. """
+    import json
+    from src.models.waveform import BASELINE_MODES
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # run.py reads the calibration of the project it is run from
+        run_path = make_project(tmp, segments=segments, points=points)
+
+        def add_run(workers):
+            code = SCALING_RUN.format(project_path=project_path, run_path=run_path, mode=BASELINE_MODES[mode],
+                                      workers=workers, chunksize=chunksize or None)
+            proc = subprocess.run([sys.executable, "-c", code], cwd=tmp, check=True, capture_output=True, text=True)
+            return json.loads(proc.stdout.strip().splitlines()[-1])
+
+        serial = add_run(1)
+        print(f"{serial['events']} events of 8 waveforms ({BASELINE_MODES[mode]} baseline), {os.cpu_count()} CPUs")
+        for workers in (1, 2, 4, 8, 16):
+            result = add_run(workers)
+            report(f"{workers:2d} workers (identical: {result['digest'] == serial['digest']})",
+                   serial["seconds"], result["seconds"])
+
+
+def legacy_check_segment_number(runpath):
+    """ Original Run.check_segment_number: list the run and split every file name. """
+    seg = 1
+    for file in os.listdir(runpath):
+        try:
+            segment_number = int(file.split("seg")[1].split("-")[0])
+            if segment_number > seg:
+                seg = segment_number
+        except:
+            pass
+    return segment_number
+
+
+def bench_manifest(segments=1000, channels=8):
+    """ Run setup: segment count from the run manifest against listing and parsing the directory. """
+    from src.data.manifest import get_manifest, scan_run
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for segment in range(1, segments + 1):
+            for channel in range(channels):
+                scope = 1 + channel // 4
+                with open(os.path.join(tmp, f"scope-{scope}-seg{segment}-ch{1 + channel % 4}.csv"), "w") as f:
+                    f.write("0.0, 0.0\n")
+
+        t_scan = timed(scan_run, tmp)
+        get_manifest(tmp)
+
+        def read_manifest():
+            get_manifest.cache_clear()
+            return get_manifest(tmp).get_segment_number()
+
+        print(f"{segments * channels} csv files; building the manifest once takes {t_scan*1e3:.1f} ms")
+        print(f"segment count: listing {legacy_check_segment_number(tmp)}, manifest {read_manifest()}")
+        report("run setup", timed(legacy_check_segment_number, tmp), timed(read_manifest))
+
+
+BENCHMARKS = {
+    "decoder"   : bench_decoder,
+    "digital"   : bench_digital,
+    "csvwriter" : bench_csvwriter,
+    "csvread"   : bench_csvread,
+    "waveform"  : bench_waveform,
+    "baseline"  : bench_baseline,
+    "batch"     : bench_batch,
+    "peaks"     : bench_peaks,
+    "stages"    : bench_stages,
+    "cache"     : bench_cache,
+    "logging"   : bench_logging,
+    "gather"    : bench_gather,
+    "tracks"    : bench_tracks,
+    "scaling"   : bench_scaling,
+    "manifest"  : bench_manifest,
+}
+
+
+if __name__ == "__main__":
+
+    # Entry point used to time the reference converter in its own process
+    if len(sys.argv) == 4 and sys.argv[1] == "legacy_bintocsv":
+        legacy_bintocsv(sys.argv[2], sys.argv[3])
+        exit()
+
+    if len(sys.argv) < 2 or sys.argv[1] == '?':
+        print("<benchmark> [kwarg=value ...]")
+        for name, func in BENCHMARKS.items():
+            print(f"  {name:<12s} {func.__doc__.strip()}")
+        exit()
+
+    kwargs = dict(arg.split("=") for arg in sys.argv[2:])
+    kwargs = {k: int(v) for k, v in kwargs.items()}
+    BENCHMARKS[sys.argv[1]](**kwargs)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+# *********************************************************
+# Helpers to generate synthetic InfiniiVision binary files
+# for benchmarks and test scripts, so that they can run
+# without access to the muon data box.
+# *********************************************************
+
+import os
+import json
+import struct
+import numpy as np
+
+# Calibration of the synthetic projects, read by run.py from out/calibration.json
+CALIBRATION = {"popt": [6.0, 72.0]}
+
+
+def make_pulse(points, rng, peak=-0.25, centre=0.6, noise=0.004):
+    """
+    Returns a negative going scintillator-like pulse (Volts) on top of
+    a noisy baseline, as recorded by the scope before rescaling.
+    """
+    t     = np.arange(points)
+    tc    = centre * points + rng.normal(0, 3)
+    pulse = peak * np.exp(-((t - tc)**2) / (2 * 6**2))
+    y     = 0.002 + pulse + rng.normal(0, noise, points)
+    return y.astype('<f4')
+
+
+def write_bin(path,
+              segments     = 10,
+              channels     = 4,
+              points       = 500,
+              x_increment  = 4e-10,
+              x_origin     = -1e-7,
+              seed         = 0,
+              digital      = False):
+    """
+    Writes a segmented InfiniiVision binary file in the same layout the
+    scope produces: one waveform record per (channel, segment), channel by
+    channel, each with a single buffer of 32-bit floats (or one 8-bit
+    digital buffer when digital=True). Returns the list of time tags written.
+    """
+    rng       = np.random.default_rng(seed)
+    time_tags = np.cumsum(rng.exponential(0.05, segments))
+
+    # Records are streamed to the file so large captures can be generated
+    waveforms   = channels * segments
+    record_size = 140 + 12 + points * (1 if digital else 4)
+
+    f = open(path, "wb")
+    f.write(struct.pack('2s', b"AG"))
+    f.write(struct.pack('2s', b"10"))
+    f.write(struct.pack('i', (12 + waveforms * record_size) % (1 << 31)))
+    f.write(struct.pack('i', waveforms))
+
+    for ch in range(1, channels + 1):
+        for seg in range(1, segments + 1):
+            if digital:
+                label       = "D%d" % ch
+                buffer_type = 6
+                bpp         = 1
+                data        = rng.integers(0, 256, points, dtype=np.uint8).tobytes()
+            else:
+                label       = "%d" % ch
+                buffer_type = 1
+                bpp         = 4
+                data        = make_pulse(points, rng).tobytes()
+
+            header  = struct.pack('i', 140)
+            header += struct.pack('i', 6 if digital else 1)
+            header += struct.pack('i', 1)
+            header += struct.pack('i', points)
+            header += struct.pack('i', 1)
+            header += struct.pack('f', points * x_increment)
+            header += struct.pack('d', x_origin)
+            header += struct.pack('d', x_increment)
+            header += struct.pack('d', x_origin)
+            header += struct.pack('i', 2)
+            header += struct.pack('i', 1)
+            header += struct.pack('16s', b"01 JAN 2025")
+            header += struct.pack('16s', b"12:00:00:00")
+            header += struct.pack('24s', b"DSOX3024T:MY00000000")
+            header += struct.pack('16s', label.encode("utf-8"))
+            header += struct.pack('d', time_tags[seg - 1])
+            header += struct.pack('I', seg)
+
+            data_header  = struct.pack('i', 12)
+            data_header += struct.pack('h', buffer_type)
+            data_header += struct.pack('h', bpp)
+            data_header += struct.pack('i', len(data))
+
+            f.write(header + data_header + data)
+
+    f.close()
+    return time_tags
+
+
+def make_run(path, segments=10, points=500, fmt="npy", channels=4, scopes=(1, 2)):
+    """
+    Writes a synthetic run to a directory: one scope file per scope, with a
+    different seed each, converted in the given format ("csv", "npy" or
+    "both") and then removed, or kept unconverted with "bin". Returns the
+    run directory.
+    """
+    from src.data.convert import convert
+
+    os.makedirs(path, exist_ok=True)
+    for scope in scopes:
+        bin_path = os.path.join(path, f"scope-{scope}.bin")
+        write_bin(bin_path, segments=segments, channels=channels, points=points, seed=scope)
+        if fmt == "bin":
+            continue
+        convert(bin_path, path, format=fmt)
+        os.remove(bin_path)
+    return path
+
+
+def make_project(path, segments=10, points=500, fmt="npy"):
+    """
+    Writes a project directory holding out/calibration.json and the
+    synthetic run lcd/Run0 (see make_run), as run.py expects when it is run
+    from the project. Returns the run directory.
+    """
+    os.makedirs(os.path.join(path, "out"), exist_ok=True)
+    with open(os.path.join(path, "out", "calibration.json"), "w") as f:
+        json.dump(CALIBRATION, f)
+    return make_run(os.path.join(path, "lcd", "Run0"), segments=segments, points=points, fmt=fmt)
@@ -0,0 +1,85 @@
+import sys, os
+import tempfile
+import numpy as np
+
+# Add src directory to system path
+project_path = os.getcwd().split('/src')[0]
+sys.path.append(project_path)
+
+from src.tests.synthetic import make_project
+from src.models.table import COLUMNS
+from src.data.manifest import MANIFEST_NAME
+from src.models.batch import find_first_peaks
+from src.models.waveform import find_peaks_stable
+
+SEGMENTS = 20
+
+# Segment without the csv file of one channel, and segment whose time axis is
+# moved far enough that its pulses fall outside the ROI of the other segments
+MISSING_SEGMENT = 5
+SHIFTED_SEGMENT = 7
+SHIFT           = 6e-8
+
+
+def tied_peaks(rows, points=200, seed=0):
+    """
+    Coarsely quantised pulses with a notch at their top, so that most have
+    two maxima of the same height closer than the peak distance.
+    """
+    rng = np.random.default_rng(seed)
+    t   = np.arange(points)
+    roi = np.empty((rows, points))
+    for row in range(rows):
+        centre = rng.integers(60, 120)
+        y = 400 * np.exp(-(t - centre)**2 / (2 * 8**2)) + rng.normal(0, 1, points)
+        y[centre-1:centre+2] -= 40
+        roi[row] = np.round(y / 10) * 10
+    return roi
+
+
+def shift_time_base(run_path, segment, shift):
+    """ Rewrites the csv files of a segment with its time axis moved by `shift` seconds. """
+    for scope in (1, 2):
+        for channel in range(1, 5):
+            path = os.path.join(run_path, f"scope-{scope}-seg{segment}-ch{channel}.csv")
+            data = np.loadtxt(path, delimiter=",")
+            data[:, 0] += shift
+            np.savetxt(path, data, fmt=["%E", "%f"], delimiter=", ")
+
+
+def add_run(run_path, batch):
+    run = Run()
+    run.add_run(run_path, batch=batch)
+    return run.get_table()
+
+
+cwd = os.getcwd()
+with tempfile.TemporaryDirectory() as tmp:
+    run_path = make_project(tmp, segments=SEGMENTS, fmt="csv")
+    os.remove(os.path.join(run_path, f"scope-1-seg{MISSING_SEGMENT}-ch3.csv"))
+    # Built again from the directory, the run manifest records the missing channel
+    os.remove(os.path.join(run_path, MANIFEST_NAME))
+    shift_time_base(run_path, SHIFTED_SEGMENT, SHIFT)
+
+    # run.py reads the calibration of the project it is imported from
+    os.chdir(tmp)
+    from src.models.run import Run
+
+    serial = add_run(run_path, batch=False)
+    batch  = add_run(run_path, batch=True)
+    os.chdir(cwd)
+
+    assert len(serial) == SEGMENTS
+    row = MISSING_SEGMENT - 1
+    assert np.isnan(serial.ingress[row, 1, 0]), "the missing channel has an ingress"
+    assert not np.all(np.isnan(serial.ingress[row, 2:])), "the channels after the missing one were not processed"
+
+    for name in COLUMNS:
+        assert np.array_equal(getattr(serial, name), getattr(batch, name), equal_nan=True), f"{name} differs"
+
+# Equal peaks are resolved the same way on one row and on all rows at once
+roi     = tied_peaks(4000)
+per_row = np.array([peaks[0] if len(peaks) else -1 for peaks in (find_peaks_stable(row, 125) for row in roi)])
+assert np.array_equal(find_first_peaks(roi, 125), per_row), "tied peaks differ"
+
+print("The batch engine gives the same EventTable as event by event processing.")
@@ -0,0 +1,41 @@
+import sys, os
+import tempfile
+import numpy as np
+
+# Add src directory to system path
+project_path = os.getcwd().split('/src')[0]
+sys.path.append(project_path)
+
+from src.tests.synthetic import make_project
+from src.models.table import COLUMNS
+
+SEGMENTS = 20
+
+
+def add_run(run_path, batch):
+    run = Run()
+    run.add_run(run_path, batch=batch)
+    return run.get_table()
+
+
+cwd = os.getcwd()
+with tempfile.TemporaryDirectory() as tmp:
+    # The same capture, converted to the store and left as raw scope files only
+    converted = make_project(os.path.join(tmp, "npy"), segments=SEGMENTS, fmt="npy")
+    raw       = make_project(os.path.join(tmp, "bin"), segments=SEGMENTS, fmt="bin")
+    assert not any(name.endswith((".npy", ".csv", "_info.txt")) for name in os.listdir(raw))
+
+    # run.py reads the calibration of the project it is imported from
+    os.chdir(os.path.join(tmp, "npy"))
+    from src.models.run import Run
+
+    reference = add_run(converted, batch=False)
+    for batch in (False, True):
+        table = add_run(raw, batch=batch)
+        assert len(table) == SEGMENTS
+        for name in COLUMNS:
+            assert np.array_equal(getattr(table, name), getattr(reference, name), equal_nan=True), \
+                f"{name} differs with batch={batch}"
+    os.chdir(cwd)
+
+print("A run of raw scope files gives the same EventTable as its converted store.")
@@ -0,0 +1,97 @@
+import sys, os
+import time
+import signal
+import tempfile
+import subprocess
+import numpy as np
+
+# Add src directory to system path
+project_path = os.getcwd().split('/src')[0]
+sys.path.append(project_path)
+
+from src.tests.synthetic import make_project
+from src.models.table import EventTable, COLUMNS
+
+SEGMENTS         = 120
+CHECKPOINT_EVERY = 10
+
+# Processes one run in a child process, as runview.py would, and saves its table
+ADD_RUN = """
+import sys
+sys.path.insert(0, {project_path!r})
+from src.models.run import Run
+run = Run(checkpoint_dir={checkpoint_dir!r})
+run.add_run({run_path!r}, BASELINE_MODE="mode", checkpoint_every={checkpoint_every}, workers={workers}, chunksize={chunksize})
+run.get_table().save({out_path!r})
+"""
+
+
+def add_run(tmp, run_path, out_path, checkpoint_dir=None, workers=1, kill_after=None):
+    """
+    Runs add_run in a child process. With kill_after, the child is killed
+    with SIGKILL once that many checkpoints were written.
+    """
+    code = ADD_RUN.format(project_path=project_path, checkpoint_dir=checkpoint_dir, run_path=run_path,
+                          checkpoint_every=CHECKPOINT_EVERY, workers=workers, chunksize=CHECKPOINT_EVERY,
+                          out_path=out_path)
+    # In its own session, so that the kill also takes down its pool workers
+    proc = subprocess.Popen([sys.executable, "-c", code], cwd=tmp, stdout=subprocess.PIPE, text=True,
+                            start_new_session=True)
+
+    if kill_after is not None:
+        while proc.poll() is None:
+            chunks = [name for _, _, names in os.walk(checkpoint_dir) for name in names if name.endswith(".npz")]
+            if len(chunks) >= kill_after:
+                os.killpg(proc.pid, signal.SIGKILL)
+                break
+            time.sleep(0.01)
+        proc.wait()
+        return None
+
+    stdout, _ = proc.communicate()
+    assert proc.returncode == 0, f"add_run failed with workers={workers}"
+    return stdout
+
+
+def check_resume(tmp, run_path, reference, workers):
+    checkpoint_dir = os.path.join(tmp, f"checkpoints-{workers}")
+    out_path       = os.path.join(tmp, f"table-{workers}.npz")
+
+    add_run(tmp, run_path, out_path, checkpoint_dir, workers=workers, kill_after=3)
+    assert not os.path.exists(out_path), "the run finished before it could be interrupted"
+
+    stdout  = add_run(tmp, run_path, out_path, checkpoint_dir, workers=workers)
+    resumed = EventTable.load(out_path)
+    print(f"workers={workers}: {stdout.strip()}")
+
+    assert "Resuming" in stdout, "the run did not resume from its checkpoints"
+    for name in COLUMNS:
+        assert np.array_equal(getattr(resumed, name), getattr(reference, name), equal_nan=True), f"{name} differs"
+
+
+def check_stale(tmp, run_path, reference):
+    """ Checkpoints of a run that was converted again since are not used. """
+    checkpoint_dir = os.path.join(tmp, "checkpoints-1")
+    out_path       = os.path.join(tmp, "table-stale.npz")
+
+    index_path = os.path.join(run_path, "scope-1_index.npy")
+    stat       = os.stat(index_path)
+    os.utime(index_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+    stdout = add_run(tmp, run_path, out_path, checkpoint_dir)
+    assert "checkpoints" not in stdout and "Resuming" not in stdout, "stale checkpoints were used"
+    assert len(EventTable.load(out_path)) == len(reference)
+
+
+with tempfile.TemporaryDirectory() as tmp:
+    run_path = make_project(tmp, segments=SEGMENTS)
+
+    add_run(tmp, run_path, os.path.join(tmp, "reference.npz"))
+    reference = EventTable.load(os.path.join(tmp, "reference.npz"))
+    assert len(reference) == SEGMENTS
+
+    check_resume(tmp, run_path, reference, workers=1)
+    check_resume(tmp, run_path, reference, workers=2)
+    check_stale(tmp, run_path, reference)
+
+print("Interrupted runs resume to the same EventTable.")
@@ -0,0 +1,70 @@
+import sys, os
+import tracemalloc
+import numpy as np
+
+# Add src directory to system path
+project_path = os.getcwd().split('/src')[0]
+sys.path.append(project_path)
+
+try:
+    from src.models.waveform import WaveForm
+    from src.tests.synthetic import make_pulse
+except Exception as e:
+    print("Failed to import local modules:")
+    print(e)
+
+# A full run: 1000 segments x 8 channels
+WAVEFORMS = 8000
+POINTS    = 1000
+
+# Per-waveform bytes allowed on top of the float32 samples (object, slots,
+# array header); the time axis must not be stored per waveform at all
+MAX_OVERHEAD = 1024
+
+
+def footprint(build):
+    """ Returns the objects built and the bytes per object they hold on to. """
+    tracemalloc.start()
+    before  = tracemalloc.get_traced_memory()[0]
+    objects = build()
+    after   = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return objects, (after - before) / len(objects)
+
+
+rng     = np.random.default_rng(0)
+samples = [make_pulse(POINTS, rng).astype(float) for _ in range(WAVEFORMS)]
+
+def load():
+    waveforms = []
+    for i, y in enumerate(samples):
+        wf = WaveForm(f"lcd/Run0/scope-1-seg{i // 4 + 1}-ch{i % 4 + 1}.csv")
+        wf.set_data(y, -1e-7, 4e-10)
+        waveforms.append(wf)
+    return waveforms
+
+waveforms, raw = footprint(load)
+print(f"raw waveform      : {raw:10.0f} bytes  ({4 * POINTS} of float32 samples, "
+      f"{32 * POINTS} in the former x/y float64 layout)")
+print(f"full run in RAM   : {raw * WAVEFORMS / 1e6:10.1f} MB for {WAVEFORMS} waveforms")
+
+assert not hasattr(waveforms[0], "__dict__"), "WaveForm should use __slots__"
+assert waveforms[0].get_time_axis() is waveforms[1].get_time_axis(), "time axis should be shared"
+assert raw < 4 * POINTS + MAX_OVERHEAD, f"raw waveform holds {raw:.0f} bytes"
+
+def process():
+    for wf in waveforms:
+        wf.rescale(1e9, -1e3)
+        wf.smooth()
+        wf.calculate_baseline(mode="mode")
+        wf.zero_baseline()
+        wf.get_data(zipped=False)
+    return waveforms
+
+_, processed = footprint(process)
+print(f"processed stages  : {processed:10.0f} bytes  (memoized float64 smoothed and zeroed samples)")
+
+# Two float64 arrays, plus the arrays' headers and the memo keys
+assert processed < 2 * 8 * POINTS + 2 * MAX_OVERHEAD, f"processing holds {processed:.0f} bytes per waveform"
+
+print("WaveForm footprint is bounded.")
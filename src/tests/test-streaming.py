@@ -0,0 +1,97 @@
+import sys, os
+import tempfile
+import subprocess
+
+# Add src directory to system path
+project_path = os.getcwd().split('/src')[0]
+sys.path.append(project_path)
+
+# Peak RSS of the converter may not grow by more than this between a small
+# capture and one several times larger
+MAX_RSS_GROWTH_MB = 16
+
+
+def generate(bin_path, kwargs):
+    """
+    Writes the synthetic file from a separate process, so this process stays
+    small: a forked child starts its peak RSS count from the parent's.
+    """
+    code = f"from src.tests.synthetic import write_bin; write_bin({bin_path!r}, **{kwargs!r})"
+    subprocess.run([sys.executable, "-c", code], cwd=project_path, check=True)
+
+
+def peak_rss_mb(bin_path, out_dir, out_format):
+    """ Runs bintocsv.py in a child process and returns its peak RSS in MB. """
+    script = os.path.join(project_path, "bintocsv.py")
+    proc   = subprocess.Popen([sys.executable, script, bin_path, out_dir, out_format])
+    _, status, rusage = os.wait4(proc.pid, 0)
+    assert status == 0, f"bintocsv.py failed on {bin_path}"
+    return rusage.ru_maxrss / 1024   # kB on Linux
+
+
+def check_truncated(out_format):
+    """ A capture cut short inside its last buffer is rejected, not padded with stale samples. """
+    from src.tests.synthetic import write_bin
+    from src.data.convert import convert
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bin_path = os.path.join(tmp, "scope-1.bin")
+        write_bin(bin_path, segments=3, points=500)
+        os.truncate(bin_path, os.path.getsize(bin_path) - 1200)
+        try:
+            convert(bin_path, tmp, out_format)
+        except ValueError as e:
+            assert "Truncated" in str(e), e
+        else:
+            raise AssertionError(f"{out_format}: the truncated capture was converted")
+
+
+def check_reconvert():
+    """ Converting a run again leaves a store this process has memory-mapped readable. """
+    from src.tests.synthetic import write_bin
+    from src.data.convert import convert
+    from src.data.store import open_store
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bin_path = os.path.join(tmp, "scope-1.bin")
+        write_bin(bin_path, segments=3, points=500)
+        convert(bin_path, tmp, "npy")
+        store = open_store(tmp, "scope-1")
+        y     = store.get_samples("1", 2)[0].copy()
+
+        write_bin(bin_path, segments=5, points=300, seed=1)
+        convert(bin_path, tmp, "npy")
+        assert (store.get_samples("1", 2)[0] == y).all()
+        assert open_store(tmp, "scope-1").get_matrix("1")[0].shape == (5, 300), "stale store after conversion"
+
+
+def check_bounded(out_format, small, large):
+    with tempfile.TemporaryDirectory() as tmp:
+        rss = []
+        for name, kwargs in (("small", small), ("large", large)):
+            bin_path = os.path.join(tmp, f"scope-{len(rss) + 1}.bin")
+            generate(bin_path, kwargs)
+            size = os.path.getsize(bin_path) / 1e6
+            rss.append(peak_rss_mb(bin_path, tmp, out_format))
+            os.remove(bin_path)
+            print(f"{out_format:>4s} {name:>6s}: {size:8.1f} MB file -> peak RSS {rss[-1]:7.1f} MB")
+
+        growth = rss[1] - rss[0]
+        assert growth < MAX_RSS_GROWTH_MB, f"{out_format} peak RSS grew by {growth:.1f} MB"
+
+
+# Few very deep segments: exercises the block-wise decoding of one buffer
+check_bounded("csv",
+              small = dict(segments=1, channels=1, points=500_000),
+              large = dict(segments=1, channels=1, points=2_000_000))
+
+# Many segments: the columnar store must be streamed to disk, not collected
+check_bounded("npy",
+              small = dict(segments=20,  channels=4, points=100_000),
+              large = dict(segments=160, channels=4, points=100_000))
+
+check_truncated("csv")
+check_truncated("npy")
+check_reconvert()
+
+print("Peak RSS stays bounded.")
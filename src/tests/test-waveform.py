@@ -48,22 +48,24 @@ csvfile = os.path.join(lcd_path, f'Run{run}' ,f'scope-{scope}-seg{seg}-ch{ch}.cs
 # Initialise WaveForm object
 wf = WaveForm(csvfile)
 wf.read_from_csv()
+
+# Stages run as rescale + smooth -> baseline -> zero, whatever the order of the calls
 wf.rescale(xfactor=1e9, yfactor=-1e3)
+wf.smooth()
 
 bins = np.arange(-49.5, 299.5,1)
 
 wf.calculate_baseline(bins=bins)
 
-wf.zero_baseline()
-wf.calculate_baseline(bins=bins)
-
-wf.smooth()
+# Subtract the baseline, and measure what is left of it
+residual = wf.zero_baseline(recalculate=True)
+print(f"Baseline: {wf.get_baseline()}, after zeroing: {residual}")
 
 a = 150; b = 280; th = 25
 wf.detect_main_peak((a,b), 140)
 peak_idx, peak_val = wf.get_main_peak()
 
-wf.identify_ingress(th)
+wf.identify_ingress(th, (a,b))
 ingress_idx, ingress_time_val = wf.get_ingress()
 
 x,y = wf.get_data(zipped=False)
@@ -20,26 +20,10 @@ pip3 install -r requirements.txt
 echo "Building local file structure"
 mkdir -p lcd plt out
 
-
-bintocsv () {
-    RUN_PATH=$REPO_PATH/lcd/Run$1
-    mkdir -p $RUN_PATH
-    for ((i=1; i<=$2; i++)); do
-        cp $DATA_PATH/Run$1/meta.json $RUN_PATH
-        python bintocsv.py $DATA_PATH/Run$1/scope-$i.bin $RUN_PATH
-    done
-    }
-
 echo "Starting conversions of waveforms from raw binary to csv int /lcd directory"
 
-for ((j=0; j<17; j++)); do
-    echo "Converting Run$j"
-    bintocsv $j "2"
-done
-
-for ((j=17; j<31; j++)); do
-    bintocsv $j "1"
-    echo "Converting Run$j"
-done
+# Converts every Run<N>/scope-<M>.bin in parallel, skipping files already
+# converted and unchanged since the last call
+python batchconvert.py $DATA_PATH $REPO_PATH/lcd
 
 echo "Done."